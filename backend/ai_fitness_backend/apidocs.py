@@ -0,0 +1,172 @@
+"""
+OpenAPI documentation without per-request schema generation.
+
+Views import ``swagger_auto_schema`` and ``openapi`` from here rather than
+from drf_yasg: with API_DOCS['ENABLED'] off they are inert stand-ins and
+drf_yasg is never imported. The schema itself is served from the artifact
+written by ``manage.py generate_api_schema`` (re-read whenever a deploy
+rewrites its manifest), or built once per process when no artifact exists.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SCHEMA_DIR': '',
+    'CACHE_TIMEOUT': 60,
+}
+
+FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+
+MANIFEST = 'manifest.json'
+
+
+def get_docs_settings():
+    return {**DEFAULTS, **getattr(settings, 'API_DOCS', {})}
+
+
+class _Inert:
+    """Accepts any attribute access or call, so decorator arguments cost nothing."""
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+if get_docs_settings()['ENABLED']:
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+else:
+    openapi = _Inert()
+
+    def swagger_auto_schema(*args, **kwargs):
+        return lambda view: view
+
+
+def api_info():
+    return openapi.Info(
+        title="FitTrack API",
+        default_version='v1',
+        description="AI Fitness Tracker Backend",
+    )
+
+
+def build_schema():
+    """Generate the public schema with drf_yasg and return ``{format: bytes}``."""
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(info=api_info()).get_schema(request=None, public=True)
+    return {
+        'json': OpenAPICodecJson(validators=[]).encode(schema),
+        'yaml': OpenAPICodecYaml(validators=[]).encode(schema),
+    }
+
+
+def schema_version(documents):
+    return hashlib.sha256(documents['json']).hexdigest()[:12]
+
+
+def write_artifact(directory, documents):
+    """
+    Write ``openapi-<version>.<format>`` files plus a manifest pointing at
+    them, and remove artifacts of earlier versions. Returns the manifest.
+    """
+    version = schema_version(documents)
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for fmt, body in documents.items():
+        files[fmt] = f'openapi-{version}.{fmt}'
+        with open(os.path.join(directory, files[fmt]), 'wb') as f:
+            f.write(body)
+    manifest = {'version': version, 'generated_at': timezone.now().isoformat(), 'files': files}
+    # Replace the manifest atomically; running servers pick it up on their next request.
+    tmp = os.path.join(directory, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+    for name in os.listdir(directory):
+        if name.startswith('openapi-') and name not in files.values():
+            os.remove(os.path.join(directory, name))
+    return manifest
+
+
+class SchemaCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._documents = None
+        self._version = None
+
+    def get(self, conf):
+        """Return ``(documents, version)``, or ``(None, None)`` if nothing can be served."""
+        manifest_path = os.path.join(conf['SCHEMA_DIR'], MANIFEST) if conf['SCHEMA_DIR'] else None
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns if manifest_path else None
+        except OSError:
+            mtime = None
+
+        if mtime is not None and mtime != self._manifest_mtime:
+            with self._lock:
+                if mtime != self._manifest_mtime:
+                    self.load(conf['SCHEMA_DIR'], manifest_path, mtime)
+        elif mtime is None and self._documents is None and conf['ENABLED']:
+            with self._lock:
+                if self._documents is None:
+                    self._documents = build_schema()
+                    self._version = schema_version(self._documents)
+        return self._documents, self._version
+
+    def load(self, directory, manifest_path, mtime):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        documents = {}
+        for fmt, name in manifest['files'].items():
+            with open(os.path.join(directory, name), 'rb') as f:
+                documents[fmt] = f.read()
+        self._documents, self._version, self._manifest_mtime = documents, manifest['version'], mtime
+
+
+schema_cache = SchemaCache()
+
+
+def schema_view(request, format):
+    if format not in FORMATS:
+        raise Http404
+    conf = get_docs_settings()
+    documents, version = schema_cache.get(conf)
+    if documents is None or format not in documents:
+        raise Http404("API schema is not available.")
+
+    etag = f'"{version}-{format}"'
+    headers = {'ETag': etag, 'Cache-Control': f"public, max-age={conf['CACHE_TIMEOUT']}"}
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in parse_etags(if_none_match):
+        return HttpResponseNotModified(headers=headers)
+    return HttpResponse(documents[format], content_type=FORMATS[format], headers=headers)
+
+
+def swagger_ui_view():
+    """The Swagger UI page; it loads the schema from schema_view instead of generating its own."""
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    return get_schema_view(
+        api_info(),
+        public=True,
+        permission_classes=[permissions.AllowAny],
+        authentication_classes=[JWTAuthentication],
+    ).with_ui('swagger', cache_timeout=0)
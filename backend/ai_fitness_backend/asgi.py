@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_fitness_backend.settings')
 
 application = get_asgi_application()
+
+from ai_fitness_backend.startup import boot  # noqa: E402  (needs the app registry)
+
+boot()
@@ -0,0 +1,93 @@
+import json
+import math
+from functools import wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled, ValidationError
+from rest_framework.fields import SkipField
+from rest_framework.settings import api_settings
+
+
+def async_api_view(methods):
+    """
+    Decorator for the native async endpoints: enforces allowed methods, parses
+    a JSON body into ``request.data`` and renders DRF exceptions the same way
+    DRF's default exception handler does. Views authenticate with bearer
+    tokens, so CSRF protection is off as on the DRF views.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': ', '.join(methods)})
+            try:
+                request.data = json.loads(request.body) if request.body else {}
+            except ValueError as exc:
+                return JsonResponse({'detail': f'JSON parse error - {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                return exception_response(exc)
+        return wrapper
+    return decorator
+
+
+def exception_response(exc):
+    headers = {}
+    if getattr(exc, 'auth_header', None):
+        headers['WWW-Authenticate'] = exc.auth_header
+    elif exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        # As DRF does: challenge with the first default authentication class.
+        headers['WWW-Authenticate'] = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]().authenticate_header(None)
+    if getattr(exc, 'wait', None):
+        headers['Retry-After'] = '%d' % math.ceil(exc.wait)
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return JsonResponse(detail, status=exc.status_code, headers=headers, safe=False)
+
+
+def validate_fields(serializer_class, data):
+    """
+    Run only the field-level validation of ``serializer_class`` (types, lengths,
+    formats) and return the validated values. Serializer ``validate*`` hooks are
+    skipped because they may query the database synchronously; async views do
+    those checks themselves.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError({'non_field_errors': ['Invalid data. Expected a dictionary.']})
+    validated, errors = {}, {}
+    for name, field in serializer_class().fields.items():
+        if field.read_only:
+            continue
+        try:
+            validated[name] = field.run_validation(field.get_value(data))
+        except ValidationError as exc:
+            errors[name] = exc.detail
+        except SkipField:
+            pass
+    if errors:
+        raise ValidationError(errors)
+    return validated
+
+
+def check_throttles(request, scope, throttle_classes):
+    """Apply DRF throttle classes (keyed on ``scope``) to a plain Django request."""
+    shim = SimpleNamespace(META=request.META, data=request.data)
+    view = SimpleNamespace(throttle_scope=scope)
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(shim, view):
+            waits.append(throttle.wait() or 0)
+    if waits:
+        raise Throttled(max(waits))
+
+
+async def acheck_throttles(request, scope, throttle_classes):
+    # Throttles read and write the cache, and may wait for a bucket lock, synchronously.
+    await sync_to_async(check_throttles)(request, scope, throttle_classes)
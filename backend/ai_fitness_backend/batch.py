@@ -0,0 +1,199 @@
+"""
+POST /api/batch/: several API calls in one round trip.
+
+The batch request is authenticated once. Each sub-request is dispatched
+in-process, through the URL resolver, to the authapp/users DRF view its path
+names, with the batch's user and validated token forced onto it, so no
+sub-request decodes a JWT or looks the user up again. The rest of the
+caller's request metadata (client address for throttles, user agent) carries
+over. Responses come back in request order in one envelope, their rendered
+JSON bodies spliced in rather than parsed and encoded again.
+
+Sub-requests run in order. With ``"parallel": true`` each run of consecutive
+GETs is spread over a shared thread pool; anything else is a barrier, so a
+GET after a PATCH sees the change.
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from rest_framework import permissions, serializers
+from rest_framework.views import APIView
+
+from .apidocs import openapi, swagger_auto_schema
+from .renderers import dumps
+
+DEFAULTS = {
+    'MAX_REQUESTS': 20,
+    'WORKERS': 4,
+    'APPS': ['authapp', 'users'],
+}
+
+# Headers a sub-request may set for itself, and the META keys they go to.
+SUB_REQUEST_HEADERS = {
+    'if-match': 'HTTP_IF_MATCH',
+    'if-none-match': 'HTTP_IF_NONE_MATCH',
+    'accept-language': 'HTTP_ACCEPT_LANGUAGE',
+}
+# Batch request META that describes the batch call itself rather than the caller.
+BATCH_ONLY_META = {
+    'REQUEST_METHOD', 'PATH_INFO', 'QUERY_STRING', 'CONTENT_TYPE', 'CONTENT_LENGTH', 'wsgi.input',
+    *SUB_REQUEST_HEADERS.values(),
+}
+ENVELOPE_SKIPPED_HEADERS = {'content-length', 'vary'}
+
+
+def get_batch_settings():
+    return {**DEFAULTS, **getattr(settings, 'BATCH_REQUESTS', {})}
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.RegexField(r'^/', help_text="API path with an optional query string, e.g. /api/users/profile/")
+    body = serializers.JSONField(required=False, help_text="JSON request body")
+    headers = serializers.DictField(child=serializers.CharField(), required=False,
+                                    help_text="If-Match, If-None-Match or Accept-Language for this call")
+
+    def validate_headers(self, headers):
+        unknown = sorted(name for name in headers if name.lower() not in SUB_REQUEST_HEADERS)
+        if unknown:
+            raise serializers.ValidationError(f"Cannot be set per request: {', '.join(unknown)}.")
+        return {SUB_REQUEST_HEADERS[name.lower()]: value for name, value in headers.items()}
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False, help_text="Run consecutive GETs concurrently")
+
+    def validate_requests(self, requests):
+        limit = get_batch_settings()['MAX_REQUESTS']
+        if len(requests) > limit:
+            raise serializers.ValidationError(f"At most {limit} requests per batch.")
+        return requests
+
+
+def batchable(match):
+    view_class = getattr(match.func, 'view_class', None)
+    return (view_class is not None and issubclass(view_class, APIView)
+            and view_class.__module__.split('.')[0] in get_batch_settings()['APPS'])
+
+
+def dispatch(request, call):
+    """Run one sub-request of ``request`` and return its envelope entry as JSON bytes."""
+    url = urlsplit(call['path'])
+    body = dumps(call['body']) if call['method'] != 'GET' and call.get('body') is not None else b''
+    environ = {key: value for key, value in request.META.items() if key not in BATCH_ONLY_META}
+    environ.update(call.get('headers', {}))
+    environ.update({
+        'REQUEST_METHOD': call['method'], 'PATH_INFO': url.path, 'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+    })
+    sub_request = WSGIRequest(environ)
+    if request.auth is not None:
+        # DRF authenticates a request carrying these with them instead of its authentication classes.
+        sub_request._force_auth_user, sub_request._force_auth_token = request.user, request.auth
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        match = None
+    if match is None or not batchable(match):
+        return entry(404, {}, dumps({'detail': 'Not found.'}))
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    except Exception as exc:
+        response = response_for_exception(sub_request, exc)
+    if response.streaming:
+        response.close()
+        return entry(400, {}, dumps({'detail': 'Streaming responses cannot be batched.'}))
+
+    headers = {name: value for name, value in response.items() if name.lower() not in ENVELOPE_SKIPPED_HEADERS}
+    if not response.content:
+        body = b'null'
+    elif response.get('Content-Type', '').startswith('application/json'):
+        body = response.content
+    else:
+        body = dumps(response.content.decode(response.charset, errors='replace'))
+    return entry(response.status_code, headers, body)
+
+
+def entry(status_code, headers, body):
+    return b'{"status":%d,"headers":%s,"body":%s}' % (status_code, dumps(headers), body)
+
+
+def dispatch_in_thread(request, call):
+    # Worker threads keep their connections between batches, so they are
+    # recycled the way Django does at the start and end of each request.
+    close_old_connections()
+    try:
+        return dispatch(request, call)
+    finally:
+        close_old_connections()
+
+
+def dispatch_parallel(request, calls):
+    # Each call runs in a copy of this request's context, so database routing
+    # (e.g. primary pinning after a write earlier in the batch) carries over.
+    futures = [get_batch_executor().submit(copy_context().run, dispatch_in_thread, request, call) for call in calls]
+    return [future.result() for future in futures]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=get_batch_settings()['WORKERS'],
+                                               thread_name_prefix='batch')
+    return _executor
+
+
+class BatchView(APIView):
+    # Sub-requests apply their own permissions, so an anonymous batch can register or log in.
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(
+        operation_summary="Make several API calls in one request",
+        operation_description=(
+            "Runs each call against the authapp and users endpoints, in order, with the credentials "
+            "of this request, and returns every response in one envelope. With `parallel`, "
+            "consecutive GETs run concurrently."
+        ),
+        request_body=BatchSerializer,
+        responses={200: openapi.Response("Responses in request order", examples={"application/json": {
+            "responses": [{"status": 200, "headers": {"ETag": "\"3\""}, "body": {"username": "sam", "age": 31}}]
+        }})},
+        tags=["Batch"]
+    )
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        calls = serializer.validated_data['requests']
+        parallel = serializer.validated_data['parallel'] and get_batch_settings()['WORKERS'] > 1
+
+        responses = []
+        start = 0
+        while start < len(calls):
+            end = start + 1
+            if parallel and calls[start]['method'] == 'GET':
+                while end < len(calls) and calls[end]['method'] == 'GET':
+                    end += 1
+            if end - start > 1:
+                responses += dispatch_parallel(request, calls[start:end])
+            else:
+                responses.append(dispatch(request, calls[start]))
+            start = end
+        return HttpResponse(b'{"responses":[%s]}' % b','.join(responses), content_type='application/json')
@@ -0,0 +1,82 @@
+"""
+Primary/replica routing. Writes always go to the primary ('default'); reads
+go to the 'replica' alias when one is configured, until the first write of
+the current request, after which the rest of the request reads from the
+primary as well so it sees its own writes.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Per-request routing state; None outside a request.
+_request_state = ContextVar('db_request_state', default=None)
+
+
+class RequestState:
+    def __init__(self):
+        self.pinned = False
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def pin_to_primary():
+    """Send the remaining reads of the current request to the primary."""
+    state = _request_state.get()
+    if state is not None:
+        state.pinned = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        # Outside a request (management commands, worker threads) stale reads are
+        # never wanted, and a read inside a transaction must see that transaction.
+        if state is None or state.pinned or not replica_configured():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryStickinessMiddleware:
+    """Scopes read-your-writes pinning to a single request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request_state.set(RequestState())
+        try:
+            return self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+    async def __acall__(self, request):
+        token = _request_state.set(RequestState())
+        try:
+            return await self.get_response(request)
+        finally:
+            _request_state.reset(token)
@@ -0,0 +1,360 @@
+"""
+Per-process request metrics exported in the Prometheus text format.
+
+Every thread records into its own shard, so the hot path takes no locks;
+the /metrics view sums the shards when it is scraped. With
+METRICS['MULTIPROCESS_DIR'] set, each process also writes its totals
+there every FLUSH_INTERVAL seconds and /metrics adds up all processes, so
+any gunicorn worker can answer a scrape.
+"""
+import atexit
+import cProfile
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TOKEN': '',
+    'MULTIPROCESS_DIR': '',
+    'FLUSH_INTERVAL': 5,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_SLOW_MS': 500,
+    'PROFILE_DIR': '',
+}
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', "Request latency by route, method and status."),
+    'http_request_db_queries_total': ('counter', "Database queries run while serving requests, by route."),
+    'http_request_db_seconds_total': ('counter', "Time spent in database queries while serving requests, by route."),
+    'password_hashing_duration_seconds': ('histogram', "Password hash and check latency, including pool wait."),
+    'mail_send_duration_seconds': ('histogram', "Time to hand one message to the mail backend."),
+    'slow_request_profiles_total': ('counter', "cProfile captures written for slow sampled requests."),
+}
+
+
+def get_metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Shard:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = Shard()
+        # Only taken once per thread, never on the recording path.
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def inc(name, value=1, **labels):
+    counters = _shard().counters
+    key = (name, tuple(sorted(labels.items())))
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    histograms = _shard().histograms
+    key = (name, tuple(sorted(labels.items())))
+    entry = histograms.get(key)
+    if entry is None:
+        entry = histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+    entry[0][bisect_left(BUCKETS, value)] += 1
+    entry[1] += value
+    entry[2] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+# Per-request DB totals; set by the middleware and read by the query wrapper.
+_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    # Connections are per thread; the context variable follows the request into
+    # sync_to_async worker threads, so async views are counted too.
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_wrapper)
+
+
+def snapshot():
+    """Totals across every thread of this process."""
+    counters, histograms = {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, total, count) in list(shard.histograms.items()):
+            merge_histogram(histograms, key, buckets, total, count)
+    return counters, histograms
+
+
+def merge_histogram(histograms, key, buckets, total, count):
+    entry = histograms.get(key)
+    if entry is None:
+        histograms[key] = [list(buckets), total, count]
+        return
+    entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+    entry[1] += total
+    entry[2] += count
+
+
+class ProcessFlusher:
+    """Writes this process's snapshot to MULTIPROCESS_DIR at most every FLUSH_INTERVAL seconds."""
+
+    def __init__(self):
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._filename = None
+
+    def filename(self):
+        # A pid alone can be reused by a later worker, which would overwrite the
+        # totals an exited worker left behind; the suffix is redrawn after a fork.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._filename = f'{self._pid}-{secrets.token_hex(4)}.json'
+        return self._filename
+
+    def maybe_flush(self, conf):
+        if not conf['MULTIPROCESS_DIR'] or time.monotonic() < self._next:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next = time.monotonic() + conf['FLUSH_INTERVAL']
+            self.flush(conf['MULTIPROCESS_DIR'])
+        finally:
+            self._lock.release()
+
+    def flush(self, directory):
+        counters, histograms = snapshot()
+        data = {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, *entry] for (name, labels), entry in histograms.items()],
+        }
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename())
+        # Write-then-rename so a scrape never reads a half-written file.
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+
+flusher = ProcessFlusher()
+
+
+@atexit.register
+def _flush_at_exit():
+    directory = get_metrics_settings()['MULTIPROCESS_DIR']
+    if directory:
+        flusher.flush(directory)
+
+
+def collect(conf):
+    """Totals for this process, or for every process when MULTIPROCESS_DIR is set."""
+    directory = conf['MULTIPROCESS_DIR']
+    if not directory:
+        return snapshot()
+    flusher.flush(directory)
+    counters, histograms = {}, {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # Files of exited workers are kept: their totals still count toward the cumulative series.
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in data['histograms']:
+            merge_histogram(histograms, (name, tuple(map(tuple, labels))), buckets, total, count)
+    return counters, histograms
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return '{%s}' % ','.join(escaped)
+
+
+def render(counters, histograms):
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            continue
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    conf = get_metrics_settings()
+    token = conf['TOKEN']
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        # No token configured: not public, but staff can still look from an admin session.
+        allowed = getattr(request, 'user', None) is not None and request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(*collect(conf)), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+_profile_lock = threading.Lock()
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    # The URL pattern, not the path, keeps label cardinality bounded.
+    return match.route if match is not None else '<unmatched>'
+
+
+class InstrumentationMiddleware:
+    """
+    Records latency and DB time per route. With PROFILE_SAMPLE_RATE > 0, that
+    fraction of sync requests runs under cProfile and is saved to PROFILE_DIR
+    when slower than PROFILE_SLOW_MS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.conf = get_metrics_settings()
+        self.enabled = self.conf['ENABLED']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        profiler = None
+        # Only one profiler can be active per process, so concurrent samples are skipped.
+        if (self.conf['PROFILE_SAMPLE_RATE'] and random.random() < self.conf['PROFILE_SAMPLE_RATE']
+                and _profile_lock.acquire(blocking=False)):
+            profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                response = self.get_response(request)
+            else:
+                try:
+                    response = profiler.runcall(self.get_response, request)
+                finally:
+                    _profile_lock.release()
+        finally:
+            _request_stats.reset(token)
+        elapsed = time.perf_counter() - start
+        self.record(request, response, stats, elapsed)
+        if profiler is not None and elapsed * 1000 >= self.conf['PROFILE_SLOW_MS']:
+            self.save_profile(request, profiler)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        route = route_of(request)
+        observe('http_request_duration_seconds', elapsed,
+                route=route, method=request.method, status=response.status_code)
+        if stats.queries:
+            inc('http_request_db_queries_total', stats.queries, route=route)
+            inc('http_request_db_seconds_total', stats.db_seconds, route=route)
+        flusher.maybe_flush(self.conf)
+
+    def save_profile(self, request, profiler):
+        directory = self.conf['PROFILE_DIR'] or os.path.join(settings.BASE_DIR, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        name = route_of(request).strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        profiler.dump_stats(os.path.join(directory, f'{name}-{request.method}-{time.time_ns()}.prof'))
+        inc('slow_request_profiles_total', route=route_of(request))
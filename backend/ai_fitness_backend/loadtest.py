@@ -0,0 +1,100 @@
+"""
+Helpers for the endpoint benchmark tests: drive a live test server with
+concurrent clients, summarize latencies, and write the numbers to
+settings.LOAD_TEST['RESULTS_FILE'], if set, so runs can be diffed across
+commits, e.g.
+
+    LOAD_TEST_RESULTS_FILE=bench_results.json python manage.py test --tag load
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def http_request(base_url, method, path, data=None, headers=None):
+    """Send one JSON request and return the status code."""
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(base_url + path, data=body, method=method)
+    request.add_header('Content-Type', 'application/json')
+    for name, value in (headers or {}).items():
+        request.add_header(name, value)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        exc.read()
+        return exc.code
+
+
+def run_load(send, requests, concurrency):
+    """
+    Call ``send(i)`` for i in range(requests) from ``concurrency`` threads.
+    ``send`` returns an HTTP status; returns latency percentiles (ms),
+    throughput and the status codes seen.
+    """
+    def timed(i):
+        start = time.perf_counter()
+        status = send(i)
+        return (time.perf_counter() - start) * 1000, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(ms for ms, _ in results)
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': round(cuts[49], 2),
+        'p95_ms': round(cuts[94], 2),
+        'p99_ms': round(cuts[98], 2),
+        'max_ms': round(latencies[-1], 2),
+        'statuses': statuses,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(section, results):
+    """Merge ``{endpoint: stats}`` under ``section`` into the results file, if one is configured."""
+    path = settings.LOAD_TEST['RESULTS_FILE']
+    if not path:
+        return
+    try:
+        with open(path) as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+    if report.get('revision') != git_revision():
+        report = {}
+    report.update({
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'updated_at': timezone.now().isoformat(),
+    })
+    report.setdefault('endpoints', {}).setdefault(section, {}).update(results)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Cheap row-count estimate for ``model``'s table from the database's own
+    statistics, or None if the backend offers nothing suitable.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]
+    elif connection.vendor == 'mysql':
+        sql, params = (
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s", [table]
+        )
+    elif connection.vendor == 'sqlite':
+        # Upper bound (deleted rows still count) read straight off the rowid b-tree.
+        sql, params = f"SELECT MAX(_ROWID_) FROM {connection.ops.quote_name(table)}", []
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over very large tables. An unfiltered
+    queryset whose estimated size is above ADMIN_ESTIMATED_COUNT_THRESHOLD
+    reports the estimate instead of running COUNT(*); everything else gets
+    an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
@@ -0,0 +1,73 @@
+"""
+JSON rendering on orjson when it is installed, falling back to DRF's
+stdlib-based JSONRenderer when it is not (or for anything orjson rejects).
+
+Output is byte-for-byte what JSONRenderer produces (see
+users.tests.FastJSONRendererTests). orjson formats some very small or large
+floats differently and writes NaN/Infinity as ``null``, so payloads that hold
+such values go to JSONRenderer, which renders the former and raises for the
+latter.
+"""
+import math
+import re
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # datetime/date/time go through the DRF encoder so "+00:00" still becomes "Z".
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+# A number orjson may format unlike Python: in exponent form, or 0.0000x (which
+# Python writes in exponent form). Text inside strings can match too; that only
+# costs a fallback.
+EXPONENT_NUMBER = re.compile(rb'(?:^|[\[,:])-?(?:0\.0000|\d+(?:\.\d+)?e)')
+
+
+def may_hold_non_finite(data):
+    """False if ``data`` surely holds no NaN or Infinity (which orjson renders as null)."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if data is None or isinstance(data, (str, int)):
+        return False
+    if isinstance(data, dict):
+        return any(map(may_hold_non_finite, data.values()))
+    if isinstance(data, (list, tuple)):
+        return any(map(may_hold_non_finite, data))
+    # Anything else goes through the encoder, which may turn it into floats.
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indented output (the browsable API, ?indent=) and non-default JSON
+        # settings are rare; leave them to the stdlib path.
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Non-str keys, integers beyond 64 bits, or an error raised by the
+            # encoder: let JSONRenderer produce the same output or exception.
+            return super().render(data, accepted_media_type, renderer_context)
+        if EXPONENT_NUMBER.search(ret) or (b'null' in ret and may_hold_non_finite(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping JSONRenderer applies, so the output stays a JavaScript subset.
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+def dumps(data):
+    """Encode ``data`` as FastJSONRenderer does, for plain Django responses."""
+    return FastJSONRenderer().render(data)
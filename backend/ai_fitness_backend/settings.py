@@ -1,5 +1,6 @@
+import tempfile
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,12 +30,14 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
-    'drf_yasg',
     'authapp',
     'users',
+    'workouts',
 ]
 
 MIDDLEWARE = [
+    'ai_fitness_backend.instrumentation.InstrumentationMiddleware',
+    'ai_fitness_backend.db_router.PrimaryStickinessMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -47,22 +50,82 @@ MIDDLEWARE = [
 
 AUTH_USER_MODEL = 'authapp.User'
 
+# ModelBackend with password checks on the hashing pool (PASSWORD_HASHING below).
+AUTHENTICATION_BACKENDS = ['authapp.backends.PooledModelBackend']
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'authapp.authentication.CachedJWTAuthentication',
+    ),
+    # FastJSONRenderer encodes with orjson when installed; set JSON_RENDERER to
+    # rest_framework.renderers.JSONRenderer to use the stdlib encoder.
+    'DEFAULT_RENDERER_CLASSES': (
+        config('JSON_RENDERER', default='ai_fitness_backend.renderers.FastJSONRenderer'),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Per-process cache of authenticated users, dropped on save/delete.
+USER_CACHE = {
+    'MAX_SIZE': config('USER_CACHE_MAX_SIZE', default=10000, cast=int),
+    'TTL': config('USER_CACHE_TTL', default=60, cast=int),     # seconds
+}
+
+# Token-bucket limits for the auth endpoints, per client IP and per submitted
+# email. "10/min" allows a burst of 10 and refills one token every 6 seconds.
+AUTH_THROTTLE_RATES = {
+    'login': {
+        'ip': config('THROTTLE_LOGIN_IP', default='30/min'),
+        'email': config('THROTTLE_LOGIN_EMAIL', default='10/min'),
+    },
+    'send_otp': {
+        'ip': config('THROTTLE_SEND_OTP_IP', default='10/min'),
+        'email': config('THROTTLE_SEND_OTP_EMAIL', default='3/min'),
+    },
+    'reset_password': {
+        'ip': config('THROTTLE_RESET_PASSWORD_IP', default='10/min'),
+        'email': config('THROTTLE_RESET_PASSWORD_EMAIL', default='3/min'),
+    },
+    'refresh': {
+        'ip': config('THROTTLE_REFRESH_IP', default='60/min'),
+    },
 }
 
 #JWT Authentication settings
 #remove this for production or make changes to timeouts
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=7),       # Logged in for 7 days
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=30),     # Refresh token valid for 30 days
-    'ROTATE_REFRESH_TOKENS': False,
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=config('JWT_ACCESS_TOKEN_MINUTES', default=7 * 24 * 60, cast=int)),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=config('JWT_REFRESH_TOKEN_DAYS', default=30, cast=int)),
+    # /api/users/token/refresh/ always rotates; the used token is revoked through
+    # authapp.revocation rather than simplejwt's token_blacklist app.
+    'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': False,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# How long after an OTP check refreshed tokens keep the otp_verified claim.
+OTP_VERIFIED_LIFETIME = timedelta(minutes=config('OTP_VERIFIED_MINUTES', default=60, cast=int))
+
+# Revoked refresh tokens: a jti table (pruned by `prune_revoked_tokens`) behind a
+# per-process Bloom filter that answers "never revoked" without a query.
+TOKEN_BLACKLIST = {
+    'BLOOM_CAPACITY': config('TOKEN_BLACKLIST_BLOOM_CAPACITY', default=100000, cast=int),
+    'BLOOM_ERROR_RATE': 0.001,
+    'REFRESH_INTERVAL': 5,      # seconds between loads of tokens revoked by other processes
+    'REBUILD_INTERVAL': 3600,   # seconds between full rebuilds (drops pruned tokens)
+}
+
+# Registered emails in a per-process Bloom filter: send-otp and reset-password
+# reject unknown addresses without a query. `manage.py email_index_report`
+# shows memory and false-positive rate for a given user count.
+EMAIL_INDEX = {
+    'ENABLED': config('EMAIL_INDEX_ENABLED', default=True, cast=bool),
+    'BLOOM_CAPACITY': config('EMAIL_INDEX_BLOOM_CAPACITY', default=100000, cast=int),
+    'BLOOM_ERROR_RATE': 0.001,
+    'REFRESH_INTERVAL': 5,      # seconds between loads of users registered by other processes
+    'REBUILD_INTERVAL': 3600,   # seconds between full rebuilds (drops deleted and changed emails)
+}
+
 
 
 ROOT_URLCONF = 'ai_fitness_backend.urls'
@@ -88,13 +151,146 @@ WSGI_APPLICATION = 'ai_fitness_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+def sqlite_database(name):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        # Keep connections open between requests; health checks drop ones that went bad.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a connection waits on a locked database before raising "database is locked".
+            'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+            # WAL lets readers run alongside the single writer; NORMAL sync is durable in WAL mode
+            # except for the last transactions before a power loss.
+            'init_command': config(
+                'SQLITE_INIT_COMMAND', default='PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+            ),
+            # Transactions stay DEFERRED; read-then-write blocks take the write lock up
+            # front with ai_fitness_backend.transactions.immediate_atomic().
+        },
+    }
+
+
 DATABASES = {
+    'default': sqlite_database(config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3'))),
+}
+# A file-backed test database gives each live-server thread its own connection;
+# the in-memory default shares one connection, which breaks concurrent load tests.
+# It lives in the temp directory rather than next to the code.
+DATABASES['default']['TEST'] = {'NAME': config(
+    'DATABASE_TEST_NAME', default=str(Path(tempfile.gettempdir()) / 'ai_fitness_backend_test.sqlite3'),
+)}
+
+# Skips the load tests unless run with --tag load (see LOAD_TEST).
+TEST_RUNNER = 'ai_fitness_backend.test_runner.TestRunner'
+
+# Optional read replica; reads are routed there by ai_fitness_backend.db_router.
+# Locally this can be a second SQLite file refreshed with `manage.py sync_sqlite_replica`.
+DATABASE_REPLICA_NAME = config('DATABASE_REPLICA_NAME', default='')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = sqlite_database(DATABASE_REPLICA_NAME)
+    # Tests read the replica through the primary's test database.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['ai_fitness_backend.db_router.PrimaryReplicaRouter']
+
+
+# With more than one worker process CACHE_BACKEND must be shared between them
+# (Redis, Memcached, database): cached profiles and their ETags are invalidated
+# here on update, and the per-process LocMemCache default would keep serving
+# the old profile from every other worker until PROFILE_CACHE_TIMEOUT.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
     }
 }
 
+# Seconds a serialized profile stays in CACHES; updates invalidate it immediately
+# (in every worker only if CACHES is shared, see above).
+PROFILE_CACHE_TIMEOUT = config('PROFILE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Upper bound on ?points= for the measurement history endpoint.
+MEASUREMENT_HISTORY_MAX_POINTS = 1000
+
+# "People like you" index (users.similarity): KD-trees over profile vectors in
+# memory-mapped files under PATH, shared by every worker on the host. Changed
+# profiles are picked up every REFRESH_INTERVAL seconds; one worker rebuilds
+# once the build is REBUILD_INTERVAL seconds old or MAX_PENDING profiles changed.
+SIMILARITY_INDEX = {
+    'PATH': config('SIMILARITY_INDEX_PATH', default=str(BASE_DIR / 'similarity_index')),
+    'REFRESH_INTERVAL': config('SIMILARITY_INDEX_REFRESH_INTERVAL', default=5, cast=int),
+    'REBUILD_INTERVAL': config('SIMILARITY_INDEX_REBUILD_INTERVAL', default=3600, cast=int),
+    'MAX_PENDING': 50000,
+}
+# Upper bound on ?k= for the similar users endpoint.
+SIMILAR_USERS_MAX_RESULTS = 50
+
+# Seconds cached cohort metric sums live before a full rebuild; profile
+# updates are folded into them incrementally in the meantime.
+COHORT_METRICS_TIMEOUT = config('COHORT_METRICS_TIMEOUT', default=3600, cast=int)
+
+# Admin changelists over unfiltered tables larger than this show an estimated
+# row count instead of running COUNT(*).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Upper bound on ids/emails or change items accepted by the bulk profile endpoints.
+BULK_PROFILE_MAX_ITEMS = 1000
+
+# POST /api/batch/ (ai_fitness_backend.batch): sub-requests allowed per batch, the
+# threads that run consecutive GETs of a "parallel" batch, and the apps whose
+# DRF views a batch may call.
+BATCH_REQUESTS = {
+    'MAX_REQUESTS': config('BATCH_MAX_REQUESTS', default=20, cast=int),
+    'WORKERS': config('BATCH_WORKERS', default=4, cast=int),
+    'APPS': ['authapp', 'users'],
+}
+
+# Rows fetched per cursor round trip (and encoded per streamed piece) by user exports.
+USER_EXPORT_CHUNK_SIZE = config('USER_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# NDJSON sample ingestion: rows per bulk_create, and per-request limits.
+WORKOUT_INGEST = {
+    'CHUNK_SIZE': config('WORKOUT_INGEST_CHUNK_SIZE', default=1000, cast=int),
+    'MAX_LINES': config('WORKOUT_INGEST_MAX_LINES', default=100000, cast=int),
+    'MAX_LINE_BYTES': 1024,
+    'MAX_ERRORS': 50,       # per-line errors echoed back in the response
+}
+
+# Request metrics served at /metrics in the Prometheus text format. Scrapers
+# send "Authorization: Bearer <TOKEN>"; with no TOKEN set only staff signed in
+# to the admin can read them. With several worker
+# processes, point MULTIPROCESS_DIR at a directory they share (cleared on deploy)
+# so any worker reports the totals of all of them. PROFILE_SAMPLE_RATE > 0
+# runs that fraction of requests under cProfile and keeps the profiles of ones
+# slower than PROFILE_SLOW_MS in PROFILE_DIR.
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', default=True, cast=bool),
+    'TOKEN': config('METRICS_TOKEN', default=''),
+    'MULTIPROCESS_DIR': config('METRICS_MULTIPROCESS_DIR', default=''),
+    'FLUSH_INTERVAL': 5,    # seconds
+    'PROFILE_SAMPLE_RATE': config('METRICS_PROFILE_SAMPLE_RATE', default=0.0, cast=float),
+    'PROFILE_SLOW_MS': config('METRICS_PROFILE_SLOW_MS', default=500, cast=int),
+    'PROFILE_DIR': config('METRICS_PROFILE_DIR', default=str(BASE_DIR / 'profiles')),
+}
+
+# Endpoint benchmark tests (authapp/tests.py, users/tests.py), tagged 'load' and
+# only run by `manage.py test --tag load`: requests per endpoint, concurrent
+# clients, and the JSON file the results are written to (none if empty).
+LOAD_TEST = {
+    'REQUESTS': config('LOAD_TEST_REQUESTS', default=200, cast=int),
+    'CONCURRENCY': config('LOAD_TEST_CONCURRENCY', default=8, cast=int),
+    'RESULTS_FILE': config('LOAD_TEST_RESULTS_FILE', default=''),
+}
+
+# OTP storage: DatabaseOTPStore (indexed table, swept by `purge_expired_otps`)
+# or CacheOTPStore (codes live in CACHES with a native TTL).
+OTP_STORE = {
+    'BACKEND': config('OTP_STORE_BACKEND', default='authapp.otp_store.DatabaseOTPStore'),
+    'TTL': 15 * 60,     # seconds
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -114,6 +310,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashes run on a bounded process pool; requests beyond
+# WORKERS + MAX_PENDING in flight get an immediate 503. Use
+# `manage.py calibrate_hashers` to measure hasher cost on this host.
+PASSWORD_HASHING = {
+    'POOL': config('PASSWORD_HASHING_POOL', default=True, cast=bool),
+    'WORKERS': config('PASSWORD_HASHING_WORKERS', default=2, cast=int),
+    'MAX_PENDING': config('PASSWORD_HASHING_MAX_PENDING', default=8, cast=int),
+    'TIMEOUT': 10,      # seconds
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -147,7 +353,7 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 # ✅ Optional (depending on version)
-CORS_EXPOSE_HEADERS = ["Content-Type", "X-CSRFToken"]
+CORS_EXPOSE_HEADERS = ["Content-Type", "X-CSRFToken", "ETag"]
 
 
 EMAIL_BACKEND = config('EMAIL_BACKEND')
@@ -158,6 +364,39 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
 
+# OTP emails are queued and sent by background workers over reused connections.
+# Set OTP_MAIL_ASYNC=False to send inline (tests, local development).
+OTP_MAIL_OUTBOX = {
+    'ASYNC': config('OTP_MAIL_ASYNC', default=True, cast=bool),
+    'WORKERS': config('OTP_MAIL_WORKERS', default=2, cast=int),
+    'BATCH_SIZE': config('OTP_MAIL_BATCH_SIZE', default=20, cast=int),
+    'MAX_RETRIES': config('OTP_MAIL_MAX_RETRIES', default=3, cast=int),
+    'RETRY_BACKOFF': 2.0,       # seconds, doubled on every retry
+    'IDLE_TIMEOUT': 30,         # seconds before an idle SMTP connection is closed
+}
+
+
+# Worker warm-up (ai_fitness_backend.startup): 'background' warms caches in a
+# thread while the worker serves traffic and /ready returns 503 until done,
+# 'sync' finishes before the worker accepts requests, 'off' skips it.
+# WARM_UP_EXTRAS opts into the steps that import NumPy: 'metrics', 'similarity_index'.
+STARTUP = {
+    'WARM_UP': config('STARTUP_WARM_UP', default='background'),
+    'WARM_UP_EXTRAS': config('STARTUP_WARM_UP_EXTRAS', default='', cast=Csv()),
+}
+
+# API docs. The schema is served from the artifact `manage.py generate_api_schema`
+# writes to SCHEMA_DIR (run it on deploy), or built once per process if there is
+# none. With ENABLED off, drf_yasg is not loaded and /swagger/ is not routed.
+API_DOCS = {
+    'ENABLED': config('API_DOCS_ENABLED', default=True, cast=bool),
+    'SCHEMA_DIR': config('API_SCHEMA_DIR', default=str(BASE_DIR / 'apischema')),
+    # Seconds clients may reuse the schema without revalidating; after that a
+    # deploy's new schema shows up through a changed ETag.
+    'CACHE_TIMEOUT': config('API_SCHEMA_CACHE_TIMEOUT', default=60, cast=int),
+}
+if API_DOCS['ENABLED']:
+    INSTALLED_APPS.append('drf_yasg')
 
 # Swagger settings 
 SWAGGER_SETTINGS = {
@@ -170,4 +409,5 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False,  # Disable default login/password form
+    'SPEC_URL': ('api-schema', {'format': 'json'}),
 }
@@ -0,0 +1,225 @@
+"""
+Worker start-up: deferred imports, the warm-up hook run when a worker boots,
+and the readiness endpoint that reports whether it has finished.
+
+wsgi.py and asgi.py call ``boot()`` once the application is built. Depending on
+STARTUP['WARM_UP'] the warm-up runs inline ('sync'), in a background thread
+while the worker already serves traffic ('background'), or not at all ('off').
+The steps that load NumPy or map the similarity index are opt-in, through
+STARTUP['WARM_UP_EXTRAS'].
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.urls import get_resolver
+
+DEFAULTS = {
+    'WARM_UP': 'background',
+    'WARM_UP_EXTRAS': [],
+}
+
+
+def get_startup_settings():
+    return {**DEFAULTS, **getattr(settings, 'STARTUP', {})}
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    The import goes through importlib.import_module, whose per-module lock
+    makes a first use from several threads at once (a request racing the
+    warm-up thread) safe; importlib.util.LazyLoader is not before 3.12.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+def lazy_import(name):
+    """
+    Return module ``name`` without executing it until an attribute is first
+    used, so heavy dependencies stay off the import path of code that never
+    touches them.
+    """
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def warm_urls():
+    # Importing the URLconf pulls in every view, serializer and DRF/simplejwt module;
+    # reverse_dict fills the resolver's lookup tables.
+    resolver = get_resolver()
+    resolver.reverse_dict
+    resolver.resolve('/api/users/login/')
+
+
+def iter_views(patterns):
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            yield from iter_views(pattern.url_patterns)
+        else:
+            yield getattr(pattern.callback, 'cls', None)
+
+
+def warm_serializers():
+    # Building .fields runs ModelSerializer's model introspection once per class.
+    seen = set()
+    for view in iter_views(get_resolver().url_patterns):
+        serializer_class = getattr(view, 'serializer_class', None)
+        if serializer_class is not None and serializer_class not in seen:
+            seen.add(serializer_class)
+            serializer_class().fields
+
+
+def warm_database():
+    for alias in connections:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+
+def warm_cache():
+    from django.core.cache import cache
+    cache.get('startup:warm-up')
+
+
+def warm_jwt():
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from authapp.authentication import CachedJWTAuthentication
+    # Encoding and decoding once loads the signing key and PyJWT's algorithm tables.
+    CachedJWTAuthentication().get_validated_token(str(AccessToken()).encode())
+
+
+def warm_hashers():
+    from django.contrib.auth import hashers
+
+    from authapp.hashing import get_hashing_executor
+    hashers.get_hashers()
+    executor = get_hashing_executor()
+    if executor.use_pool:
+        # The pool starts its processes on demand; have every worker start (and set up Django) now.
+        futures = [executor.pool.submit(os.getpid) for _ in range(executor.workers)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def warm_email_index():
+    from authapp.email_index import get_email_index
+    # The first check loads every registered email into the Bloom filter.
+    get_email_index().might_exist('warm-up@example.invalid')
+
+
+def warm_metrics():
+    from users import metrics
+    metrics.profile_metrics({'age': 30, 'gender': 'M', 'height_cm': 180, 'weight_kg': 80, 'goal': 'stay_fit'})
+
+
+def warm_similarity_index():
+    from users.similarity import get_similarity_index
+    # Maps the current build and reads recent changes. Without one there is
+    # nothing to warm; building is left to the first lookup or the command.
+    index = get_similarity_index()
+    if index.current_name() is not None:
+        index._sync()
+
+
+WARM_UP_STEPS = [
+    ('urls', warm_urls),
+    ('serializers', warm_serializers),
+    ('database', warm_database),
+    ('cache', warm_cache),
+    ('jwt', warm_jwt),
+    ('hashers', warm_hashers),
+    ('email_index', warm_email_index),
+]
+# Off unless named in STARTUP['WARM_UP_EXTRAS']: each costs every worker NumPy's import.
+EXTRA_WARM_UP_STEPS = [
+    ('metrics', warm_metrics),
+    ('similarity_index', warm_similarity_index),
+]
+
+
+def warm_up_steps():
+    extras = get_startup_settings()['WARM_UP_EXTRAS']
+    return WARM_UP_STEPS + [(name, step) for name, step in EXTRA_WARM_UP_STEPS if name in extras]
+
+
+class WarmUpState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pid = None
+        self.reset()
+
+    def reset(self):
+        self.done = threading.Event()
+        self.steps = {}
+        self.errors = {}
+        self.total_ms = None
+
+    def start(self, background):
+        """Run the warm-up once per process (a forked worker runs its own)."""
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.reset()
+            self.pid = os.getpid()
+        if background:
+            threading.Thread(target=self.run, kwargs={'close_connections': True},
+                             name='warm-up', daemon=True).start()
+        else:
+            self.run()
+
+    def run(self, close_connections=False):
+        start = time.perf_counter()
+        try:
+            for name, step in warm_up_steps():
+                step_start = time.perf_counter()
+                try:
+                    step()
+                except Exception as exc:
+                    self.errors[name] = f'{type(exc).__name__}: {exc}'
+                self.steps[name] = round((time.perf_counter() - step_start) * 1000, 1)
+        finally:
+            if close_connections:
+                # Connections are per thread; this thread's would never be reused.
+                connections.close_all()
+            self.total_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.done.set()
+
+
+state = WarmUpState()
+
+
+def boot():
+    mode = get_startup_settings()['WARM_UP']
+    if mode != 'off':
+        state.start(background=mode == 'background')
+
+
+def readiness_view(request):
+    """200 once this worker has warmed up, 503 (with Retry-After) until then or if a step failed."""
+    mode = get_startup_settings()['WARM_UP']
+    if mode != 'off' and state.pid != os.getpid():
+        # Forked after the parent warmed up (e.g. preloaded app): warm this process too.
+        state.start(background=True)
+    if mode != 'off' and not state.done.is_set():
+        return JsonResponse({'status': 'warming_up', 'steps_ms': dict(state.steps)},
+                            status=503, headers={'Retry-After': '1'})
+    if state.errors:
+        return JsonResponse({'status': 'failed', 'errors': state.errors, 'steps_ms': state.steps}, status=503)
+    return JsonResponse({'status': 'ready', 'warm_up_ms': state.total_ms, 'steps_ms': state.steps})
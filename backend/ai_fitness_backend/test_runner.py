@@ -0,0 +1,13 @@
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that leaves out the endpoint load tests (tagged ``load``)
+    unless they are asked for with ``manage.py test --tag load``.
+    """
+
+    def __init__(self, tags=None, exclude_tags=None, **kwargs):
+        if 'load' not in (tags or []):
+            exclude_tags = [*(exclude_tags or []), 'load']
+        super().__init__(tags=tags, exclude_tags=exclude_tags, **kwargs)
@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """
+    transaction.atomic() that takes SQLite's write lock when the transaction
+    begins (BEGIN IMMEDIATE), for blocks that read rows and write them back.
+    A deferred transaction that has already read cannot wait out another
+    writer; it fails with "database is locked" instead of honouring the busy
+    timeout. Nested blocks and other databases get a plain atomic().
+    """
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    # Connecting resets transaction_mode from OPTIONS, so connect first.
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
@@ -1,24 +1,23 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="FitTrack API",
-      default_version='v1',
-      description="AI Fitness Tracker Backend",
-   ),
-   public=True,
-   permission_classes=[permissions.AllowAny],
-   authentication_classes=[JWTAuthentication],
-)
+from .apidocs import get_docs_settings, schema_view, swagger_ui_view
+from .batch import BatchView
+from .instrumentation import metrics_view
+from .startup import readiness_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('authapp.urls')),  
     path('api/users/', include('users.urls')),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('api/workouts/', include('workouts.urls')),
+    path('api/async/', include('authapp.async_urls')),
+    path('api/async/users/', include('users.async_urls')),
+    path('api/batch/', BatchView.as_view(), name='batch'),
+    path('metrics', metrics_view, name='metrics'),
+    path('ready', readiness_view, name='readiness'),
+    path('api/schema.<str:format>', schema_view, name='api-schema'),
 ]
+
+if get_docs_settings()['ENABLED']:
+    urlpatterns.append(path('swagger/', swagger_ui_view(), name='schema-swagger-ui'))
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_fitness_backend.settings')
 
 application = get_wsgi_application()
+
+from ai_fitness_backend.startup import boot  # noqa: E402  (needs the app registry)
+
+boot()
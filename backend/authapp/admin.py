@@ -1,20 +1,92 @@
 # authapp/admin.py
 from django.contrib import admin
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.db.models.functions import Upper
+from django.utils import timezone
+from django.utils.text import smart_split, unescape_string_literal
+
+from ai_fitness_backend.pagination import EstimatedCountPaginator
 from .models import User, OTP
 
+
+def search_terms(search_term):
+    """Split a changelist search into terms the way the admin does, unquoting "quoted phrases"."""
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if bit:
+            yield bit
+
+
+def next_prefix(prefix):
+    """The smallest string greater than every string starting with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('id', 'username', 'email', 'is_active', 'is_staff', 'last_login')
+    # Only shows the search box; get_search_results() does the matching.
     search_fields = ('email', 'username')
+    search_help_text = "Exact email address or the start of a username."
     list_filter = ('is_staff', 'is_superuser', 'is_active')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # The stock '=' and '^' lookups are LIKE on SQLite, which cannot use the
+        # UPPER() indexes; equality and a range on UPPER(column) can.
+        queryset = queryset.alias(email_upper=Upper('email'), username_upper=Upper('username'))
+        for term in search_terms(search_term):
+            term = term.upper()
+            queryset = queryset.filter(
+                Q(email_upper=term) | Q(username_upper__gte=term, username_upper__lt=next_prefix(term))
+            )
+        return queryset, False
+
+
+class OTPExpiredFilter(admin.SimpleListFilter):
+    title = 'expired'
+    parameter_name = 'expired'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Yes'), ('no', 'No'))
+
+    def queryset(self, request, queryset):
+        cutoff = timezone.now() - OTP.lifetime()
+        if self.value() == 'yes':
+            return queryset.filter(created_at__lt=cutoff)
+        if self.value() == 'no':
+            return queryset.filter(created_at__gte=cutoff)
+        return queryset
+
 
 @admin.register(OTP)
 class OTPAdmin(admin.ModelAdmin):
     list_display = ('id', 'email', 'code', 'created_at', 'is_expired_display')
     search_fields = ('email', 'code')
+    search_help_text = "Exact email address (as entered) or code."
+    list_filter = (OTPExpiredFilter,)
     readonly_fields = ('created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Expiry is computed by the database rather than per row in Python.
+        cutoff = timezone.now() - OTP.lifetime()
+        return super().get_queryset(request).annotate(
+            expired=Case(When(created_at__lt=cutoff, then=Value(True)), default=Value(False), output_field=BooleanField())
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Case-sensitive equality, unlike the stock '=' (LIKE on SQLite), can use the email index.
+        for term in search_terms(search_term):
+            queryset = queryset.filter(Q(email=term) | Q(code=term))
+        return queryset, False
 
     def is_expired_display(self, obj):
-        return obj.is_expired()
+        return obj.expired
     is_expired_display.short_description = 'Expired'
     is_expired_display.boolean = True
+    # Older codes are the expired ones.
+    is_expired_display.admin_order_field = '-created_at'
@@ -0,0 +1,11 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('users/register/', async_views.register),
+    path('users/login/', async_views.login),
+    path('users/send-otp/', async_views.send_otp),
+    path('users/verify-otp/', async_views.verify_otp),
+    path('users/change-password/', async_views.change_password),
+    path('users/reset-password/', async_views.reset_password),
+]
@@ -0,0 +1,133 @@
+"""
+Native async versions of the authentication endpoints, for deployments that
+serve ai_fitness_backend.asgi. They share serializers (field validation only),
+the OTP store, the hashing pool, throttles and the mail outbox with the DRF
+views in views.py, but never block the event loop on the ORM, hashing or SMTP.
+"""
+from django.contrib.auth import aauthenticate, get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import NotAuthenticated, ValidationError
+
+from ai_fitness_backend.async_api import acheck_throttles, async_api_view, validate_fields
+from .authentication import CachedJWTAuthentication
+from .email_index import get_email_index
+from .hashing import get_hashing_executor
+from .otp_store import InvalidOTP, get_otp_store
+from .serializers import (
+    ChangePasswordSerializer, LoginSerializer, ResetPasswordSerializer, SendOTPSerializer, VerifyOTPSerializer,
+)
+from .throttling import EmailTokenBucketThrottle, IPTokenBucketThrottle
+from .utils import asend_otp_email
+from .views import get_tokens_for_user
+
+User = get_user_model()
+
+AUTH_THROTTLES = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+
+
+class AsyncRegisterSerializer(serializers.Serializer):
+    # RegisterSerializer's unique validators query synchronously; uniqueness is checked below instead.
+    email = serializers.EmailField(max_length=254)
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(write_only=True, min_length=6)
+
+
+async def authenticate(request):
+    result = await CachedJWTAuthentication().aauthenticate(request)
+    if result is None:
+        raise NotAuthenticated()
+    return result
+
+
+@async_api_view(['POST'])
+async def register(request):
+    data = validate_fields(AsyncRegisterSerializer, request.data)
+    email = User.objects.normalize_email(data['email'])
+    username = User.normalize_username(data['username'])
+    errors = {}
+    if await User.objects.filter(email=email).aexists():
+        errors['email'] = ['user with this email already exists.']
+    if await User.objects.filter(username=username).aexists():
+        errors['username'] = ['A user with that username already exists.']
+    if errors:
+        raise ValidationError(errors)
+
+    user = User(email=email, username=username)
+    user.password = await get_hashing_executor().amake_password(data['password'])
+    try:
+        await user.asave()
+    except IntegrityError:
+        raise ValidationError({'non_field_errors': ['A user with that email or username already exists.']})
+    return JsonResponse({'message': 'Registered successfully.'})
+
+
+@async_api_view(['POST'])
+async def login(request):
+    await acheck_throttles(request, 'login', AUTH_THROTTLES)
+    data = validate_fields(LoginSerializer, request.data)
+    user = await aauthenticate(request, email=data['email'], password=data['password'])
+    if user is None:
+        raise ValidationError({'non_field_errors': ['Invalid email or password.']})
+    return JsonResponse(get_tokens_for_user(user, otp_verified=False))
+
+
+async def issue_and_send_otp(email):
+    user_id = await get_email_index().auser_id(email)
+    if user_id is None:
+        raise ValidationError({'email': ['User not found.']})
+    await asend_otp_email(email, await get_otp_store().aissue(email, user_id))
+
+
+@async_api_view(['POST'])
+async def send_otp(request):
+    await acheck_throttles(request, 'send_otp', AUTH_THROTTLES)
+    data = validate_fields(SendOTPSerializer, request.data)
+    await issue_and_send_otp(data['email'])
+    return JsonResponse({'message': 'OTP sent to your email'})
+
+
+@async_api_view(['POST'])
+async def verify_otp(request):
+    data = validate_fields(VerifyOTPSerializer, request.data)
+    try:
+        user_id = await get_otp_store().aconsume(data['email'], data['code'])
+    except InvalidOTP as exc:
+        raise ValidationError({'non_field_errors': [str(exc)]})
+    if user_id is not None:
+        user = User(pk=user_id, email=data['email'])
+    else:
+        # Issued before codes carried a user id (see serializers.otp_user).
+        try:
+            user = await User.objects.aget(email=data['email'])
+        except User.DoesNotExist:
+            raise ValidationError({'email': ['User not found.']})
+    return JsonResponse({'message': 'OTP verified', **get_tokens_for_user(user, otp_verified=True)})
+
+
+@async_api_view(['POST'])
+async def change_password(request):
+    user, token = await authenticate(request)
+    data = validate_fields(ChangePasswordSerializer, request.data)
+    if user.last_password_change and timezone.now() - user.last_password_change < timezone.timedelta(days=1):
+        raise ValidationError({'non_field_errors': ['You can change your password only once per day.']})
+    if not token.get('otp_verified', False):
+        raise ValidationError({'non_field_errors': ['OTP verification required to change password.']})
+
+    user.password = await get_hashing_executor().amake_password(data['new_password'])
+    # As set_password() does, so save() notifies the password validators.
+    user._password = data['new_password']
+    user.last_password_change = timezone.now()
+    await user.asave(update_fields=['password', 'last_password_change'])
+    return JsonResponse({'message': 'Password changed successfully'})
+
+
+@async_api_view(['POST'])
+async def reset_password(request):
+    await acheck_throttles(request, 'reset_password', AUTH_THROTTLES)
+    data = validate_fields(ResetPasswordSerializer, request.data)
+    await issue_and_send_otp(data['email'])
+    return JsonResponse({'message': 'Reset OTP sent'})
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from .hashing import acheck_user_password, check_user_password, get_hashing_executor
+
+User = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that checks passwords on the hashing pool (authapp.hashing).
+
+    Lookups, the ``is_active`` check and hash upgrades behave as in the stock
+    backend, and ``authenticate()`` still sends ``user_login_failed``; only
+    the hashing leaves the request thread.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway so unknown emails take as long as wrong passwords.
+            get_hashing_executor().make_password(password)
+            return None
+        if check_user_password(user, password) and self.user_can_authenticate(user):
+            return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await User._default_manager.aget_by_natural_key(username)
+        except User.DoesNotExist:
+            await get_hashing_executor().amake_password(password)
+            return None
+        if await acheck_user_password(user, password) and self.user_can_authenticate(user):
+            return user
@@ -0,0 +1,106 @@
+import hashlib
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings. ``item in bloom`` is never falsely
+    negative; it is falsely positive for about ``error_rate`` of absent items
+    while no more than ``capacity`` items have been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from one 128-bit digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def saturated(self):
+        """True once more items were added than the filter was sized for."""
+        return self.count > self.capacity
+
+
+class TableBloomIndex:
+    """
+    A per-process BloomFilter over one column of ``model``'s table.
+
+    Rows inserted elsewhere are folded in every ``refresh_interval`` seconds
+    (by primary key, so only new rows are seen); every ``rebuild_interval``
+    seconds, or once the filter fills up, it is rebuilt from ``live_rows()``,
+    which drops deleted and changed values. Subclasses set ``model`` and
+    ``field`` and do the authoritative database check on a hit.
+    """
+    model = None
+    field = None
+
+    def __init__(self, capacity=100000, error_rate=0.001, refresh_interval=5, rebuild_interval=3600):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._bloom = None
+        self._last_id = 0
+        self._next_refresh = 0.0
+        self._next_rebuild = 0.0
+        self._lock = threading.Lock()
+
+    def live_rows(self):
+        return self.model.objects.all()
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._bloom is not None and now < self._next_refresh:
+            return self._bloom
+        with self._lock:
+            if self._bloom is None or self._bloom.saturated or now >= self._next_rebuild:
+                self._rebuild()
+                self._next_rebuild = now + self.rebuild_interval
+            elif now >= self._next_refresh:
+                self._load(self._bloom, self.model.objects.filter(pk__gt=self._last_id))
+            self._next_refresh = now + self.refresh_interval
+        return self._bloom
+
+    async def _async(self):
+        """``_sync()`` for async callers; only a due refresh leaves the event loop."""
+        if self._bloom is not None and time.monotonic() < self._next_refresh:
+            return self._bloom
+        return await sync_to_async(self._sync)()
+
+    def _rebuild(self):
+        live = self.live_rows()
+        # Leave headroom so the filter does not saturate right after a rebuild.
+        bloom = BloomFilter(max(self.capacity, 2 * live.count()), self.error_rate)
+        self._last_id = 0
+        self._load(bloom, live)
+        self._bloom = bloom
+
+    def _load(self, bloom, queryset):
+        for pk, value in queryset.values_list('pk', self.field).iterator(chunk_size=5000):
+            bloom.add(value)
+            self._last_id = max(self._last_id, pk)
@@ -0,0 +1,94 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .bloom import TableBloomIndex
+
+User = get_user_model()
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BLOOM_CAPACITY': 100000,
+    'BLOOM_ERROR_RATE': 0.001,
+    'REFRESH_INTERVAL': 5,
+    'REBUILD_INTERVAL': 3600,
+}
+
+
+def get_email_index_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_INDEX', {})}
+
+
+def recent_key(email):
+    return f"email-index:recent:{email}"
+
+
+class EmailIndex(TableBloomIndex):
+    """
+    Registered emails in a per-process Bloom filter, so OTP requests for
+    unknown addresses are turned away without a query.
+
+    A miss is final; a hit is confirmed against the User table. Emails saved
+    in this process are added at once; other processes see them after their
+    next refresh, and until then through a key in CACHES (which must be
+    shared between processes for that), so a user can ask for an OTP right
+    after registering. With ``enabled=False`` every check goes to the database.
+    """
+    model = User
+    field = 'email'
+
+    def __init__(self, enabled=True, **kwargs):
+        super().__init__(**kwargs)
+        self.enabled = enabled
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_email_index_settings()
+        return cls(enabled=conf['ENABLED'], capacity=conf['BLOOM_CAPACITY'], error_rate=conf['BLOOM_ERROR_RATE'],
+                   refresh_interval=conf['REFRESH_INTERVAL'], rebuild_interval=conf['REBUILD_INTERVAL'])
+
+    def might_exist(self, email):
+        """False only if no user has ``email``."""
+        return not self.enabled or email in self._sync() or cache.get(recent_key(email)) is not None
+
+    def exists(self, email):
+        return self.user_id(email) is not None
+
+    async def aexists(self, email):
+        return await self.auser_id(email) is not None
+
+    def user_id(self, email):
+        """Primary key of the user with ``email``, or None; costs what exists() does."""
+        if not self.might_exist(email):
+            return None
+        return User.objects.filter(email=email).values_list('pk', flat=True).first()
+
+    async def auser_id(self, email):
+        if self.enabled and email not in await self._async() and await cache.aget(recent_key(email)) is None:
+            return None
+        return await User.objects.filter(email=email).values_list('pk', flat=True).afirst()
+
+    def add(self, email):
+        if not self.enabled:
+            return
+        # Not built yet: the first check loads every email from the table anyway.
+        if self._bloom is not None:
+            self._bloom.add(email)
+        # Kept until every process has rebuilt its filter since: an incremental
+        # refresh can miss a row whose transaction commits out of primary key order.
+        cache.set(recent_key(email), True, timeout=self.rebuild_interval + self.refresh_interval)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_email_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = EmailIndex.from_settings()
+    return _index
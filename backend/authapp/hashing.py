@@ -0,0 +1,210 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from ai_fitness_backend.instrumentation import timer
+
+DEFAULTS = {
+    'POOL': True,
+    'WORKERS': os.cpu_count() or 1,
+    'MAX_PENDING': 2 * (os.cpu_count() or 1),
+    'TIMEOUT': 10,
+}
+
+
+def get_hashing_settings():
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'hashing_unavailable'
+    wait = 1
+
+
+def _init_worker():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_fitness_backend.settings')
+    django.setup()
+
+
+def _check_password(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+def _verify_password(password, encoded):
+    # (is_correct, must_update); must_update also covers a change of preferred hasher.
+    return hashers.verify_password(password, encoded)
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def process_pool(workers):
+    """A process pool whose workers have Django set up, for hash_passwords()."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def hash_passwords(passwords, pool=None, chunksize=1):
+    """make_password() for each of ``passwords``, on ``pool`` or inline; hashes come back in order."""
+    if pool is None:
+        return map(_make_password, passwords)
+    return pool.map(_make_password, passwords, chunksize=chunksize)
+
+
+class PasswordHashingExecutor:
+    """
+    Runs password hashing on a bounded process pool.
+
+    At most ``workers + max_pending`` hashes may be running or queued at any
+    time; callers beyond that get HashingUnavailable (HTTP 503) immediately
+    instead of waiting behind a growing backlog. With ``pool=False`` hashing
+    runs inline in the calling thread.
+    """
+
+    def __init__(self, pool=True, workers=1, max_pending=2, timeout=10):
+        self.use_pool = pool
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_hashing_settings()
+        return cls(pool=conf['POOL'], workers=conf['WORKERS'],
+                   max_pending=conf['MAX_PENDING'], timeout=conf['TIMEOUT'])
+
+    @property
+    def pool(self):
+        # A pool inherited through fork() is unusable, so every process builds its own.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = process_pool(self.workers)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def run(self, fn, *args):
+        with timer('password_hashing_duration_seconds', op=fn.__name__.lstrip('_')):
+            return self._run(fn, *args)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingUnavailable()
+        if not self.use_pool:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the pool has really finished, even if we stop waiting.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingUnavailable()
+
+    async def arun(self, fn, *args):
+        """``run`` for async views: awaits the pool without blocking the event loop."""
+        with timer('password_hashing_duration_seconds', op=fn.__name__.lstrip('_')):
+            return await self._arun(fn, *args)
+
+    async def _arun(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingUnavailable()
+        loop = asyncio.get_running_loop()
+        if not self.use_pool:
+            try:
+                return await loop.run_in_executor(None, fn, *args)
+            finally:
+                self._slots.release()
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HashingUnavailable()
+
+    def check_password(self, password, encoded):
+        return self.run(_check_password, password, encoded)
+
+    def verify_password(self, password, encoded):
+        return self.run(_verify_password, password, encoded)
+
+    def make_password(self, password):
+        return self.run(_make_password, password)
+
+    async def acheck_password(self, password, encoded):
+        return await self.arun(_check_password, password, encoded)
+
+    async def averify_password(self, password, encoded):
+        return await self.arun(_verify_password, password, encoded)
+
+    async def amake_password(self, password):
+        return await self.arun(_make_password, password)
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._pid = None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = PasswordHashingExecutor.from_settings()
+    return _executor
+
+
+def check_user_password(user, password):
+    """
+    Pool-backed equivalent of ``user.check_password(password)``, including
+    the transparent upgrade of hashes produced with outdated parameters or
+    by a hasher that is no longer the preferred one.
+    """
+    executor = get_hashing_executor()
+    if not user.password:
+        return False
+    is_correct, must_update = executor.verify_password(password, user.password)
+    if is_correct and must_update:
+        user.password = executor.make_password(password)
+        user.save(update_fields=['password'])
+    return is_correct
+
+
+async def acheck_user_password(user, password):
+    executor = get_hashing_executor()
+    if not user.password:
+        return False
+    is_correct, must_update = await executor.averify_password(password, user.password)
+    if is_correct and must_update:
+        user.password = await executor.amake_password(password)
+        await user.asave(update_fields=['password'])
+    return is_correct
@@ -0,0 +1,147 @@
+import asyncio
+import io
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from authapp.views import get_tokens_for_user
+
+User = get_user_model()
+
+ENDPOINTS = {
+    'profile': ('GET', '/api/users/profile/', '/api/async/users/profile/'),
+    'login': ('POST', '/api/users/login/', '/api/async/users/login/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the WSGI views with the native async views under increasing concurrency. "
+        "Requests are driven in-process (no network), so results show view and handler overhead, "
+        "not server limits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='profile')
+        parser.add_argument('--requests', type=int, default=500, help="Requests per concurrency level.")
+        parser.add_argument('--concurrency', default='1,10,50,100')
+        parser.add_argument('--p95-budget', type=float, default=200.0,
+                            help="Capacity is the highest concurrency whose p95 latency (ms) stays within this budget.")
+
+    def handle(self, *args, **options):
+        from ai_fitness_backend.asgi import application as asgi_app
+        from ai_fitness_backend.wsgi import application as wsgi_app
+
+        password = 'bench-async-password'
+        stamp = time.time_ns()
+        user = User(email=f'bench-async-{stamp}@example.invalid', username=f'bench-async-{stamp}')
+        user.set_password(password)
+        user.save()
+        try:
+            method, sync_path, async_path = ENDPOINTS[options['endpoint']]
+            headers = {'Content-Type': 'application/json'}
+            body = b''
+            if options['endpoint'] == 'login':
+                body = json.dumps({'email': user.email, 'password': password}).encode()
+            else:
+                headers['Authorization'] = f"Bearer {get_tokens_for_user(user, otp_verified=False)['access']}"
+
+            levels = [int(c) for c in options['concurrency'].split(',')]
+            # Login throttles would reject most of the run, so they are lifted for its duration.
+            with override_settings(AUTH_THROTTLE_RATES={}):
+                self.compare(asgi_app, wsgi_app, method, sync_path, async_path, headers, body, levels, options)
+        finally:
+            user.delete()
+
+    def compare(self, asgi_app, wsgi_app, method, sync_path, async_path, headers, body, levels, options):
+        for label, runner, app, path in (
+            ('wsgi (threads)', self.run_wsgi, wsgi_app, sync_path),
+            ('asgi (async views)', self.run_asgi, asgi_app, async_path),
+        ):
+            capacity = 0
+            self.stdout.write(label)
+            for level in levels:
+                start = time.perf_counter()
+                latencies, failures = runner(app, method, path, headers, body, options['requests'], level)
+                elapsed = time.perf_counter() - start
+                p50, p95 = self.percentiles(latencies)
+                if p95 <= options['p95_budget'] and not failures:
+                    capacity = level
+                self.stdout.write(
+                    f"  c={level:<5}{len(latencies) / elapsed:>10,.0f} req/s  p50 {p50:>7.1f} ms  "
+                    f"p95 {p95:>7.1f} ms  failures {failures}"
+                )
+            self.stdout.write(f"  capacity within p95 {options['p95_budget']:.0f} ms: {capacity} concurrent requests")
+
+    def percentiles(self, latencies):
+        if len(latencies) < 2:
+            return (latencies or [0.0])[0], (latencies or [0.0])[0]
+        cuts = statistics.quantiles(latencies, n=20)
+        return statistics.median(latencies), cuts[18]
+
+    def run_wsgi(self, app, method, path, headers, body, total, concurrency):
+        def call(i):
+            environ = {
+                'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': self.client_ip(i),
+                'CONTENT_LENGTH': str(len(body)), 'CONTENT_TYPE': headers.get('Content-Type', ''),
+                'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+                'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+                'wsgi.version': (1, 0),
+            }
+            for name, value in headers.items():
+                if name != 'Content-Type':
+                    environ['HTTP_' + name.upper().replace('-', '_')] = value
+            statuses = []
+            start = time.perf_counter()
+            response = app(environ, lambda status, _headers, exc_info=None: statuses.append(status))
+            b''.join(response)
+            response.close()
+            return (time.perf_counter() - start) * 1000, int(statuses[0].split()[0])
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(call, range(total)))
+        return [ms for ms, _ in results], sum(1 for _, code in results if code >= 400)
+
+    def run_asgi(self, app, method, path, headers, body, total, concurrency):
+        async def call(i):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+                'client': (self.client_ip(i), 50000), 'server': ('localhost', 80),
+            }
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            statuses = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            start = time.perf_counter()
+            await app(scope, receive, send)
+            return (time.perf_counter() - start) * 1000, statuses[0]
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded(i):
+                async with semaphore:
+                    return await call(i)
+            return await asyncio.gather(*(bounded(i) for i in range(total)))
+
+        results = asyncio.run(main())
+        return [ms for ms, _ in results], sum(1 for _, code in results if code >= 400)
+
+    def client_ip(self, i):
+        return f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hashers
+from django.core.management.base import BaseCommand
+
+from authapp.hashing import get_hashing_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the configured password hashers (and PBKDF2 iteration counts) "
+        "on this host and report latency and throughput per worker pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=5,
+                            help="Hashes timed per configuration.")
+        parser.add_argument('--iterations', default='',
+                            help="Comma-separated PBKDF2 iteration counts to try, e.g. 300000,600000,1000000.")
+        parser.add_argument('--target-ms', type=float, default=None,
+                            help="Recommend the strongest PBKDF2 setting whose mean latency stays under this.")
+
+    def handle(self, *args, **options):
+        workers = get_hashing_settings()['WORKERS']
+        candidates = [(hasher.algorithm, hasher) for hasher in get_hashers()]
+        for count in filter(None, options['iterations'].split(',')):
+            hasher = PBKDF2PasswordHasher()
+            hasher.iterations = int(count)
+            candidates.append((f"pbkdf2_sha256 x{hasher.iterations}", hasher))
+
+        self.stdout.write(f"{'hasher':<32}{'mean ms':>10}{'p95 ms':>10}{'hash/s/core':>14}{f'hash/s x{workers}':>14}")
+        results = []
+        for label, hasher in candidates:
+            try:
+                timings = self.time_hasher(hasher, options['samples'])
+            except ValueError as exc:
+                # Optional hashers (argon2, bcrypt) raise when their library is missing.
+                self.stdout.write(f"{label:<32}  unavailable: {exc}")
+                continue
+            mean = statistics.mean(timings)
+            p95 = sorted(timings)[max(0, round(0.95 * len(timings)) - 1)]
+            per_core = 1000 / mean
+            results.append((label, hasher, mean))
+            self.stdout.write(f"{label:<32}{mean:>10.1f}{p95:>10.1f}{per_core:>14.1f}{per_core * workers:>14.1f}")
+
+        if options['target_ms'] is not None:
+            fitting = [
+                (getattr(hasher, 'iterations', 0), label) for label, hasher, mean in results
+                if isinstance(hasher, PBKDF2PasswordHasher) and mean <= options['target_ms']
+            ]
+            if fitting:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Strongest PBKDF2 setting under {options['target_ms']} ms: {max(fitting)[1]}"))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"No PBKDF2 setting measured under {options['target_ms']} ms."))
+
+    def time_hasher(self, hasher, samples):
+        salt = hasher.salt()
+        hasher.encode('calibration-password', salt)  # warm up and surface missing libraries
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.encode('calibration-password', salt)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,57 @@
+import math
+import time
+
+from django.core.management.base import BaseCommand
+
+from authapp.bloom import BloomFilter
+from authapp.email_index import EmailIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Report memory use and false-positive rate of the registered-email Bloom filter as a function "
+        "of user count: the filter each process would build for that many users, filled with synthetic "
+        "emails and probed with unknown ones. Also reports the filter built from the live User table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default='10000,100000,1000000',
+                            help="Comma-separated user counts to simulate.")
+        parser.add_argument('--probes', type=int, default=100000,
+                            help="Unregistered emails checked per filter to measure the false-positive rate.")
+
+    def handle(self, *args, **options):
+        index = EmailIndex.from_settings()
+        self.stdout.write(f"EMAIL_INDEX: capacity {index.capacity:,}, error rate {index.error_rate}\n")
+        self.stdout.write(f"{'users':>12}{'capacity':>12}{'hashes':>8}{'memory':>12}{'bytes/user':>12}"
+                          f"{'expected fp':>13}{'measured fp':>13}{'fp when full':>14}{'build s':>9}")
+        for count in (int(c) for c in options['users'].split(',')):
+            start = time.perf_counter()
+            # Sized as a rebuild over `count` users would size it.
+            bloom = BloomFilter(max(index.capacity, 2 * count), index.error_rate)
+            for i in range(count):
+                bloom.add(f'user{i}@example.com')
+            self.report_row(bloom, count, time.perf_counter() - start, options['probes'])
+
+        start = time.perf_counter()
+        bloom = index._sync()
+        self.stdout.write("\nlive User table:")
+        self.report_row(bloom, len(bloom), time.perf_counter() - start, options['probes'])
+
+    def report_row(self, bloom, count, build_seconds, probes):
+        false_positives = sum(f'probe{i}@unregistered.invalid' in bloom for i in range(probes))
+        expected = self.false_positive_rate(bloom, count)
+        memory = len(bloom.bits)
+        self.stdout.write(
+            f"{count:>12,}{bloom.capacity:>12,}{bloom.hashes:>8}{self.kib(memory):>12}"
+            f"{memory / max(count, 1):>12.2f}{expected:>13.2e}{false_positives / probes:>13.2e}"
+            f"{self.false_positive_rate(bloom, bloom.capacity):>14.2e}{build_seconds:>9.2f}"
+        )
+
+    def false_positive_rate(self, bloom, count):
+        # (1 - e^(-kn/m))^k for n items in m bits with k hashes. Signups after a rebuild
+        # raise it toward the "when full" rate, at which point the filter is rebuilt.
+        return (1 - math.exp(-bloom.hashes * count / bloom.size)) ** bloom.hashes
+
+    def kib(self, size):
+        return f"{size / 1024:,.1f} KiB"
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_fitness_backend.apidocs import build_schema, get_docs_settings, write_artifact
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema once and write it as versioned JSON and YAML files to "
+        "API_DOCS['SCHEMA_DIR']. Run on every deploy; running servers switch to the new version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help="Write here instead of API_DOCS['SCHEMA_DIR'].")
+
+    def handle(self, *args, **options):
+        conf = get_docs_settings()
+        if not conf['ENABLED']:
+            raise CommandError("API docs are disabled (API_DOCS_ENABLED=False); drf_yasg is not loaded.")
+        directory = options['output_dir'] or conf['SCHEMA_DIR']
+        if not directory:
+            raise CommandError("No output directory; set API_SCHEMA_DIR or pass --output-dir.")
+        manifest = write_artifact(directory, build_schema())
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote schema version {manifest['version']} to {directory}: {', '.join(manifest['files'].values())}"
+        ))
@@ -0,0 +1,328 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from ai_fitness_backend.transactions import immediate_atomic
+from authapp.hashing import get_hashing_settings, hash_passwords, process_pool
+from authapp.serializers import RegisterSerializer
+from authapp.user_cache import user_cache
+from users import history, metrics
+from users.cache import invalidate_profile
+from users.models import UserProfile
+from users.serializers import UserProfileSerializer
+
+User = get_user_model()
+
+PROFILE_FIELDS = ['age', 'gender', 'height_cm', 'weight_kg', 'goal']
+TOTALS = ('created', 'updated', 'skipped', 'failed')
+
+
+class Row:
+    __slots__ = ('line', 'email', 'username', 'password', 'profile', 'encoded')
+
+    def __init__(self, line, email, username, password, profile):
+        self.line = line
+        self.email = email
+        self.username = username
+        self.password = password
+        self.profile = profile
+        self.encoded = None
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users (and optional profile fields) from a CSV or NDJSON file. Passwords are hashed "
+        "on a process pool while the previous batch is written; each batch is inserted with "
+        "bulk_create in its own transaction, and progress is checkpointed so an interrupted import "
+        "can continue with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row, or NDJSON (one object per line).")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help="Input format; guessed from the file extension by default.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per transaction.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Hashing processes (default PASSWORD_HASHING['WORKERS']; 0 hashes inline).")
+        parser.add_argument('--on-duplicate', choices=['skip', 'update'], default='skip',
+                            help="What to do with rows whose email already exists.")
+        parser.add_argument('--state-file', default=None,
+                            help="Checkpoint file (default: <path>.import-state).")
+        parser.add_argument('--resume', action='store_true',
+                            help="Continue after the last batch recorded in the checkpoint file.")
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        state_path = options['state_file'] or path + '.import-state'
+        state = self.load_state(state_path, path) if options['resume'] else {
+            'path': path, 'offset': 0, 'line': 0, **{name: 0 for name in TOTALS}}
+        if options['resume']:
+            self.stdout.write(f"Resuming after line {state['line']}.")
+        self.update = options['on_duplicate'] == 'update'
+        self.password_field = RegisterSerializer().fields['password']
+        workers = get_hashing_settings()['WORKERS'] if options['workers'] is None else options['workers']
+
+        start = time.perf_counter()
+        processed = 0
+        pool = process_pool(workers) if workers else None
+        try:
+            with open(path, 'rb') as f:
+                batches = self.read_batches(f, fmt, state, options['batch_size'])
+                for batch in self.hashed_batches(pool, workers, batches):
+                    counts = self.write_batch(batch['rows'])
+                    for name in TOTALS:
+                        state[name] += batch['counts'][name] + counts[name]
+                    processed += batch['line'] - state['line']
+                    state['offset'], state['line'] = batch['offset'], batch['line']
+                    self.save_state(state_path, state)
+                    self.report(state, processed, start)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.summary(state)} in {time.perf_counter() - start:.1f}s."))
+
+    def load_state(self, state_path, path):
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"No checkpoint at {state_path}; nothing to resume.")
+        if state['path'] != path or os.path.getsize(path) < state['offset']:
+            raise CommandError(f"Checkpoint {state_path} belongs to a different input file.")
+        return state
+
+    def save_state(self, state_path, state):
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.tmp', state_path)
+
+    def summary(self, state):
+        return ', '.join(f"{state[name]} {name}" for name in TOTALS)
+
+    def report(self, state, processed, start):
+        rate = processed / max(time.perf_counter() - start, 1e-9)
+        self.stdout.write(f"line {state['line']}: {self.summary(state)} ({rate:.0f} rows/s)")
+
+    def read_records(self, f, fmt, state):
+        """Yield ``(line, end_offset, record)`` from the checkpointed offset on."""
+        header = None
+        if fmt == 'csv':
+            header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+        line = state['line'] or (1 if header else 0)
+        if state['offset']:
+            f.seek(state['offset'])
+        # Lines are read as bytes so f.tell() gives an exact resume offset; CSV
+        # fields therefore cannot contain line breaks.
+        for raw in iter(f.readline, b''):
+            line += 1
+            text = raw.decode('utf-8').strip()
+            if not text:
+                continue
+            if header:
+                record = dict(zip(header, next(csv.reader([text]))))
+            else:
+                try:
+                    record = json.loads(text)
+                except ValueError as exc:
+                    record = {'__error__': f"invalid JSON: {exc}"}
+            yield line, f.tell(), record
+
+    def read_batches(self, f, fmt, state, batch_size):
+        """
+        Yield batches of parsed rows. Rows rejected before the database is
+        involved are reported here and counted in the batch's ``counts``.
+        """
+        records = self.read_records(f, fmt, state)
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                return
+            counts = dict.fromkeys(TOTALS, 0)
+            rows = {}
+            for line, _, record in chunk:
+                row = self.parse(line, record)
+                if row is None:
+                    counts['failed'] += 1
+                elif row.email in rows and not self.update:
+                    counts['skipped'] += 1
+                    self.reject(line, f"duplicate email {row.email} in input")
+                else:
+                    # In update mode the last row for an email wins.
+                    counts['skipped'] += row.email in rows
+                    rows[row.email] = row
+            line, end_offset, _ = chunk[-1]
+            yield {'rows': list(rows.values()), 'counts': counts, 'offset': end_offset, 'line': line}
+
+    def parse(self, line, record):
+        if not isinstance(record, dict) or '__error__' in record:
+            return self.reject(line, record.get('__error__') if isinstance(record, dict) else "expected an object")
+        values = {key: value for key, value in record.items() if value not in (None, '')}
+        cleaned = {}
+        for field in ('email', 'username'):
+            try:
+                cleaned[field] = User._meta.get_field(field).clean(str(values.get(field, '')).strip(), None)
+            except DjangoValidationError as exc:
+                return self.reject(line, f"{field}: {' '.join(exc.messages)}")
+        password = values.get('password')
+        if password is not None:
+            try:
+                password = self.password_field.run_validation(str(password))
+            except ValidationError as exc:
+                return self.reject(line, f"password: {' '.join(map(str, exc.detail))}")
+
+        profile = {}
+        if any(field in values for field in PROFILE_FIELDS):
+            serializer = UserProfileSerializer(
+                data={field: values[field] for field in PROFILE_FIELDS if field in values}, partial=True)
+            if not serializer.is_valid():
+                return self.reject(line, '; '.join(
+                    f"{field}: {' '.join(map(str, errors))}" for field, errors in serializer.errors.items()))
+            profile = serializer.validated_data
+        return Row(line, User.objects.normalize_email(cleaned['email']),
+                   User.normalize_username(cleaned['username']), password, profile)
+
+    def reject(self, line, message):
+        self.stderr.write(f"line {line}: {message}")
+        return None
+
+    def hashed_batches(self, pool, workers, batches):
+        """
+        Hash each batch's passwords on the pool, one batch ahead of the
+        caller, so hashing overlaps with the previous batch's inserts.
+        """
+        pending = None
+        for batch in batches:
+            rows = batch['rows']
+            if not self.update:
+                # Rows for existing emails would be hashed only to be skipped.
+                existing = set(User.objects.filter(email__in=[row.email for row in rows])
+                               .values_list('email', flat=True))
+                batch['counts']['skipped'] += len(existing)
+                rows = batch['rows'] = [row for row in rows if row.email not in existing]
+            passwords = [row.password for row in rows if row.password is not None]
+            hashes = hash_passwords(passwords, pool, chunksize=max(1, len(passwords) // (4 * (workers or 1))))
+            if pending is not None:
+                yield self.resolve(*pending)
+            pending = batch, hashes
+        if pending is not None:
+            yield self.resolve(*pending)
+
+    def resolve(self, batch, hashes):
+        hashes = iter(list(hashes))
+        for row in batch['rows']:
+            row.encoded = next(hashes) if row.password is not None else None
+        return batch
+
+    def write_batch(self, rows):
+        try:
+            with immediate_atomic():
+                counts, changes = self.write_rows(rows)
+        except IntegrityError:
+            # A conflict the pre-checks could not see (e.g. a concurrent signup):
+            # retry row by row so only the offending rows are lost.
+            counts, changes = dict.fromkeys(TOTALS, 0), []
+            for row in rows:
+                try:
+                    with immediate_atomic():
+                        row_counts, row_changes = self.write_rows([row])
+                except IntegrityError as exc:
+                    counts['failed'] += 1
+                    self.reject(row.line, str(exc))
+                    continue
+                for name in TOTALS:
+                    counts[name] += row_counts[name]
+                changes += row_changes
+        self.after_commit(changes)
+        return counts
+
+    def write_rows(self, rows):
+        """
+        Insert or update ``rows``. Returns the counts and ``[(user_id, before,
+        after)]`` for every user written, with profile snapshots for
+        metrics.apply_profile_changes().
+        """
+        counts = dict.fromkeys(TOTALS, 0)
+        existing = {user.email: user for user in User.objects.filter(email__in=[row.email for row in rows])
+                    .only('pk', 'email', 'username', 'password', 'last_password_change')}
+        taken = set(User.objects.filter(username__in=[row.username for row in rows])
+                    .exclude(email__in=[row.email for row in rows]).values_list('username', flat=True))
+
+        new_users, updated_users, accepted, usernames = [], [], [], set()
+        now = timezone.now()
+        for row in rows:
+            user = existing.get(row.email)
+            if user is not None and not self.update:
+                counts['skipped'] += 1
+                continue
+            if row.username in taken or row.username in usernames:
+                counts['failed'] += 1
+                self.reject(row.line, f"username {row.username} is already taken")
+                continue
+            usernames.add(row.username)
+            if user is None:
+                # make_password(None) gives an unusable password, as create_user() does.
+                user = User(email=row.email, username=row.username, password=row.encoded or make_password(None))
+                new_users.append(user)
+                counts['created'] += 1
+            else:
+                user.username = row.username
+                if row.encoded is not None:
+                    user.password = row.encoded
+                    user.last_password_change = now
+                updated_users.append(user)
+                counts['updated'] += 1
+            accepted.append((row, user))
+
+        User.objects.bulk_create(new_users)
+        if updated_users:
+            User.objects.bulk_update(updated_users, ['username', 'password', 'last_password_change'])
+
+        with_profile = [(row, user) for row, user in accepted if row.profile]
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(
+            user_id__in=[user.pk for _, user in with_profile])} if updated_users else {}
+        new_profiles, updated_profiles, changes, measurements = [], [], [], []
+        for row, user in with_profile:
+            profile = profiles.get(user.pk)
+            if profile is None:
+                profile = UserProfile(user=user)
+                new_profiles.append(profile)
+            else:
+                profile.version += 1
+                profile.updated_at = now
+                updated_profiles.append(profile)
+            before = metrics.snapshot(profile)
+            measurements.append((user.pk, {
+                field: value for field, value in row.profile.items() if getattr(profile, field) != value}, now))
+            for field, value in row.profile.items():
+                setattr(profile, field, value)
+            changes.append((user.pk, before, metrics.snapshot(profile)))
+
+        UserProfile.objects.bulk_create(new_profiles)
+        if updated_profiles:
+            UserProfile.objects.bulk_update(updated_profiles, PROFILE_FIELDS + ['version', 'updated_at'])
+        history.record_many(measurements)
+        # Updated users (and their cached profiles) must be dropped even without profile changes.
+        changes += [(user.pk, None, None) for user in updated_users]
+        return counts, changes
+
+    def after_commit(self, changes):
+        # bulk_create()/bulk_update() send no signals, so caches are maintained here.
+        for user_id, _, _ in changes:
+            user_cache.invalidate(user_id)
+            invalidate_profile(user_id)
+        metrics.apply_profile_changes([(before, after) for _, before, after in changes if after is not None])
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from authapp.otp_store import get_otp_store
+
+
+class Command(BaseCommand):
+    help = "Delete expired OTP codes in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows deleted per statement.")
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help="Seconds to pause between batches to let writers through.")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop after this many batches.")
+
+    def handle(self, *args, **options):
+        store = get_otp_store()
+        total = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            deleted = store.purge_expired(batch_size=options['batch_size'])
+            if not deleted:
+                break
+            total += deleted
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {total} expired OTP(s) in {batches} batch(es)."))
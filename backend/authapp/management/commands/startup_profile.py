@@ -0,0 +1,100 @@
+import json
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter under -X importtime, so every import is really cold.
+CHILD = r'''
+import io, json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_fitness_backend.settings')
+os.environ['STARTUP_WARM_UP'] = 'off'
+from ai_fitness_backend.wsgi import application
+boot_ms = (time.perf_counter() - start) * 1000
+
+from ai_fitness_backend.startup import state
+warm_up = None
+if {warm!r}:
+    state.start(background=False)
+    warm_up = {{'total_ms': state.total_ms, 'steps_ms': state.steps, 'errors': state.errors}}
+
+body = {data!r}.encode()
+latencies = []
+for i in range({requests!r}):
+    environ = {{
+        'REQUEST_METHOD': {method!r}, 'PATH_INFO': {path!r}, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }}
+    statuses = []
+    request_start = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(response)
+    response.close()
+    latencies.append({{'ms': round((time.perf_counter() - request_start) * 1000, 1), 'status': statuses[0]}})
+print(json.dumps({{'boot_ms': round(boot_ms, 1), 'warm_up': warm_up, 'requests': latencies}}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the WSGI app in fresh interpreters and report where cold-start time goes: import time "
+        "by package, app boot, each warm-up step, and the latency of the first requests with and "
+        "without the warm-up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/users/login/')
+        parser.add_argument('--method', default='POST')
+        parser.add_argument('--data', default='{}', help="Request body (JSON).")
+        parser.add_argument('--requests', type=int, default=3, help="Requests sent after boot.")
+        parser.add_argument('--top', type=int, default=12, help="Packages listed in the import breakdown.")
+        parser.add_argument('--json', action='store_true', help="Print the raw results as JSON.")
+
+    def handle(self, *args, **options):
+        results = {mode: self.run_child(options, warm=mode == 'warm') for mode in ('cold', 'warm')}
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        cold = results['cold']
+        self.stdout.write(f"Import time by package (cold boot, total {cold['import_total_ms']:.0f} ms):")
+        for package, ms in cold['imports_ms'][:options['top']]:
+            self.stdout.write(f"  {package:<32}{ms:>8.1f} ms")
+
+        for mode, result in results.items():
+            self.stdout.write(f"\n{mode}: app boot {result['boot_ms']:.0f} ms")
+            if result['warm_up']:
+                self.stdout.write(f"  warm-up {result['warm_up']['total_ms']:.0f} ms")
+                for step, ms in result['warm_up']['steps_ms'].items():
+                    error = result['warm_up']['errors'].get(step)
+                    self.stdout.write(f"    {step:<14}{ms:>8.1f} ms" + (f"  ({error})" if error else ""))
+            for i, request in enumerate(result['requests'], 1):
+                self.stdout.write(f"  request {i}: {request['ms']:>8.1f} ms  {request['status']}")
+
+    def run_child(self, options, warm):
+        script = CHILD.format(warm=warm, data=options['data'], requests=options['requests'],
+                              method=options['method'].upper(), path=options['path'])
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                              capture_output=True, text=True, cwd=settings.BASE_DIR)
+        if proc.returncode:
+            raise CommandError(f"Start-up run failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['imports_ms'], result['import_total_ms'] = self.import_breakdown(proc.stderr)
+        return result
+
+    def import_breakdown(self, stderr):
+        """Sum -X importtime self times per top-level package."""
+        totals = defaultdict(float)
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            totals[name.strip().split('.')[0]] += int(self_us) / 1000
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        return [(package, round(ms, 1)) for package, ms in ranked], sum(totals.values())
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from ai_fitness_backend.db_router import REPLICA_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the replica file (DATABASE_REPLICA_NAME) with SQLite's "
+        "online backup API. Stands in for replication when trying the read/write router locally."
+    )
+
+    def handle(self, *args, **options):
+        if REPLICA_DB_ALIAS not in connections.settings:
+            raise CommandError("No replica configured; set DATABASE_REPLICA_NAME.")
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[REPLICA_DB_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError("sync_sqlite_replica only works with SQLite databases.")
+
+        # Close the replica's connection so nothing holds it open during the copy.
+        replica.close()
+        primary.ensure_connection()
+        with sqlite3.connect(replica.settings_dict['NAME']) as target:
+            primary.connection.backup(target)
+            target.execute('PRAGMA journal_mode=WAL')
+        target.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {primary.settings_dict['NAME']} to {replica.settings_dict['NAME']}."
+        ))
@@ -1,5 +1,9 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 
@@ -10,6 +14,13 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive exact/prefix lookups (admin search) compare UPPER(column).
+            models.Index(Upper('email'), name='user_email_upper_idx'),
+            models.Index(Upper('username'), name='user_username_upper_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -17,7 +28,29 @@ class User(AbstractUser):
 class OTP(models.Model):
     email = models.EmailField()
     code = models.CharField(max_length=6)
+    # Lets a verify issue tokens without looking the user up; deleting the user drops their codes.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Leading email column also serves plain per-email lookups.
+            models.Index(fields=['email', 'code', 'created_at'], name='otp_email_code_created_idx'),
+            models.Index(fields=['created_at'], name='otp_created_at_idx'),
+        ]
+
+    @staticmethod
+    def lifetime():
+        return timedelta(seconds=settings.OTP_STORE.get('TTL', 900))
+
     def is_expired(self):
-        return timezone.now() > self.created_at + timezone.timedelta(minutes=15)
+        return timezone.now() > self.created_at + self.lifetime()
+
+
+class RevokedToken(models.Model):
+    """A refresh token that may not be used again, kept until it would have expired anyway."""
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,176 @@
+import hashlib
+import hmac
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Exists
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OTP
+from .utils import generate_otp
+
+
+class InvalidOTP(Exception):
+    pass
+
+
+class ExpiredOTP(InvalidOTP):
+    pass
+
+
+class BaseOTPStore:
+    """
+    Storage for one-time codes. ``issue`` creates a code for an email (and
+    the id of the user it belongs to) and ``consume`` checks and invalidates
+    it in one step, returning that user id, or raising InvalidOTP (or
+    ExpiredOTP where the backend can tell) when it does not match.
+    """
+
+    def __init__(self, ttl=900, **options):
+        self.ttl = ttl
+
+    def issue(self, email, user_id=None):
+        raise NotImplementedError
+
+    def consume(self, email, code):
+        raise NotImplementedError
+
+    def revoke(self, email):
+        """Invalidate every code issued for ``email``."""
+        raise NotImplementedError
+
+    def purge_expired(self, batch_size=1000):
+        """Delete up to ``batch_size`` expired codes and return how many went."""
+        return 0
+
+    async def aissue(self, email, user_id=None):
+        return await sync_to_async(self.issue)(email, user_id)
+
+    async def aconsume(self, email, code):
+        return await sync_to_async(self.consume)(email, code)
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    def issue(self, email, user_id=None):
+        return OTP.objects.create(email=email, code=generate_otp(), user_id=user_id).code
+
+    def consume(self, email, code):
+        cutoff = timezone.now() - OTP.lifetime()
+        match = OTP.objects.filter(email=email, code=code, created_at__gte=cutoff)
+        found = match.values_list('user_id', flat=True)[:1]
+        if found:
+            # A single DELETE clears every code for the email, but only if the match is still there.
+            deleted, _ = OTP.objects.filter(email=email).filter(Exists(match)).delete()
+            if deleted:
+                return found[0]
+            raise InvalidOTP("Invalid OTP.")
+        if OTP.objects.filter(email=email, code=code).exists():
+            raise ExpiredOTP("OTP expired.")
+        raise InvalidOTP("Invalid OTP.")
+
+    def revoke(self, email):
+        OTP.objects.filter(email=email).delete()
+
+    async def aissue(self, email, user_id=None):
+        return (await OTP.objects.acreate(email=email, code=generate_otp(), user_id=user_id)).code
+
+    async def aconsume(self, email, code):
+        cutoff = timezone.now() - OTP.lifetime()
+        match = OTP.objects.filter(email=email, code=code, created_at__gte=cutoff)
+        found = [user_id async for user_id in match.values_list('user_id', flat=True)[:1]]
+        if found:
+            deleted, _ = await OTP.objects.filter(email=email).filter(Exists(match)).adelete()
+            if deleted:
+                return found[0]
+            raise InvalidOTP("Invalid OTP.")
+        if await OTP.objects.filter(email=email, code=code).aexists():
+            raise ExpiredOTP("OTP expired.")
+        raise InvalidOTP("Invalid OTP.")
+
+    def purge_expired(self, batch_size=1000):
+        cutoff = timezone.now() - OTP.lifetime()
+        ids = list(
+            OTP.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        deleted, _ = OTP.objects.filter(pk__in=ids).delete()
+        return deleted
+
+
+class CacheOTPStore(BaseOTPStore):
+    """
+    Keeps the latest code per email in a Django cache (locmem, Redis, ...)
+    and lets the cache's own TTL expire it.
+    """
+
+    def __init__(self, ttl=900, cache_alias='default', key_prefix='otp', **options):
+        super().__init__(ttl=ttl, **options)
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, email):
+        return f"{self.key_prefix}:{hashlib.sha256(email.encode()).hexdigest()}"
+
+    def issue(self, email, user_id=None):
+        code = generate_otp()
+        self.cache.set(self._key(email), (code, user_id), timeout=self.ttl)
+        return code
+
+    def consume(self, email, code):
+        key = self._key(email)
+        stored_code, user_id = self._parse(self.cache.get(key))
+        if stored_code is None or not hmac.compare_digest(stored_code, str(code)):
+            raise InvalidOTP("Invalid OTP.")
+        # delete() only reports True to one caller, so a code cannot be used twice.
+        if not self.cache.delete(key):
+            raise InvalidOTP("Invalid OTP.")
+        return user_id
+
+    def revoke(self, email):
+        self.cache.delete(self._key(email))
+
+    async def aissue(self, email, user_id=None):
+        code = generate_otp()
+        await self.cache.aset(self._key(email), (code, user_id), timeout=self.ttl)
+        return code
+
+    async def aconsume(self, email, code):
+        key = self._key(email)
+        stored_code, user_id = self._parse(await self.cache.aget(key))
+        if stored_code is None or not hmac.compare_digest(stored_code, str(code)):
+            raise InvalidOTP("Invalid OTP.")
+        if not await self.cache.adelete(key):
+            raise InvalidOTP("Invalid OTP.")
+        return user_id
+
+    @staticmethod
+    def _parse(stored):
+        # Codes cached before user ids were stored with them are plain strings.
+        if stored is None or isinstance(stored, str):
+            return stored, None
+        return stored
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = {key.lower(): value for key, value in settings.OTP_STORE.items()}
+                backend = import_string(options.pop('backend', 'authapp.otp_store.DatabaseOTPStore'))
+                _store = backend(**options)
+    return _store
@@ -0,0 +1,226 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import get_connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from ai_fitness_backend.instrumentation import timer
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ASYNC': True,
+    'WORKERS': 2,
+    'BATCH_SIZE': 20,
+    'QUEUE_SIZE': 10000,
+    'MAX_RETRIES': 3,
+    'RETRY_BACKOFF': 2.0,
+    'IDLE_TIMEOUT': 30,
+    'DEAD_LETTER_SIZE': 1000,
+    'SHUTDOWN_TIMEOUT': 10,
+}
+
+
+def get_outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'OTP_MAIL_OUTBOX', {})}
+
+
+class OutboxFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many emails are waiting to be sent, please retry shortly.'
+    default_code = 'outbox_full'
+    wait = 5
+
+
+class Envelope:
+    def __init__(self, message):
+        self.message = message
+        self.attempts = 0
+
+
+class MailOutbox:
+    """
+    In-process mail queue drained by a small pool of worker threads.
+
+    Each worker keeps its own backend connection open between batches and
+    closes it after IDLE_TIMEOUT seconds without work. Failed messages are
+    retried with exponential backoff and end up in ``dead_letters`` once
+    MAX_RETRIES is exhausted.
+    """
+
+    def __init__(self, workers=2, batch_size=20, queue_size=10000, max_retries=3,
+                 retry_backoff=2.0, idle_timeout=30, dead_letter_size=1000,
+                 connection_factory=get_connection):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self.connection_factory = connection_factory
+        self.dead_letters = deque(maxlen=dead_letter_size)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        conf = get_outbox_settings()
+        options = {
+            'workers': conf['WORKERS'],
+            'batch_size': conf['BATCH_SIZE'],
+            'queue_size': conf['QUEUE_SIZE'],
+            'max_retries': conf['MAX_RETRIES'],
+            'retry_backoff': conf['RETRY_BACKOFF'],
+            'idle_timeout': conf['IDLE_TIMEOUT'],
+            'dead_letter_size': conf['DEAD_LETTER_SIZE'],
+        }
+        options.update(kwargs)
+        return cls(**options)
+
+    def enqueue(self, message):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(Envelope(message))
+        except queue.Full:
+            raise OutboxFull()
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued message has been sent or dead-lettered, or
+        ``timeout`` seconds have passed. Return True if the outbox drained.
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout)
+
+    def _ensure_started(self):
+        # Worker threads do not survive a fork, so restart them in the child.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._run, name=f'otp-mail-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.idle_timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        connection = None
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                connection = self._close(connection)
+                continue
+            try:
+                connection = self.deliver(batch, connection)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def deliver(self, batch, connection=None):
+        """
+        Send ``batch`` over ``connection`` (opening one if needed) and return
+        the connection for reuse, or None if it had to be dropped.
+        """
+        for envelope in batch:
+            envelope.attempts += 1
+            try:
+                if connection is None:
+                    connection = self.connection_factory(fail_silently=False)
+                    connection.open()
+                with timer('mail_send_duration_seconds', mode='outbox'):
+                    connection.send_messages([envelope.message])
+            except Exception:
+                logger.warning("OTP mail delivery to %s failed (attempt %d).",
+                               envelope.message.to, envelope.attempts, exc_info=True)
+                # The connection may be half-closed; start a fresh one for the next message.
+                connection = self._close(connection)
+                self._retry(envelope)
+        return connection
+
+    def _retry(self, envelope):
+        if envelope.attempts > self.max_retries:
+            logger.error("OTP mail to %s dead-lettered after %d attempts.",
+                         envelope.message.to, envelope.attempts)
+            self.dead_letters.append(envelope)
+            return
+        delay = self.retry_backoff * (2 ** (envelope.attempts - 1))
+        # Count the pending retry as outstanding work so flush() waits for it.
+        with self._queue.mutex:
+            self._queue.unfinished_tasks += 1
+        retry_timer = threading.Timer(delay, self._requeue, args=(envelope,))
+        retry_timer.daemon = True
+        retry_timer.start()
+
+    def _requeue(self, envelope):
+        try:
+            self._queue.put_nowait(envelope)
+        except queue.Full:
+            self.dead_letters.append(envelope)
+        finally:
+            self._queue.task_done()
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return None
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = MailOutbox.from_settings()
+                atexit.register(_outbox.flush, timeout=get_outbox_settings()['SHUTDOWN_TIMEOUT'])
+    return _outbox
+
+
+def send_message(message):
+    """
+    Hand ``message`` to the outbox, or send it inline when ASYNC is off
+    (tests, management commands, local development).
+    """
+    if not get_outbox_settings()['ASYNC']:
+        with timer('mail_send_duration_seconds', mode='inline'):
+            return message.send(fail_silently=False)
+    get_outbox().enqueue(message)
+
+
+async def asend_message(message):
+    """send_message() for async views; an inline send runs off the event loop."""
+    if not get_outbox_settings()['ASYNC']:
+        with timer('mail_send_duration_seconds', mode='inline'):
+            return await sync_to_async(message.send, thread_sensitive=False)(fail_silently=False)
+    get_outbox().enqueue(message)
@@ -0,0 +1,83 @@
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .bloom import TableBloomIndex
+from .models import RevokedToken
+
+DEFAULTS = {
+    'BLOOM_CAPACITY': 100000,
+    'BLOOM_ERROR_RATE': 0.001,
+    'REFRESH_INTERVAL': 5,
+    'REBUILD_INTERVAL': 3600,
+}
+
+
+def get_blacklist_settings():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_BLACKLIST', {})}
+
+
+class TokenBlacklist(TableBloomIndex):
+    """
+    Revoked token ids in the RevokedToken table, fronted by a per-process
+    Bloom filter so checking a token that was never revoked (the usual case)
+    costs no query.
+
+    Each process folds in rows revoked elsewhere every REFRESH_INTERVAL
+    seconds and rebuilds the filter from live rows every REBUILD_INTERVAL
+    seconds or once it fills up. ``revoke`` is the authoritative check: the
+    unique jti makes exactly one caller win, whatever the filter says.
+    """
+    model = RevokedToken
+    field = 'jti'
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_blacklist_settings()
+        return cls(capacity=conf['BLOOM_CAPACITY'], error_rate=conf['BLOOM_ERROR_RATE'],
+                   refresh_interval=conf['REFRESH_INTERVAL'], rebuild_interval=conf['REBUILD_INTERVAL'])
+
+    def live_rows(self):
+        return RevokedToken.objects.filter(expires_at__gte=timezone.now())
+
+    def is_revoked(self, jti):
+        if jti not in self._sync():
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """Record ``jti`` as revoked. Returns False if it already was."""
+        bloom = self._sync()
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        bloom.add(jti)
+        return True
+
+    def prune_expired(self, batch_size=1000):
+        """Delete up to ``batch_size`` rows for tokens that have expired and return how many went."""
+        ids = list(
+            RevokedToken.objects.filter(expires_at__lt=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        deleted, _ = RevokedToken.objects.filter(pk__in=ids).delete()
+        return deleted
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def get_token_blacklist():
+    global _blacklist
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                _blacklist = TokenBlacklist.from_settings()
+    return _blacklist
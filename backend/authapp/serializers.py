@@ -1,10 +1,19 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import authenticate, get_user_model
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .models import OTP
-from .utils import send_otp_email, generate_otp
+from .email_index import get_email_index
+from .hashing import get_hashing_executor
+from .otp_store import InvalidOTP, get_otp_store
+from .revocation import get_token_blacklist
 
 User = get_user_model()
 
@@ -17,7 +26,14 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ['email', 'username', 'password']
 
     def create(self, validated_data):
-        return User.objects.create_user(**validated_data)
+        # Same steps as UserManager.create_user, with the hash computed off-thread.
+        password = validated_data.pop('password')
+        user = User(**validated_data)
+        user.email = User.objects.normalize_email(user.email)
+        user.username = User.normalize_username(user.username)
+        user.password = get_hashing_executor().make_password(password)
+        user.save()
+        return user
 
 
 class LoginSerializer(serializers.Serializer):
@@ -25,8 +41,8 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
     def validate(self, data):
-        user = authenticate(email=data['email'], password=data['password'])
-        if not user:
+        user = authenticate(self.context.get('request'), email=data['email'], password=data['password'])
+        if user is None:
             raise serializers.ValidationError("Invalid email or password.")
         data['user'] = user
         return data
@@ -35,10 +51,12 @@ class LoginSerializer(serializers.Serializer):
 class SendOTPSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
-    def validate_email(self, email):
-        if not User.objects.filter(email=email).exists():
-            raise serializers.ValidationError("User not found.")
-        return email
+    def validate(self, data):
+        # Unknown emails (mostly bots) are usually rejected without a query.
+        data['user_id'] = get_email_index().user_id(data['email'])
+        if data['user_id'] is None:
+            raise serializers.ValidationError({'email': ["User not found."]})
+        return data
 
 
 class VerifyOTPSerializer(serializers.Serializer):
@@ -46,15 +64,27 @@ class VerifyOTPSerializer(serializers.Serializer):
     code = serializers.CharField()
 
     def validate(self, data):
+        # Consuming the code here makes it single-use even under concurrent verifies.
         try:
-            otp = OTP.objects.filter(email=data['email'], code=data['code']).latest('created_at')
-        except OTP.DoesNotExist:
-            raise serializers.ValidationError("Invalid OTP.")
+            user_id = get_otp_store().consume(data['email'], data['code'])
+        except InvalidOTP as exc:
+            raise serializers.ValidationError(str(exc))
+        data['user'] = otp_user(data['email'], user_id)
+        return data
 
-        if otp.is_expired():
-            raise serializers.ValidationError("OTP expired.")
 
-        return data
+def otp_user(email, user_id):
+    """
+    The user a consumed code was issued to, enough to issue tokens for.
+    Codes issued before they carried a user id are resolved by email.
+    """
+    if user_id is not None:
+        return User(pk=user_id, email=email)
+    try:
+        return User.objects.get(email=email)
+    except User.DoesNotExist:
+        # Deleted after the code was issued.
+        raise serializers.ValidationError({'email': ["User not found."]})
 
 
 class ChangePasswordSerializer(serializers.Serializer):
@@ -68,23 +98,65 @@ class ChangePasswordSerializer(serializers.Serializer):
         if user.last_password_change and timezone.now() - user.last_password_change < timezone.timedelta(days=1):
             raise serializers.ValidationError("You can change your password only once per day.")
 
-        # Check if token has otp_verified = True
-        auth = JWTAuthentication()
-        header = auth.get_header(request)
-        raw_token = auth.get_raw_token(header)
-        validated_token = auth.get_validated_token(raw_token)
+        # Check if token has otp_verified = True (request.auth is the token validated during authentication)
+        validated_token = request.auth
 
-        if not validated_token.get('otp_verified', False):
+        if not validated_token or not validated_token.get('otp_verified', False):
             raise serializers.ValidationError("OTP verification required to change password.")
 
         return data
 
     def save(self):
+        # request.user may be a cached copy; write only the columns changed here.
         user = self.context['request'].user
-        user.set_password(self.validated_data['new_password'])
+        user.password = get_hashing_executor().make_password(self.validated_data['new_password'])
+        # As set_password() does, so save() notifies the password validators.
+        user._password = self.validated_data['new_password']
         user.last_password_change = timezone.now()
-        user.save()
+        user.save(update_fields=['password', 'last_password_change'])
 
 
-class ResetPasswordSerializer(serializers.Serializer):
-    email = serializers.EmailField()
+class ResetPasswordSerializer(SendOTPSerializer):
+    pass
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, data):
+        try:
+            refresh = RefreshToken(data['refresh'])
+        except TokenError as exc:
+            raise InvalidToken(exc.args[0])
+
+        jti = refresh[jwt_settings.JTI_CLAIM]
+        blacklist = get_token_blacklist()
+        if blacklist.is_revoked(jti):
+            raise InvalidToken("Token is blacklisted")
+
+        user = User.objects.filter(pk=refresh.get(jwt_settings.USER_ID_CLAIM)).only(
+            'is_active', 'last_password_change').first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed("No active account found for the given token.", 'no_active_account')
+        # A password change ends every session started before it.
+        if user.last_password_change and refresh.get('iat', 0) < int(user.last_password_change.timestamp()):
+            raise InvalidToken("Token was issued before the last password change")
+
+        # Revoking the presented token is also the reuse check: only one refresh per token succeeds.
+        if not blacklist.revoke(jti, datetime.fromtimestamp(refresh['exp'], tz=dt_timezone.utc)):
+            raise InvalidToken("Token is blacklisted")
+
+        # otp_verified survives rotation only within OTP_VERIFIED_LIFETIME of the OTP check itself.
+        verified_at = refresh.get('otp_verified_at')
+        still_verified = (
+            bool(refresh.get('otp_verified')) and verified_at is not None
+            and time.time() - verified_at < settings.OTP_VERIFIED_LIFETIME.total_seconds()
+        )
+        refresh['otp_verified'] = still_verified
+        if not still_verified and 'otp_verified_at' in refresh:
+            del refresh['otp_verified_at']
+
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .email_index import get_email_index
+from .otp_store import get_otp_store
+from .user_cache import user_cache
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def index_user_email(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'email' in update_fields:
+        get_email_index().add(instance.email)
+
+
+@receiver(post_delete, sender=User)
+def revoke_otps(sender, instance, **kwargs):
+    # Database codes go with the user; cached ones would still name its id.
+    get_otp_store().revoke(instance.email)
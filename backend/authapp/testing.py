@@ -0,0 +1,49 @@
+"""
+Fixtures shared by the test suites of every app: test users and their
+tokens, inline password hashing, fresh per-process filters, and the settings
+the endpoint benchmarks run under.
+"""
+from unittest import mock
+
+from django.test import override_settings
+
+from .email_index import EmailIndex
+from .hashing import PasswordHashingExecutor
+from .models import User
+from .revocation import TokenBlacklist
+from .views import get_tokens_for_user
+
+PASSWORD = 'bench-password'
+
+# Mail goes to the locmem outbox inline; throttles are off so repeated calls
+# measure the endpoint rather than 429s; MD5 keeps hashing out of the numbers
+# (manage.py calibrate_hashers measures the real hasher).
+bench_settings = override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OTP_MAIL_OUTBOX={'ASYNC': False},
+    AUTH_THROTTLE_RATES={},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+
+
+def inline_hashing():
+    return mock.patch('authapp.hashing._executor', PasswordHashingExecutor(pool=False, workers=64, max_pending=64))
+
+
+def fresh_blacklist():
+    return mock.patch('authapp.revocation._blacklist', TokenBlacklist())
+
+
+def fresh_email_index():
+    return mock.patch('authapp.email_index._index', EmailIndex())
+
+
+def make_user(name, **extra):
+    user = User(email=f'{name}@example.com', username=name, **extra)
+    user.set_password(PASSWORD)
+    user.save()
+    return user
+
+
+def bearer(user, otp_verified=False):
+    return {'Authorization': f"Bearer {get_tokens_for_user(user, otp_verified=otp_verified)['access']}"}
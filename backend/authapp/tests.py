@@ -1,3 +1,1271 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ai_fitness_backend import instrumentation
+from ai_fitness_backend.db_router import REPLICA_DB_ALIAS, PrimaryStickinessMiddleware
+from ai_fitness_backend.loadtest import http_request, run_load, write_results
+from ai_fitness_backend.startup import WarmUpState, boot, lazy_import, warm_up_steps
+from ai_fitness_backend.test_runner import TestRunner
+from ai_fitness_backend.transactions import immediate_atomic
+from .email_index import EmailIndex
+from .hashing import HashingUnavailable, PasswordHashingExecutor, get_hashing_executor
+from .management.commands import import_users
+from .management.commands.startup_profile import CHILD
+from .models import OTP, User
+from .otp_store import CacheOTPStore, DatabaseOTPStore, ExpiredOTP, InvalidOTP, get_otp_store
+from .outbox import MailOutbox, OutboxFull, send_message
+from .testing import PASSWORD, bearer, bench_settings, fresh_blacklist, fresh_email_index, inline_hashing, make_user
+from .throttling import EmailTokenBucketThrottle, IPTokenBucketThrottle
+from .user_cache import user_cache
+from .utils import otp_email
+from .views import get_tokens_for_user
+
+
+@bench_settings
+class AuthQueryBudgetTests(TestCase):
+    """Upper bounds on the queries each auth endpoint may run per request."""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = fresh_email_index()
+        self.email_index = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.user = make_user('budget')
+        self.email_index.might_exist('warm-up@example.com')
+
+    def test_register(self):
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/users/register/', {
+                'email': 'new@example.com', 'username': 'new', 'password': PASSWORD,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_login(self):
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/users/login/', {
+                'email': self.user.email, 'password': PASSWORD,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_send_otp(self):
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/users/send-otp/', {'email': self.user.email}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_verify_otp(self):
+        # The code's row names the user, so only the code is read and deleted.
+        code = get_otp_store().issue(self.user.email, self.user.pk)
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/users/verify-otp/', {
+                'email': self.user.email, 'code': code,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_verify_otp_cache_store(self):
+        store = CacheOTPStore()
+        code = store.issue(self.user.email, self.user.pk)
+        with mock.patch('authapp.otp_store._store', store), self.assertNumQueries(0):
+            response = self.client.post('/api/users/verify-otp/', {
+                'email': self.user.email, 'code': code,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['user_id'], self.user.pk)
+
+    def test_change_password(self):
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/users/change-password/', {'new_password': 'another-password'},
+                                        format='json', headers=bearer(self.user, otp_verified=True))
+        self.assertEqual(response.status_code, 200)
+
+    def test_reset_password(self):
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/users/reset-password/', {'email': self.user.email}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_email(self):
+        # Rejected by the email index: no query, no OTP, no mail.
+        for path in ('/api/users/send-otp/', '/api/users/reset-password/',
+                     '/api/async/users/send-otp/', '/api/async/users/reset-password/'):
+            with self.subTest(path=path), self.assertNumQueries(0):
+                response = self.client.post(path, {'email': 'nobody@example.com'}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_otp_right_after_registering_elsewhere(self):
+        # The filter of another process was built before the user registered.
+        elsewhere = EmailIndex()
+        elsewhere.might_exist('warm-up@example.com')
+        self.client.post('/api/users/register/', {
+            'email': 'fresh@example.com', 'username': 'fresh', 'password': PASSWORD,
+        }, format='json')
+        with mock.patch('authapp.email_index._index', elsewhere):
+            response = self.client.post('/api/users/send-otp/', {'email': 'fresh@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_refresh(self):
+        refresh = get_tokens_for_user(self.user)['refresh']
+        with fresh_blacklist() as blacklist:
+            blacklist.is_revoked('warm-up')
+            # User lookup + the revocation INSERT (in a savepoint); the Bloom filter answers the revoked check.
+            with self.assertNumQueries(4):
+                response = self.client.post('/api/users/token/refresh/', {'refresh': refresh}, format='json')
+            self.assertEqual(response.status_code, 200)
+            reused = self.client.post('/api/users/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(reused.status_code, 401)
+
+
+@bench_settings
+class ChangePasswordTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def test_writes_only_password_columns(self):
+        for path in ('/api/users/change-password/', '/api/async/users/change-password/'):
+            with self.subTest(path=path):
+                user = make_user(f'change-{len(path)}')
+                headers = bearer(user, otp_verified=True)
+                self.client.get('/api/users/profile/', headers=headers)
+                # Changed behind the user cache, which now holds a stale copy.
+                User.objects.filter(pk=user.pk).update(username=f'{user.username}-renamed', first_name='Sam')
+                with mock.patch('django.contrib.auth.password_validation.password_changed') as password_changed:
+                    response = self.client.post(path, {'new_password': 'another-password'},
+                                                format='json', headers=headers)
+                self.assertEqual(response.status_code, 200)
+                user.refresh_from_db()
+                self.assertEqual((user.username, user.first_name), (f'change-{len(path)}-renamed', 'Sam'))
+                self.assertTrue(user.check_password('another-password'))
+                self.assertIsNotNone(user.last_password_change)
+                password_changed.assert_called_once_with('another-password', mock.ANY)
+
+
+@bench_settings
+class AsyncAuthViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        for patcher in (inline_hashing(), fresh_email_index()):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.user = make_user('async')
+
+    def post(self, endpoint, data, **extra):
+        return self.client.post(f'/api/async/users/{endpoint}/', data, format='json', **extra)
+
+    def test_register(self):
+        response = self.post('register', {'email': 'new@EXAMPLE.com', 'username': 'new', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(email='new@example.com').check_password(PASSWORD))
+
+        response = self.post('register', {'email': 'async@example.com', 'username': 'async', 'password': '123'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'password'})
+        response = self.post('register', {'email': 'async@example.com', 'username': 'async', 'password': PASSWORD})
+        self.assertEqual(set(response.json()), {'email', 'username'})
+
+    def test_login(self):
+        response = self.post('login', {'email': self.user.email, 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'access', 'refresh'})
+        response = self.post('login', {'email': self.user.email, 'password': 'wrong-password'})
+        self.assertEqual(response.json(), {'non_field_errors': ['Invalid email or password.']})
+
+    def test_otp_flow(self):
+        self.assertEqual(self.post('send-otp', {'email': self.user.email}).status_code, 200)
+        code = re.search(r'code is (\w+)\.', mail.outbox[-1].body).group(1)
+        self.assertEqual(self.post('verify-otp', {'email': self.user.email, 'code': '000000x'}).status_code, 400)
+        response = self.post('verify-otp', {'email': self.user.email, 'code': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post('verify-otp', {'email': self.user.email, 'code': code}).status_code, 400)
+
+        headers = {'Authorization': f"Bearer {response.json()['access']}"}
+        response = self.post('change-password', {'new_password': 'another-password'}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('another-password'))
+
+    def test_change_password_requires_otp(self):
+        self.assertEqual(self.post('change-password', {'new_password': 'another-password'}).status_code, 401)
+        response = self.post('change-password', {'new_password': 'another-password'}, headers=bearer(self.user))
+        self.assertEqual(response.json(), {'non_field_errors': ['OTP verification required to change password.']})
+
+    def test_verify_otp_for_deleted_user(self):
+        for store, path in ((DatabaseOTPStore(), '/api/users/verify-otp/'), (CacheOTPStore(), '/api/users/verify-otp/'),
+                            (DatabaseOTPStore(), '/api/async/users/verify-otp/')):
+            user = make_user(f'deleted-{len(path)}-{type(store).__name__.lower()}')
+            with self.subTest(store=type(store).__name__, path=path), \
+                    mock.patch('authapp.otp_store._store', store):
+                code = store.issue(user.email, user.pk)
+                user.delete()
+                response = self.client.post(path, {'email': user.email, 'code': code}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'non_field_errors': ['Invalid OTP.']})
+
+    def test_verify_otp_issued_without_user_id(self):
+        # Codes issued before they carried a user id are resolved by email.
+        for path in ('/api/users/verify-otp/', '/api/async/users/verify-otp/'):
+            with self.subTest(path=path):
+                code = get_otp_store().issue(self.user.email)
+                response = self.client.post(path, {'email': self.user.email, 'code': code}, format='json')
+                self.assertEqual(response.status_code, 200)
+        for path in ('/api/users/verify-otp/', '/api/async/users/verify-otp/'):
+            with self.subTest(path=path):
+                code = get_otp_store().issue('gone@example.com')
+                response = self.client.post(path, {'email': 'gone@example.com', 'code': code}, format='json')
+                self.assertEqual(response.json(), {'email': ['User not found.']})
+
+    def test_reset_password(self):
+        self.assertEqual(self.post('reset-password', {'email': self.user.email}).status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/api/async/users/login/').status_code, 405)
+        response = self.client.post('/api/async/users/login/', '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post('login', ['not', 'an', 'object']).status_code, 400)
+
+    @override_settings(AUTH_THROTTLE_RATES={'login': {'ip': '1/min'}})
+    def test_throttles_run_off_the_event_loop(self):
+        allow_request = IPTokenBucketThrottle.allow_request
+        loops = []
+
+        def recording_allow_request(throttle, request, view):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return allow_request(throttle, request, view)
+
+        with mock.patch.object(IPTokenBucketThrottle, 'allow_request', recording_allow_request), \
+                mock.patch.object(IPTokenBucketThrottle, '_blocked', {}):
+            self.assertEqual(self.post('login', {'email': self.user.email, 'password': PASSWORD}).status_code, 200)
+            response = self.post('login', {'email': self.user.email, 'password': PASSWORD})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(loops, [None, None])
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = 1000
+
+
+@bench_settings
+class LoginBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.user = make_user('backend')
+        self.failures = []
+        handler = lambda sender, credentials, **kwargs: self.failures.append(credentials)
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+    def login(self, path='/api/users/login/', password=PASSWORD, email='backend@example.com'):
+        return self.client.post(path, {'email': email, 'password': password}, format='json')
+
+    def test_login_goes_through_backends(self):
+        for path in ('/api/users/login/', '/api/async/users/login/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.login(path).status_code, 200)
+                self.assertEqual(self.login(path, password='wrong-password').status_code, 400)
+                self.assertEqual(self.login(path, email='nobody@example.com').status_code, 400)
+        self.assertEqual(len(self.failures), 4)
+        self.assertEqual(self.failures[0]['email'], 'backend@example.com')
+        self.assertNotEqual(self.failures[0]['password'], 'wrong-password')
+
+    def test_inactive_user_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login().status_code, 400)
+        self.assertEqual(len(self.failures), 1)
+
+    def test_rehash_when_preferred_hasher_changes(self):
+        preferred = ['authapp.tests.FastPBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']
+        for path in ('/api/users/login/', '/api/async/users/login/'):
+            User.objects.filter(pk=self.user.pk).update(password=make_password(PASSWORD, hasher='md5'))
+            with self.subTest(path=path), override_settings(PASSWORD_HASHERS=preferred):
+                self.assertEqual(self.login(path).status_code, 200)
+                encoded = User.objects.get(pk=self.user.pk).password
+                self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+                self.assertTrue(check_password(PASSWORD, encoded))
+
+
+@bench_settings
+class PasswordHashingExecutorTests(TestCase):
+    def test_inline(self):
+        executor = PasswordHashingExecutor(pool=False)
+        encoded = executor.make_password(PASSWORD)
+        self.assertTrue(executor.check_password(PASSWORD, encoded))
+        self.assertEqual(executor.verify_password('wrong', encoded), (False, False))
+        self.assertEqual(async_to_sync(executor.averify_password)(PASSWORD, encoded), (True, False))
+
+    def test_pool(self):
+        executor = PasswordHashingExecutor(pool=True, workers=1)
+        self.addCleanup(executor.shutdown)
+        encoded = executor.make_password(PASSWORD)
+        self.assertTrue(check_password(PASSWORD, encoded))
+        self.assertTrue(async_to_sync(executor.acheck_password)(PASSWORD, encoded))
+
+    def test_one_executor_per_process(self):
+        from_settings = PasswordHashingExecutor.from_settings
+
+        def slow_from_settings():
+            time.sleep(0.01)
+            return from_settings()
+
+        with mock.patch('authapp.hashing._executor', None), \
+                mock.patch.object(PasswordHashingExecutor, 'from_settings', side_effect=slow_from_settings) as built:
+            with ThreadPoolExecutor(8) as pool:
+                executors = set(pool.map(lambda _: get_hashing_executor(), range(8)))
+        self.assertEqual(len(executors), 1)
+        self.assertEqual(built.call_count, 1)
+
+    def test_full_pool_is_503(self):
+        executor = PasswordHashingExecutor(pool=False, workers=1, max_pending=1)
+        executor._slots.acquire()
+        executor._slots.acquire()
+        with self.assertRaises(HashingUnavailable):
+            executor.make_password(PASSWORD)
+        with self.assertRaises(HashingUnavailable):
+            async_to_sync(executor.amake_password)(PASSWORD)
+
+        make_user('busy')
+        with mock.patch('authapp.hashing._executor', executor):
+            response = APIClient().post('/api/users/login/', {
+                'email': 'busy@example.com', 'password': PASSWORD,
+            }, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        executor._slots.release()
+        self.assertTrue(executor.check_password(PASSWORD, executor.make_password(PASSWORD)))
+
+
+class CalibrateHashersTests(TestCase):
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_report_and_recommendation(self):
+        out = io.StringIO()
+        call_command('calibrate_hashers', samples=2, iterations='1000,2000', target_ms=60000.0, stdout=out)
+        output = out.getvalue()
+        for label in ('md5', 'pbkdf2_sha256 x1000', 'pbkdf2_sha256 x2000'):
+            self.assertIn(label, output)
+        self.assertIn('Strongest PBKDF2 setting under 60000.0 ms: pbkdf2_sha256 x2000', output)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_nothing_fits(self):
+        out = io.StringIO()
+        call_command('calibrate_hashers', samples=1, iterations='1000', target_ms=0.0, stdout=out)
+        self.assertIn('No PBKDF2 setting measured under 0.0 ms.', out.getvalue())
+
+
+@bench_settings
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'users.csv')
+
+    def write_csv(self, *rows):
+        with open(self.path, 'w') as f:
+            f.write('email,username,password,age,weight_kg\n')
+            f.writelines(','.join(map(str, row)) + '\n' for row in rows)
+
+    def import_users(self, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_users', self.path, stdout=out, stderr=err, **{'workers': 0, 'batch_size': 2, **options})
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        self.write_csv(('a@example.com', 'a', PASSWORD, 30, 70.5),
+                       ('b@example.com', 'b', '', '', ''),
+                       ('not-an-email', 'c', PASSWORD, '', ''))
+        # Hashed on a one-process pool; the other tests hash inline.
+        out, err = self.import_users(workers=1)
+        self.assertIn('Done: 2 created, 0 updated, 0 skipped, 1 failed', out)
+        self.assertIn('line 4: email:', err)
+        a, b = User.objects.order_by('email')
+        self.assertTrue(a.check_password(PASSWORD))
+        self.assertFalse(b.has_usable_password())
+        self.assertEqual((a.profile.age, a.profile.weight_kg), (30, 70.5))
+        self.assertFalse(os.path.exists(self.path + '.import-state'))
+
+    def test_duplicate_emails(self):
+        make_user('taken', first_name='Old')
+        self.write_csv(('taken@EXAMPLE.com', 'taken2', PASSWORD, 40, ''),
+                       ('new@example.com', 'new', PASSWORD, '', ''),
+                       ('new@EXAMPLE.COM', 'new2', PASSWORD, '', ''))
+        out, err = self.import_users(batch_size=3)
+        self.assertIn('Done: 1 created, 0 updated, 2 skipped, 0 failed', out)
+        self.assertIn('line 4: duplicate email new@example.com in input', err)
+        self.assertEqual(User.objects.get(email='new@example.com').username, 'new')
+        self.assertEqual(User.objects.get(email='taken@example.com').username, 'taken')
+
+        out, _ = self.import_users(batch_size=3, on_duplicate='update')
+        # The last row for an email wins.
+        self.assertIn('Done: 0 created, 2 updated, 1 skipped, 0 failed', out)
+        taken = User.objects.get(email='taken@example.com')
+        self.assertEqual((taken.username, taken.profile.age), ('taken2', 40))
+        self.assertEqual(User.objects.get(email='new@example.com').username, 'new2')
+
+    def test_resume(self):
+        self.write_csv(*((f'user{i}@example.com', f'user{i}', PASSWORD, 20 + i, '') for i in range(5)))
+        write_batch = import_users.Command.write_batch
+        calls = []
+
+        def interrupted(command, rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return write_batch(command, rows)
+
+        with mock.patch.object(import_users.Command, 'write_batch', interrupted), \
+                self.assertRaises(KeyboardInterrupt):
+            self.import_users()
+        self.assertEqual(User.objects.count(), 2)
+        with open(self.path + '.import-state') as f:
+            self.assertEqual(json.load(f)['line'], 3)
+
+        out, _ = self.import_users(resume=True)
+        self.assertIn('Resuming after line 3.', out)
+        self.assertIn('Done: 5 created, 0 updated, 0 skipped, 0 failed', out)
+        self.assertEqual(sorted(User.objects.values_list('profile__age', flat=True)), [20, 21, 22, 23, 24])
+        self.assertFalse(os.path.exists(self.path + '.import-state'))
+        with self.assertRaisesMessage(CommandError, 'nothing to resume'):
+            self.import_users(resume=True)
+
+
+class ReadinessTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('ai_fitness_backend.startup.state', WarmUpState())
+        self.state = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ready_when_warm_up_is_off(self):
+        with override_settings(STARTUP={'WARM_UP': 'off'}):
+            response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ready')
+
+    def test_warming_up_then_ready(self):
+        release = threading.Event()
+        steps = [('slow', release.wait), ('fast', lambda: None)]
+        with mock.patch('ai_fitness_backend.startup.WARM_UP_STEPS', steps), \
+                override_settings(STARTUP={'WARM_UP': 'background'}):
+            response = self.client.get('/ready')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(response.json()['status'], 'warming_up')
+            release.set()
+            self.assertTrue(self.state.done.wait(10))
+            response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['steps_ms']), ['slow', 'fast'])
+
+    def test_failed_step(self):
+        def broken():
+            raise RuntimeError('no cache')
+
+        with mock.patch('ai_fitness_backend.startup.WARM_UP_STEPS', [('cache', broken)]), \
+                override_settings(STARTUP={'WARM_UP': 'sync'}):
+            boot()
+            response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['errors'], {'cache': 'RuntimeError: no cache'})
+
+    def test_heavy_steps_are_opt_in(self):
+        with override_settings(STARTUP={}):
+            self.assertNotIn('metrics', dict(warm_up_steps()))
+        with override_settings(STARTUP={'WARM_UP_EXTRAS': ['metrics']}):
+            names = [name for name, _ in warm_up_steps()]
+        self.assertEqual(names[-2:], ['email_index', 'metrics'])
+
+    def test_lazy_import_from_many_threads(self):
+        sys.modules.pop('colorsys', None)
+        module = lazy_import('colorsys')
+        self.assertNotIn('colorsys', sys.modules)
+        barrier = threading.Barrier(8)
+
+        def first_use():
+            barrier.wait()
+            return module.rgb_to_hsv(1.0, 0.0, 0.0)
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: first_use(), range(8)))
+        self.assertEqual(results, [(0.0, 1.0, 1.0)] * 8)
+        self.assertIs(lazy_import('colorsys'), sys.modules['colorsys'])
+
+
+class StartupProfileTests(TestCase):
+    def test_child_script_compiles(self):
+        script = CHILD.format(warm=True, data='{}', requests=2, method='POST', path='/api/users/login/')
+        compile(script, 'startup_profile', 'exec')
+
+    def test_report(self):
+        def fake_run(args, **kwargs):
+            warm = "if True:" in args[-1]
+            result = {
+                'boot_ms': 900.0 if warm else 800.0,
+                'warm_up': {'total_ms': 50.0, 'steps_ms': {'urls': 40.0, 'cache': 10.0},
+                            'errors': {'cache': 'RuntimeError: down'}} if warm else None,
+                'requests': [{'ms': 5.0 if warm else 60.0, 'status': '400 Bad Request'}],
+            }
+            stderr = (
+                "import time: self [us] | cumulative | imported package\n"
+                "import time:      3000 |       3000 | django.db\n"
+                "import time:      1000 |       4000 | django\n"
+                "import time:      2500 |       2500 |   rest_framework\n"
+            )
+            return subprocess.CompletedProcess(args, 0, stdout=json.dumps(result) + '\n', stderr=stderr)
+
+        out = io.StringIO()
+        with mock.patch('subprocess.run', side_effect=fake_run) as run:
+            call_command('startup_profile', requests=1, stdout=out)
+        self.assertEqual(run.call_count, 2)
+        output = out.getvalue()
+        self.assertIn('total 6 ms', output)
+        self.assertLess(output.index('django'), output.index('rest_framework'))
+        self.assertIn('cold: app boot 800 ms', output)
+        self.assertIn('(RuntimeError: down)', output)
+        self.assertIn('request 1:      5.0 ms  400 Bad Request', output)
+
+    def test_failed_child(self):
+        failed = subprocess.CompletedProcess([], 1, stdout='', stderr='ImportError: boom')
+        with mock.patch('subprocess.run', return_value=failed), self.assertRaisesMessage(CommandError, 'boom'):
+            call_command('startup_profile', stdout=io.StringIO())
+
+
+@bench_settings
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.alicia = make_user('alicia')
+        self.bob = make_user('bob')
+        self.admin = make_user('root', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+
+    def search(self, model_admin, term):
+        return model_admin.get_search_results(None, model_admin.model.objects.all(), term)[0]
+
+    def test_user_search(self):
+        model_admin = admin.site._registry[User]
+        self.assertEqual(set(self.search(model_admin, 'ALIC')), {self.alice, self.alicia})
+        self.assertEqual(list(self.search(model_admin, 'Bob@Example.com')), [self.bob])
+        self.assertEqual(list(self.search(model_admin, 'ali bob@example.com')), [])
+        self.assertEqual(list(self.search(model_admin, 'example')), [])
+
+    def test_user_search_uses_the_upper_indexes(self):
+        queryset = self.search(admin.site._registry[User], 'alice@example.com')
+        self.assertNotIn('LIKE', str(queryset.query))
+        plan = queryset.explain()
+        self.assertIn('user_email_upper_idx', plan)
+        self.assertIn('user_username_upper_idx', plan)
+
+    def test_user_changelist(self):
+        response = self.client.get('/admin/authapp/user/', {'q': 'ali'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.context['cl'].result_list), {self.alice, self.alicia})
+
+    def test_otp_search(self):
+        model_admin = admin.site._registry[OTP]
+        with mock.patch('authapp.otp_store.generate_otp', return_value='123456'):
+            DatabaseOTPStore().issue(self.alice.email)
+        self.assertEqual(self.search(model_admin, self.alice.email).get().code, '123456')
+        self.assertEqual(self.search(model_admin, '123456').get().email, self.alice.email)
+        self.assertFalse(self.search(model_admin, self.bob.email).exists())
+
+    def test_otps_sorted_by_expired(self):
+        store = DatabaseOTPStore()
+        store.issue(self.alice.email)
+        OTP.objects.update(created_at=timezone.now() - 2 * OTP.lifetime())
+        store.issue(self.bob.email)
+        column = admin.site._registry[OTP].list_display.index('is_expired_display')
+        response = self.client.get('/admin/authapp/otp/', {'o': column + 1})
+        self.assertEqual([otp.expired for otp in response.context['cl'].result_list], [False, True])
+        response = self.client.get('/admin/authapp/otp/', {'o': f'-{column + 1}'})
+        self.assertEqual([otp.expired for otp in response.context['cl'].result_list], [True, False])
+
+
+class OTPStoreContract:
+    """Behaviour every OTP store must have; mixed into one TestCase per backend."""
+
+    def test_single_use(self):
+        code = self.store.issue('otp@example.com')
+        self.store.consume('otp@example.com', code)
+        with self.assertRaises(InvalidOTP):
+            self.store.consume('otp@example.com', code)
+
+    def test_wrong_code_or_email(self):
+        with mock.patch('authapp.otp_store.generate_otp', return_value='123456'):
+            code = self.store.issue('otp@example.com')
+        with self.assertRaises(InvalidOTP):
+            self.store.consume('otp@example.com', '654321')
+        with self.assertRaises(InvalidOTP):
+            self.store.consume('other@example.com', code)
+        self.store.consume('otp@example.com', code)
+
+    def test_async(self):
+        code = async_to_sync(self.store.aissue)('otp@example.com')
+        async_to_sync(self.store.aconsume)('otp@example.com', code)
+        with self.assertRaises(InvalidOTP):
+            async_to_sync(self.store.aconsume)('otp@example.com', code)
+
+    def test_returns_user_id(self):
+        user = make_user('otp')
+        code = self.store.issue(user.email, user.pk)
+        self.assertEqual(self.store.consume(user.email, code), user.pk)
+        code = async_to_sync(self.store.aissue)(user.email, user.pk)
+        self.assertEqual(async_to_sync(self.store.aconsume)(user.email, code), user.pk)
+        self.assertIsNone(self.store.consume(user.email, self.store.issue(user.email)))
+
+    def test_revoke(self):
+        code = self.store.issue('otp@example.com')
+        self.store.revoke('otp@example.com')
+        with self.assertRaises(InvalidOTP):
+            self.store.consume('otp@example.com', code)
+
+    def test_expired(self):
+        code = self.store.issue('otp@example.com')
+        with self.expire():
+            with self.assertRaises(InvalidOTP):
+                self.store.consume('otp@example.com', code)
+
+
+class DatabaseOTPStoreTests(OTPStoreContract, TestCase):
+    def setUp(self):
+        self.store = DatabaseOTPStore()
+
+    def expire(self):
+        OTP.objects.update(created_at=timezone.now() - OTP.lifetime() - datetime.timedelta(seconds=1))
+        return contextlib.nullcontext()
+
+    def test_expired_is_reported(self):
+        code = self.store.issue('otp@example.com')
+        self.expire()
+        with self.assertRaises(ExpiredOTP):
+            self.store.consume('otp@example.com', code)
+        with self.assertRaises(ExpiredOTP):
+            async_to_sync(self.store.aconsume)('otp@example.com', code)
+
+    def test_consuming_clears_older_codes(self):
+        older = self.store.issue('otp@example.com')
+        self.store.consume('otp@example.com', self.store.issue('otp@example.com'))
+        self.assertFalse(OTP.objects.exists())
+        with self.assertRaises(InvalidOTP):
+            self.store.consume('otp@example.com', older)
+
+    def test_purge_expired_otps(self):
+        for i in range(5):
+            self.store.issue(f'old{i}@example.com')
+        self.expire()
+        live = self.store.issue('live@example.com')
+        out = io.StringIO()
+        with mock.patch('authapp.otp_store._store', self.store):
+            call_command('purge_expired_otps', batch_size=2, max_batches=2, stdout=out)
+            self.assertIn('Purged 4 expired OTP(s) in 2 batch(es).', out.getvalue())
+            call_command('purge_expired_otps', batch_size=2, stdout=out)
+        self.assertIn('Purged 1 expired OTP(s) in 1 batch(es).', out.getvalue())
+        self.assertEqual(list(OTP.objects.values_list('email', flat=True)), ['live@example.com'])
+        self.store.consume('live@example.com', live)
+
+
+class CacheOTPStoreTests(OTPStoreContract, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = CacheOTPStore(ttl=60)
+
+    def expire(self):
+        return mock.patch('time.time', return_value=time.time() + 61)
+
+    def test_latest_code_wins(self):
+        with mock.patch('authapp.otp_store.generate_otp', side_effect=['111111', '222222']):
+            older = self.store.issue('otp@example.com')
+            newer = self.store.issue('otp@example.com')
+        with self.assertRaises(InvalidOTP):
+            self.store.consume('otp@example.com', older)
+        self.store.consume('otp@example.com', newer)
+
+    def test_purge_is_a_no_op(self):
+        self.store.issue('otp@example.com')
+        self.assertEqual(self.store.purge_expired(), 0)
+
+
+class OTPStoreSettingsTests(SimpleTestCase):
+    @override_settings(OTP_STORE={'BACKEND': 'authapp.otp_store.CacheOTPStore', 'TTL': 30, 'KEY_PREFIX': 'code'})
+    def test_one_store_per_process(self):
+        with mock.patch('authapp.otp_store._store', None), \
+                mock.patch.object(CacheOTPStore, '__init__', autospec=True,
+                                  side_effect=lambda self, **options: time.sleep(0.05)) as init:
+            with ThreadPoolExecutor(4) as pool:
+                stores = list(pool.map(lambda _: get_otp_store(), range(4)))
+        self.assertEqual(len({id(store) for store in stores}), 1)
+        init.assert_called_once_with(stores[0], ttl=30, key_prefix='code')
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(AUTH_THROTTLE_RATES={'login': {'ip': '3/min', 'email': '2/min'}},
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TokenBucketThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = Clock()
+        for throttle_class in (IPTokenBucketThrottle, EmailTokenBucketThrottle):
+            patcher = mock.patch.multiple(throttle_class, timer=self.clock, _blocked={})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.view = SimpleNamespace(throttle_scope='login')
+
+    def allow(self, throttle_class=IPTokenBucketThrottle, ip='10.0.0.1', email='throttle@example.com'):
+        throttle = throttle_class()
+        request = SimpleNamespace(META={'REMOTE_ADDR': ip}, data={'email': email})
+        return throttle.allow_request(request, self.view), throttle.wait()
+
+    def test_burst_then_refill(self):
+        self.assertEqual([self.allow()[0] for _ in range(4)], [True, True, True, False])
+        allowed, wait = self.allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 20)
+        self.clock.now += 19
+        self.assertFalse(self.allow()[0])
+        self.clock.now += 1
+        self.assertEqual([self.allow()[0] for _ in range(2)], [True, False])
+        # A long pause refills up to the burst size, not beyond it.
+        self.clock.now += 3600
+        self.assertEqual([self.allow()[0] for _ in range(4)], [True, True, True, False])
+
+    def test_buckets_are_per_client_and_kind(self):
+        for _ in range(3):
+            self.allow()
+        self.assertFalse(self.allow()[0])
+        self.assertTrue(self.allow(ip='10.0.0.2')[0])
+        self.assertEqual([self.allow(EmailTokenBucketThrottle)[0] for _ in range(3)], [True, True, False])
+        self.assertTrue(self.allow(EmailTokenBucketThrottle, email=' THROTTLE2@example.com')[0])
+        # Emails are compared case-insensitively.
+        self.assertFalse(self.allow(EmailTokenBucketThrottle, email='Throttle@Example.com ')[0])
+
+    def test_blocked_keys_are_kept_per_class(self):
+        self.assertIsNot(IPTokenBucketThrottle._blocked, EmailTokenBucketThrottle._blocked)
+        with mock.patch.object(EmailTokenBucketThrottle, 'max_blocked_keys', 1):
+            for ip in ('10.0.0.1', '10.0.0.2'):
+                for _ in range(4):
+                    self.allow(ip=ip)
+            for email in ('a@example.com', 'b@example.com'):
+                for _ in range(3):
+                    self.allow(EmailTokenBucketThrottle, email=email)
+        self.assertEqual(len(IPTokenBucketThrottle._blocked), 2)
+        self.assertEqual(len(EmailTokenBucketThrottle._blocked), 1)
+
+    def test_concurrent_requests_share_the_burst(self):
+        class SlowCache:
+            # Widens the window between reading and writing a bucket, as a network cache would.
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def get(self, *args):
+                value = cache.get(*args)
+                time.sleep(0.002)
+                return value
+
+        patcher = mock.patch.object(IPTokenBucketThrottle, 'cache', SlowCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        barrier = threading.Barrier(8)
+
+        def request(_):
+            barrier.wait()
+            return self.allow()[0]
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(request, range(8)))
+        self.assertEqual(results.count(True), 3)
+
+    def test_429_with_retry_after(self):
+        make_user('throttled')
+        for path in ('/api/users/login/', '/api/async/users/login/'):
+            cache.clear()
+            IPTokenBucketThrottle._blocked.clear()
+            EmailTokenBucketThrottle._blocked.clear()
+            with self.subTest(path=path):
+                statuses = [
+                    self.client.post(path, {'email': 'throttled@example.com', 'password': 'wrong'},
+                                     content_type='application/json').status_code
+                    for _ in range(2)
+                ]
+                self.assertEqual(statuses, [400, 400])
+                response = self.client.post(path, {'email': 'throttled@example.com', 'password': 'wrong'},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response['Retry-After'], '30')
+
+
+@bench_settings
+class ReplicaRoutingTests(TransactionTestCase):
+    """The router and sync_sqlite_replica against a real second SQLite file."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.replica_path = os.path.join(tmp.name, 'replica.sqlite3')
+        replica = ConnectionHandler().configure_settings({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.replica_path},
+        })['default']
+        connections.settings[REPLICA_DB_ALIAS] = replica
+        self.addCleanup(self.remove_replica)
+        settings_patcher = override_settings(DATABASES={**settings.DATABASES, REPLICA_DB_ALIAS: replica})
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+        # The alias only exists from here on, so it cannot be listed in `databases` up front.
+        patcher = mock.patch.object(type(self), 'databases', {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = make_user('routed')
+        call_command('sync_sqlite_replica', stdout=io.StringIO())
+        # Changed on the primary only, so each read shows which database answered.
+        User.objects.filter(pk=self.user.pk).update(first_name='primary')
+
+    def remove_replica(self):
+        connections[REPLICA_DB_ALIAS].close()
+        del connections[REPLICA_DB_ALIAS]
+        del connections.settings[REPLICA_DB_ALIAS]
+
+    def read(self):
+        return User.objects.get(pk=self.user.pk).first_name
+
+    def in_request(self, fn):
+        return PrimaryStickinessMiddleware(lambda request: fn())(None)
+
+    def test_reads_go_to_the_replica_in_requests(self):
+        self.assertEqual(self.in_request(self.read), '')
+        # Outside a request reads are never stale.
+        self.assertEqual(self.read(), 'primary')
+
+    def test_pinned_after_write(self):
+        def request():
+            before = self.read()
+            make_user('writer')
+            return before, self.read()
+
+        self.assertEqual(self.in_request(request), ('', 'primary'))
+        # Pinning ends with the request.
+        self.assertEqual(self.in_request(self.read), '')
+
+    def test_primary_inside_transaction(self):
+        def request():
+            with transaction.atomic():
+                return self.read()
+
+        self.assertEqual(self.in_request(request), 'primary')
+
+    def test_async_requests(self):
+        async def get_response(request):
+            return await User.objects.filter(pk=self.user.pk).values_list('first_name', flat=True).aget()
+
+        self.assertEqual(async_to_sync(PrimaryStickinessMiddleware(get_response))(None), '')
+
+    def test_sync_copies_the_primary(self):
+        out = io.StringIO()
+        call_command('sync_sqlite_replica', stdout=out)
+        self.assertIn(f"to {self.replica_path}", out.getvalue())
+        self.assertEqual(self.in_request(self.read), 'primary')
+        with contextlib.closing(sqlite3.connect(self.replica_path)) as replica:
+            self.assertEqual(replica.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+            self.assertEqual(replica.execute('SELECT COUNT(*) FROM authapp_user').fetchone(), (1,))
+
+    def test_sync_needs_a_replica(self):
+        with override_settings(DATABASES={'default': settings.DATABASES['default']}), \
+                mock.patch.dict(connections.settings, clear=False) as databases:
+            del databases[REPLICA_DB_ALIAS]
+            with self.assertRaisesMessage(CommandError, 'No replica configured'):
+                call_command('sync_sqlite_replica')
+
+
+class ImmediateAtomicTests(TransactionTestCase):
+    def begins(self, block):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            with block():
+                User.objects.exists()
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('BEGIN')]
+
+    def test_only_immediate_atomic_takes_the_write_lock(self):
+        self.assertEqual(self.begins(immediate_atomic), ['BEGIN IMMEDIATE'])
+        self.assertEqual(self.begins(transaction.atomic), ['BEGIN'])
+
+    def test_nested_blocks_are_savepoints(self):
+        with transaction.atomic():
+            self.assertEqual(self.begins(immediate_atomic), [])
+
+    def test_waits_for_another_writer(self):
+        # A deferred block that read first would fail at once with "database is locked".
+        other = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'],
+                                isolation_level=None, check_same_thread=False)
+        make_user('reader')
+        other.execute('BEGIN IMMEDIATE')
+        other.execute("UPDATE authapp_user SET first_name = 'other'")
+        threading.Timer(0.2, other.commit).start()
+        try:
+            with immediate_atomic():
+                User.objects.exists()
+                make_user('writer')
+        finally:
+            other.close()
+        self.assertEqual(sorted(User.objects.values_list('first_name', flat=True)), ['', 'other'])
+
+
+class FlakySMTPConnection:
+    """Stands in for the SMTP backend: fails the first ``failures`` sends, records the rest."""
+
+    def __init__(self, log, failures=0):
+        self.log = log
+        self.failures = failures
+
+    def __call__(self, fail_silently=False):
+        self.log.append('open')
+        return self
+
+    def open(self):
+        pass
+
+    def send_messages(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError('connection reset by peer')
+        self.log.extend(message.to[0] for message in messages)
+        return len(messages)
+
+    def close(self):
+        self.log.append('close')
+
+
+class MailOutboxTests(TestCase):
+    def outbox(self, connection_factory, **options):
+        return MailOutbox(**{'workers': 1, 'retry_backoff': 0.01, 'idle_timeout': 0.2,
+                             'connection_factory': connection_factory, **options})
+
+    def test_locmem(self):
+        outbox = self.outbox(get_connection)
+        for i in range(3):
+            outbox.enqueue(otp_email(f'user{i}@example.com', '123456'))
+        self.assertTrue(outbox.flush(timeout=10))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+
+    def test_console(self):
+        stream = io.StringIO()
+        outbox = self.outbox(lambda **kwargs: get_connection('django.core.mail.backends.console.EmailBackend',
+                                                             stream=stream, **kwargs))
+        outbox.enqueue(otp_email('console@example.com', '654321'))
+        self.assertTrue(outbox.flush(timeout=10))
+        self.assertIn('To: console@example.com', stream.getvalue())
+        self.assertIn('Your OTP code is 654321.', stream.getvalue())
+
+    def test_connection_reused_then_closed_when_idle(self):
+        log = []
+        outbox = self.outbox(FlakySMTPConnection(log), batch_size=10)
+        for i in range(3):
+            outbox.enqueue(otp_email(f'user{i}@example.com', '123456'))
+        self.assertTrue(outbox.flush(timeout=10))
+        deadline = time.monotonic() + 10
+        while log[-1] != 'close' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(log, ['open', 'user0@example.com', 'user1@example.com', 'user2@example.com', 'close'])
+
+    def test_retry_after_failure(self):
+        log = []
+        outbox = self.outbox(FlakySMTPConnection(log, failures=2))
+        with self.assertLogs('authapp.outbox', 'WARNING') as logs:
+            outbox.enqueue(otp_email('retry@example.com', '123456'))
+            self.assertTrue(outbox.flush(timeout=10))
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('retry@example.com', log)
+        self.assertEqual(log.count('open'), 3)
+        self.assertEqual(len(outbox.dead_letters), 0)
+
+    def test_dead_letter(self):
+        log = []
+        outbox = self.outbox(FlakySMTPConnection(log, failures=100), max_retries=2)
+        with self.assertLogs('authapp.outbox', 'WARNING') as logs:
+            outbox.enqueue(otp_email('lost@example.com', '123456'))
+            self.assertTrue(outbox.flush(timeout=10))
+        self.assertIn('dead-lettered after 3 attempts', logs.output[-1])
+        self.assertEqual([envelope.attempts for envelope in outbox.dead_letters], [3])
+        self.assertNotIn('lost@example.com', log)
+
+    @bench_settings
+    def test_inline_when_not_async(self):
+        send_message(otp_email('inline@example.com', '123456'))
+        self.assertEqual(mail.outbox[0].to, ['inline@example.com'])
+
+    @override_settings(OTP_MAIL_OUTBOX={'ASYNC': True}, AUTH_THROTTLE_RATES={},
+                       PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_full_outbox_is_503(self):
+        # No workers, so the one queue slot stays taken.
+        full = MailOutbox(workers=0, queue_size=1)
+        full.enqueue(otp_email('queued@example.com', '123456'))
+        with self.assertRaises(OutboxFull):
+            full.enqueue(otp_email('next@example.com', '123456'))
+
+        make_user('full')
+        with mock.patch('authapp.outbox._outbox', full), fresh_email_index():
+            for path in ('/api/users/send-otp/', '/api/users/reset-password/',
+                         '/api/async/users/send-otp/', '/api/async/users/reset-password/'):
+                with self.subTest(path=path):
+                    response = self.client.post(path, {'email': 'full@example.com'}, content_type='application/json')
+                    self.assertEqual(response.status_code, 503)
+                    self.assertEqual(response['Retry-After'], '5')
+
+
+def metric_value(name, **labels):
+    counters, histograms = instrumentation.snapshot()
+    key = (name, tuple(sorted(labels.items())))
+    return histograms[key][2] if key in histograms else counters.get(key, 0)
+
+
+@bench_settings
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(METRICS={'TOKEN': ''})
+    def test_staff_only_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(make_user('member'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(make_user('staff', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICS={'TOKEN': 's3cret'})
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.client.force_login(make_user('staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+    def test_requests_are_recorded_by_route(self):
+        user = make_user('recorded')
+        labels = {'route': 'api/users/profile/', 'method': 'GET', 'status': 200}
+        before = metric_value('http_request_duration_seconds', **labels)
+        queries = metric_value('http_request_db_queries_total', route='api/users/profile/')
+        for _ in range(2):
+            self.client.get('/api/users/profile/', headers=bearer(user))
+        self.assertEqual(metric_value('http_request_duration_seconds', **labels), before + 2)
+        self.assertGreater(metric_value('http_request_db_queries_total', route='api/users/profile/'), queries)
+        self.client.get('/nowhere/')
+        self.assertGreater(metric_value('http_request_duration_seconds', route='<unmatched>', method='GET',
+                                        status=404), 0)
+
+    def test_shards_are_summed(self):
+        before = metric_value('slow_request_profiles_total', route='test/threads')
+
+        def record():
+            for _ in range(100):
+                instrumentation.inc('slow_request_profiles_total', route='test/threads')
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metric_value('slow_request_profiles_total', route='test/threads'), before + 400)
+
+    def test_render(self):
+        histograms = {}
+        instrumentation.merge_histogram(histograms, ('mail_send_duration_seconds', (('mode', 'a"b'),)),
+                                        [1, 0, 2] + [0] * (len(instrumentation.BUCKETS) - 2), 3.5, 3)
+        counters = {('slow_request_profiles_total', (('route', 'x'),)): 2}
+        text = instrumentation.render(counters, histograms)
+        self.assertIn('slow_request_profiles_total{route="x"} 2\n', text)
+        self.assertIn('mail_send_duration_seconds_bucket{mode="a\\"b",le="0.001"} 1\n', text)
+        self.assertIn('mail_send_duration_seconds_bucket{mode="a\\"b",le="0.0025"} 1\n', text)
+        self.assertIn('mail_send_duration_seconds_bucket{mode="a\\"b",le="+Inf"} 3\n', text)
+        self.assertIn('mail_send_duration_seconds_count{mode="a\\"b"} 3\n', text)
+
+    def test_multiprocess_totals(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, '1.json'), 'w') as f:
+                json.dump({'counters': [['slow_request_profiles_total', [['route', 'elsewhere']], 5]],
+                           'histograms': []}, f)
+            with open(os.path.join(tmp, '2.json'), 'w') as f:
+                f.write('{"truncated')
+            counters, _ = instrumentation.collect({**instrumentation.get_metrics_settings(), 'MULTIPROCESS_DIR': tmp})
+            self.assertIn(instrumentation.flusher.filename(), os.listdir(tmp))
+        self.assertEqual(counters[('slow_request_profiles_total', (('route', 'elsewhere'),))], 5)
+
+    def test_reused_pid_keeps_the_old_totals(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Left behind by an exited worker that had this process's pid.
+            with open(os.path.join(tmp, f'{os.getpid()}.json'), 'w') as f:
+                json.dump({'counters': [['slow_request_profiles_total', [['route', 'exited']], 5]],
+                           'histograms': []}, f)
+            flusher = instrumentation.ProcessFlusher()
+            flusher.flush(tmp)
+            self.assertTrue(flusher.filename().startswith(f'{os.getpid()}-'))
+            self.assertNotEqual(flusher.filename(), instrumentation.ProcessFlusher().filename())
+            counters, _ = instrumentation.collect({**instrumentation.get_metrics_settings(), 'MULTIPROCESS_DIR': tmp})
+        self.assertEqual(counters[('slow_request_profiles_total', (('route', 'exited'),))], 5)
+
+    def test_slow_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(METRICS={'PROFILE_SAMPLE_RATE': 1.0, 'PROFILE_SLOW_MS': 0, 'PROFILE_DIR': tmp}):
+                self.client.get('/api/users/profile/', headers=bearer(make_user('profiled')))
+            self.assertEqual([name.split('-')[0] for name in os.listdir(tmp)], ['api_users_profile'])
+
+
+class LoadTestSetupTests(SimpleTestCase):
+    def test_load_tests_only_on_request(self):
+        self.assertIn('load', TestRunner().exclude_tags)
+        self.assertIn('load', TestRunner(exclude_tags=['slow']).exclude_tags)
+        self.assertNotIn('load', TestRunner(tags=['load']).exclude_tags)
+        suite = TestRunner(verbosity=0).build_suite(['authapp.tests.AuthLoadTests'])
+        self.assertEqual(suite.countTestCases(), 0)
+        suite = TestRunner(tags=['load'], verbosity=0).build_suite(['authapp.tests.AuthLoadTests'])
+        self.assertGreater(suite.countTestCases(), 0)
+
+    def test_results_written_only_when_asked(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            with override_settings(LOAD_TEST={**settings.LOAD_TEST, 'RESULTS_FILE': ''}):
+                write_results('auth', {'login': {'p50_ms': 1.0}})
+            self.assertEqual(os.listdir(tmp), [])
+            with override_settings(LOAD_TEST={**settings.LOAD_TEST, 'RESULTS_FILE': path}):
+                write_results('auth', {'login': {'p50_ms': 1.0}})
+                write_results('users', {'profile_get': {'p50_ms': 2.0}})
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report['endpoints'], {'auth': {'login': {'p50_ms': 1.0}},
+                                               'users': {'profile_get': {'p50_ms': 2.0}}})
+
+
+@tag('load')
+@bench_settings
+class AuthLoadTests(LiveServerTestCase):
+    """Concurrent clients against each auth endpoint; results go to LOAD_TEST['RESULTS_FILE']."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.requests = settings.LOAD_TEST['REQUESTS']
+        cls.concurrency = settings.LOAD_TEST['CONCURRENCY']
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        write_results('auth', cls.results)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, name, method, path, payload=lambda i: None, headers=lambda i: None, expected=200):
+        stats = run_load(
+            lambda i: http_request(self.live_server_url, method, path, payload(i), headers(i)),
+            self.requests, self.concurrency,
+        )
+        self.results[name] = stats
+        self.assertEqual(stats['statuses'], {str(expected): self.requests})
+
+    def users(self, prefix, **extra):
+        return [make_user(f'{prefix}{i}', **extra) for i in range(self.requests)]
+
+    def test_register(self):
+        self.load('register', 'POST', '/api/users/register/', payload=lambda i: {
+            'email': f'load{i}@example.com', 'username': f'load{i}', 'password': PASSWORD,
+        })
+
+    def test_login(self):
+        user = make_user('login')
+        self.load('login', 'POST', '/api/users/login/',
+                  payload=lambda i: {'email': user.email, 'password': PASSWORD})
+
+    def test_send_otp(self):
+        user = make_user('sendotp')
+        self.load('send_otp', 'POST', '/api/users/send-otp/', payload=lambda i: {'email': user.email})
+        self.assertEqual(len(mail.outbox), self.requests)
+
+    def test_verify_otp(self):
+        users = self.users('verify')
+        store = get_otp_store()
+        codes = [store.issue(user.email) for user in users]
+        self.load('verify_otp', 'POST', '/api/users/verify-otp/',
+                  payload=lambda i: {'email': users[i].email, 'code': codes[i]})
+        self.assertFalse(OTP.objects.exists())
+
+    def test_change_password(self):
+        users = self.users('change')
+        self.load('change_password', 'POST', '/api/users/change-password/',
+                  payload=lambda i: {'new_password': 'another-password'},
+                  headers=lambda i: bearer(users[i], otp_verified=True))
+
+    def test_reset_password(self):
+        user = make_user('reset')
+        self.load('reset_password', 'POST', '/api/users/reset-password/', payload=lambda i: {'email': user.email})
+
+    def test_token_refresh(self):
+        tokens = [get_tokens_for_user(user)['refresh'] for user in self.users('refresh')]
+        with fresh_blacklist():
+            self.load('token_refresh', 'POST', '/api/users/token/refresh/', payload=lambda i: {'refresh': tokens[i]})
@@ -0,0 +1,135 @@
+import hashlib
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Turn '10/min' into (capacity, tokens refilled per second): a client may
+    burst up to 10 requests and then gets one more every 6 seconds.
+    """
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttle configured per view through ``throttle_scope`` and
+    settings.AUTH_THROTTLE_RATES[scope][kind].
+
+    Bucket state lives in the shared cache so every worker sees the same
+    budget, and each read/update of a bucket holds a short lock taken with
+    ``cache.add()`` so concurrent requests cannot spend the same token. Keys
+    that were rejected are also remembered in-process (per throttle class)
+    until their next token is due, so repeated rejections never touch the
+    cache.
+    """
+    kind = None
+    cache = default_cache
+    timer = time.time
+    max_blocked_keys = 10000
+    # Seconds to wait for a bucket's lock before going ahead without it.
+    lock_wait = 0.1
+
+    # key -> timestamp before which the bucket is known to be empty
+    _blocked = {}
+    _blocked_lock = threading.Lock()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._blocked = {}
+        cls._blocked_lock = threading.Lock()
+
+    def __init__(self):
+        self._wait = None
+
+    def get_ident_value(self, request):
+        raise NotImplementedError('.get_ident_value() must be overridden')
+
+    def get_rate(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = settings.AUTH_THROTTLE_RATES.get(scope, {}).get(self.kind)
+        return scope, (parse_rate(rate) if rate else None)
+
+    def allow_request(self, request, view):
+        scope, rate = self.get_rate(view)
+        if rate is None:
+            return True
+        ident = self.get_ident_value(request)
+        if not ident:
+            return True
+
+        key = f"throttle:{scope}:{self.kind}:{ident}"
+        now = self.timer()
+        blocked_until = self._blocked.get(key)
+        if blocked_until is not None:
+            if blocked_until > now:
+                self._wait = blocked_until - now
+                return False
+            self._blocked.pop(key, None)
+
+        capacity, refill = rate
+        with self.bucket_lock(key):
+            now = self.timer()
+            tokens, stamp = self.cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - stamp) * refill)
+            if tokens < 1:
+                self._wait = (1 - tokens) / refill
+                self._block(key, now + self._wait)
+                return False
+            self.cache.set(key, (tokens - 1, now), timeout=math.ceil(capacity / refill))
+        return True
+
+    @contextmanager
+    def bucket_lock(self, key):
+        # cache.add() is atomic in every backend; the timeout frees the lock of a crashed worker.
+        lock = f"{key}:lock"
+        deadline = time.monotonic() + self.lock_wait
+        acquired = self.cache.add(lock, 1, timeout=1)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.001)
+            acquired = self.cache.add(lock, 1, timeout=1)
+        try:
+            yield
+        finally:
+            if acquired:
+                self.cache.delete(lock)
+
+    def _block(self, key, until):
+        with self._blocked_lock:
+            if len(self._blocked) >= self.max_blocked_keys:
+                now = self.timer()
+                for stale in [k for k, t in self._blocked.items() if t <= now]:
+                    del self._blocked[stale]
+                if len(self._blocked) >= self.max_blocked_keys:
+                    self._blocked.clear()
+            self._blocked[key] = until
+
+    def wait(self):
+        return self._wait
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'email'
+
+    def get_ident_value(self, request):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email:
+            return None
+        return hashlib.sha256(email.strip().lower().encode()).hexdigest()
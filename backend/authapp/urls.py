@@ -8,4 +8,5 @@ urlpatterns = [
     path('users/verify-otp/', views.VerifyOTPView.as_view()),
     path('users/change-password/', views.ChangePasswordView.as_view()),
     path('users/reset-password/', views.ResetPasswordRequestView.as_view()),
+    path('users/token/refresh/', views.TokenRefreshView.as_view()),
 ]
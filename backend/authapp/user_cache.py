@@ -0,0 +1,57 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class UserCache:
+    """
+    Bounded, per-process LRU of user instances with a TTL.
+
+    Entries are dropped explicitly when a user is saved or deleted in this
+    process (see authapp.signals); the TTL bounds how long a change made by
+    another worker can go unnoticed. Callers always get a private copy.
+    """
+
+    def __init__(self, max_size=10000, ttl=60, timer=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= self.timer():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        if self.max_size <= 0:
+            return
+        entry = (copy.copy(user), self.timer() + self.ttl)
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_conf = getattr(settings, 'USER_CACHE', {})
+user_cache = UserCache(max_size=_conf.get('MAX_SIZE', 10000), ttl=_conf.get('TTL', 60))
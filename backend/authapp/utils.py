@@ -1,11 +1,19 @@
 import random
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from django.conf import settings
 
+from .outbox import asend_message, send_message
+
 def generate_otp():
     return f"{random.randint(100000, 999999)}"
 
-def send_otp_email(email, code):
+def otp_email(email, code):
     subject = 'Your OTP Code'
     message = f'Your OTP code is {code}. It is valid for 15 minutes.'
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [email])
+    return EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [email])
+
+def send_otp_email(email, code):
+    send_message(otp_email(email, code))
+
+async def asend_otp_email(email, code):
+    await asend_message(otp_email(email, code))
@@ -1,13 +1,16 @@
+import time
+
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from ai_fitness_backend.apidocs import openapi, swagger_auto_schema
 from django.contrib.auth import get_user_model
 
 from .serializers import *
-from .models import OTP
-from .utils import send_otp_email, generate_otp
+from .authentication import CachedJWTAuthentication
+from .otp_store import get_otp_store
+from .throttling import IPTokenBucketThrottle, EmailTokenBucketThrottle
+from .utils import send_otp_email
 
 User = get_user_model()
 
@@ -15,6 +18,9 @@ User = get_user_model()
 def get_tokens_for_user(user, otp_verified=False):
     refresh = RefreshToken.for_user(user)
     refresh['otp_verified'] = otp_verified
+    if otp_verified:
+        # Lets token refresh keep the claim only while the verification is recent.
+        refresh['otp_verified_at'] = int(time.time())
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -42,13 +48,16 @@ class RegisterView(generics.CreateAPIView):
 
 class LoginView(generics.GenericAPIView):
     serializer_class = LoginSerializer
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'login'
 
     @swagger_auto_schema(
         operation_summary="Login with email and password",
         request_body=LoginSerializer,
         responses={
             200: openapi.Response("Login success", examples={"application/json": {"refresh": "token", "access": "token"}}),
-            400: openapi.Response("Invalid credentials")
+            400: openapi.Response("Invalid credentials"),
+            429: openapi.Response("Too many attempts, see Retry-After")
         },
         tags=["Authentication"]
     )
@@ -62,22 +71,25 @@ class LoginView(generics.GenericAPIView):
 
 class SendOTPView(generics.GenericAPIView):
     serializer_class = SendOTPSerializer
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'send_otp'
 
     @swagger_auto_schema(
         operation_summary="Send OTP to registered email",
         request_body=SendOTPSerializer,
         responses={
             200: openapi.Response("OTP sent", examples={"application/json": {"message": "OTP sent to your email"}}),
-            400: openapi.Response("Email not found or validation error")
+            400: openapi.Response("Email not found or validation error"),
+            429: openapi.Response("Too many requests, see Retry-After"),
+            503: openapi.Response("Mail queue full, see Retry-After")
         },
         tags=["Authentication"]
     )
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        otp_code = generate_otp()
-        otp = OTP.objects.create(email=serializer.validated_data['email'], code=otp_code)
-        send_otp_email(otp.email, otp.code)
+        email = serializer.validated_data['email']
+        send_otp_email(email, get_otp_store().issue(email, serializer.validated_data['user_id']))
         return Response({'message': 'OTP sent to your email'})
 
 
@@ -96,10 +108,7 @@ class VerifyOTPView(generics.GenericAPIView):
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        email = serializer.validated_data['email']
-        user = User.objects.get(email=email)
-        OTP.objects.filter(email=email).delete()
-        tokens = get_tokens_for_user(user, otp_verified=True)
+        tokens = get_tokens_for_user(serializer.validated_data['user'], otp_verified=True)
         return Response({'message': 'OTP verified', **tokens})
 
 
@@ -125,20 +134,49 @@ class ChangePasswordView(generics.GenericAPIView):
 
 class ResetPasswordRequestView(generics.GenericAPIView):
     serializer_class = ResetPasswordSerializer
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'reset_password'
 
     @swagger_auto_schema(
         operation_summary="Send OTP for password reset",
         request_body=ResetPasswordSerializer,
         responses={
             200: openapi.Response("Reset OTP sent", examples={"application/json": {"message": "Reset OTP sent"}}),
-            400: openapi.Response("User not found")
+            400: openapi.Response("User not found"),
+            429: openapi.Response("Too many requests, see Retry-After"),
+            503: openapi.Response("Mail queue full, see Retry-After")
         },
         tags=["Authentication"]
     )
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        otp_code = generate_otp()
-        otp = OTP.objects.create(email=serializer.validated_data['email'], code=otp_code)
-        send_otp_email(otp.email, otp.code)
+        email = serializer.validated_data['email']
+        send_otp_email(email, get_otp_store().issue(email, serializer.validated_data['user_id']))
         return Response({'message': 'Reset OTP sent'})
+
+
+class TokenRefreshView(generics.GenericAPIView):
+    serializer_class = TokenRefreshSerializer
+    authentication_classes = []
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'refresh'
+
+    @swagger_auto_schema(
+        operation_summary="Exchange a refresh token for a new access/refresh pair",
+        request_body=TokenRefreshSerializer,
+        responses={
+            200: openapi.Response("Tokens rotated", examples={"application/json": {"refresh": "token", "access": "token"}}),
+            401: openapi.Response("Invalid, expired or already used refresh token"),
+            429: openapi.Response("Too many requests, see Retry-After")
+        },
+        tags=["Authentication"]
+    )
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data)
+
+    def get_authenticate_header(self, request):
+        # No authentication classes run here, but token errors should still be 401s.
+        return CachedJWTAuthentication().authenticate_header(request)
@@ -1,8 +1,12 @@
 from django.contrib import admin
+from ai_fitness_backend.pagination import EstimatedCountPaginator
 from .models import UserProfile
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'age', 'gender', 'height_cm', 'weight_kg', 'goal')
-    search_fields = ('user__username', 'goal')
+    list_select_related = ('user',)
+    search_fields = ('^user__username', 'goal')
     list_filter = ('gender', 'goal')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
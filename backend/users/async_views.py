@@ -0,0 +1,66 @@
+"""Native async profile endpoint; same caching, ETag and If-Match semantics as UserProfileDetailView."""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import NotAuthenticated
+
+from ai_fitness_backend.async_api import async_api_view
+from ai_fitness_backend.renderers import dumps
+from ai_fitness_backend.startup import lazy_import
+from authapp.authentication import CachedJWTAuthentication
+from . import history
+from .cache import acache_profile_payload, aget_profile_payload, compute_etag, etag_matches
+from .models import UserProfile
+from .serializers import UserProfileSerializer
+
+metrics = lazy_import('users.metrics')
+
+
+def precondition_failed():
+    return JsonResponse(
+        {'detail': 'Profile was modified by another request. Reload and try again.'},
+        status=status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
+@async_api_view(['GET', 'PUT', 'PATCH'])
+async def profile(request):
+    result = await CachedJWTAuthentication().aauthenticate(request)
+    if result is None:
+        raise NotAuthenticated()
+    user = result[0]
+
+    if request.method == 'GET':
+        payload = await aget_profile_payload(user)
+        headers = {'ETag': payload['etag'], 'Cache-Control': 'private, no-cache'}
+        if etag_matches(payload['etag'], request.headers.get('If-None-Match')):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return HttpResponse(dumps(payload['data']), content_type='application/json', headers=headers)
+
+    instance, _ = await UserProfile.objects.select_related('user').aget_or_create(user=user)
+    serializer = UserProfileSerializer(instance, data=request.data, partial=request.method == 'PATCH')
+    # UserProfileSerializer has no database-backed validators, so validating here does not block.
+    serializer.is_valid(raise_exception=True)
+
+    if_match = request.headers.get('If-Match')
+    if if_match and not etag_matches(compute_etag(dict(UserProfileSerializer(instance).data)), if_match):
+        return precondition_failed()
+
+    changes = {
+        field: value for field, value in serializer.validated_data.items()
+        if getattr(instance, field) != value
+    }
+    if changes:
+        rows = UserProfile.objects.filter(pk=instance.pk)
+        if if_match:
+            rows = rows.filter(version=instance.version)
+        if not await sync_to_async(history.update_profile)(rows, user.pk, changes):
+            return precondition_failed()
+        before = metrics.snapshot(instance)
+        for field, value in changes.items():
+            setattr(instance, field, value)
+        instance.version += 1
+        await sync_to_async(metrics.apply_profile_changes)([(before, metrics.snapshot(instance))])
+
+    payload = await acache_profile_payload(user.pk, UserProfileSerializer(instance).data)
+    return HttpResponse(dumps(payload['data']), content_type='application/json', headers={'ETag': payload['etag']})
@@ -0,0 +1,69 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+
+from .models import UserProfile
+from .serializers import PROFILE_VALUES, empty_profile_row, profile_data
+
+
+def profile_cache_key(user_id):
+    return f"profile:{user_id}"
+
+
+def compute_etag(data):
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return '"%s"' % hashlib.sha256(body.encode()).hexdigest()[:32]
+
+
+def etag_matches(etag, header):
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def get_profile_payload(user):
+    """
+    Return ``{'data': ..., 'etag': ...}`` for the user's profile, serving it
+    from the cache when possible. A cold read is one joined SELECT of just
+    the serialized columns; users without a profile row get the empty profile
+    without anything being written. Invalidation reaches other workers only
+    when CACHES is shared between processes.
+    """
+    key = profile_cache_key(user.pk)
+    payload = cache.get(key)
+    if payload is None:
+        row = UserProfile.objects.filter(user_id=user.pk).values_list(*PROFILE_VALUES).first()
+        payload = cache_profile_payload(user.pk, profile_data(row or empty_profile_row(user)))
+    return payload
+
+
+def cache_profile_payload(user_id, data):
+    data = dict(data)
+    payload = {'data': data, 'etag': compute_etag(data)}
+    cache.set(profile_cache_key(user_id), payload, timeout=settings.PROFILE_CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_profile(user_id):
+    cache.delete(profile_cache_key(user_id))
+
+
+async def aget_profile_payload(user):
+    """get_profile_payload() for async views."""
+    key = profile_cache_key(user.pk)
+    payload = await cache.aget(key)
+    if payload is None:
+        row = await UserProfile.objects.filter(user_id=user.pk).values_list(*PROFILE_VALUES).afirst()
+        payload = await acache_profile_payload(user.pk, profile_data(row or empty_profile_row(user)))
+    return payload
+
+
+async def acache_profile_payload(user_id, data):
+    data = dict(data)
+    payload = {'data': data, 'etag': compute_etag(data)}
+    await cache.aset(profile_cache_key(user_id), payload, timeout=settings.PROFILE_CACHE_TIMEOUT)
+    return payload
@@ -0,0 +1,209 @@
+"""
+Measurement history and its rollups.
+
+Every profile write that changes a tracked field appends a Measurement and
+folds the value into the user's day, week and month MeasurementRollup rows
+in the same transaction, so nothing is ever recomputed from raw history
+(``manage.py rebuild_measurement_rollups`` does that after manual edits).
+``series()`` serves a date range from the finest resolution that fits the
+caller's point budget.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import Measurement, MeasurementRollup
+
+TRACKED = [code for code, _ in Measurement.METRIC_CHOICES]
+RESOLUTIONS = [code for code, _ in MeasurementRollup.RESOLUTION_CHOICES]
+# What one measurement, or several in the same period, adds to a rollup row.
+DELTA_FIELDS = ('count', 'total', 'minimum', 'maximum', 'last', 'last_at')
+
+
+def period_start(resolution, day):
+    if resolution == 'day':
+        return day
+    if resolution == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_count(resolution, start, end):
+    """Number of ``resolution`` periods touching the inclusive date range."""
+    if resolution == 'day':
+        return (end - start).days + 1
+    if resolution == 'week':
+        return (period_start('week', end) - period_start('week', start)).days // 7 + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def record(user_id, changes, at=None):
+    record_many([(user_id, changes, at or timezone.now())])
+
+
+def record_many(entries):
+    """
+    Append measurements for the tracked fields in each ``(user_id, changes,
+    at)`` entry and fold them into the rollups. Call inside the transaction
+    that writes the profiles.
+    """
+    measurements = []
+    deltas = {}
+    for user_id, changes, at in entries:
+        for metric in TRACKED:
+            if changes.get(metric) is not None:
+                value = float(changes[metric])
+                measurements.append(Measurement(user_id=user_id, metric=metric, value=value, recorded_at=at))
+                accumulate(deltas, user_id, metric, value, at)
+    if not measurements:
+        return
+    Measurement.objects.bulk_create(measurements)
+    apply_deltas(deltas)
+
+
+def accumulate(deltas, user_id, metric, value, at):
+    """Fold one measurement into ``{(user_id, metric, resolution, period_start): [*DELTA_FIELDS]}``."""
+    day = timezone.localdate(at)
+    for resolution in RESOLUTIONS:
+        key = (user_id, metric, resolution, period_start(resolution, day))
+        delta = deltas.get(key)
+        if delta is None:
+            deltas[key] = [1, value, value, value, value, at]
+            continue
+        delta[0] += 1
+        delta[1] += value
+        delta[2] = min(delta[2], value)
+        delta[3] = max(delta[3], value)
+        if at >= delta[5]:
+            delta[4], delta[5] = value, at
+
+
+def rollup_rows(deltas, keys):
+    return [
+        MeasurementRollup(user_id=user_id, metric=metric, resolution=resolution, period_start=start,
+                          **dict(zip(DELTA_FIELDS, deltas[(user_id, metric, resolution, start)])))
+        for user_id, metric, resolution, start in keys
+    ]
+
+
+def fold(count, total, minimum, maximum, last, last_at):
+    """UPDATE expressions adding one delta to a rollup row (right-hand sides see the old row)."""
+    return {
+        'count': F('count') + count,
+        'total': F('total') + total,
+        'minimum': Least('minimum', Value(minimum)),
+        'maximum': Greatest('maximum', Value(maximum)),
+        'last': Case(When(last_at__lte=last_at, then=Value(last)), default=F('last')),
+        'last_at': Greatest('last_at', Value(last_at)),
+    }
+
+
+def apply_deltas(deltas):
+    users = {key[0] for key in deltas}
+    existing = {
+        (user_id, metric, resolution, start): pk
+        for pk, user_id, metric, resolution, start in MeasurementRollup.objects.filter(
+            user_id__in=users, period_start__in={key[3] for key in deltas},
+        ).values_list('pk', 'user_id', 'metric', 'resolution', 'period_start')
+    }
+    # One measurement gives its day, week and month rows the same delta: one UPDATE for all three.
+    updates = defaultdict(list)
+    missing = []
+    for key, delta in deltas.items():
+        if key in existing:
+            updates[tuple(delta)].append(existing[key])
+        else:
+            missing.append(key)
+    for delta, pks in updates.items():
+        MeasurementRollup.objects.filter(pk__in=pks).update(**fold(*delta))
+    if not missing:
+        return
+    new_rows = rollup_rows(deltas, missing)
+    try:
+        with transaction.atomic():
+            MeasurementRollup.objects.bulk_create(new_rows)
+    except IntegrityError:
+        # A concurrent writer created some of these periods first; fold into its rows.
+        for row in new_rows:
+            rows = MeasurementRollup.objects.filter(user_id=row.user_id, metric=row.metric,
+                                                    resolution=row.resolution, period_start=row.period_start)
+            if not rows.update(**fold(*(getattr(row, name) for name in DELTA_FIELDS))):
+                row.save()
+
+
+def update_profile(rows, user_id, changes):
+    """
+    Apply ``changes`` to the profile selected by ``rows`` and record them in
+    the history, atomically. Returns False if no row matched (e.g. a failed
+    version check).
+    """
+    if not any(field in TRACKED for field in changes):
+        return bool(rows.update(**changes, version=F('version') + 1, updated_at=timezone.now()))
+    with transaction.atomic():
+        if not rows.update(**changes, version=F('version') + 1, updated_at=timezone.now()):
+            return False
+        record(user_id, changes)
+    return True
+
+
+def day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (datetime.datetime.combine(start, datetime.time.min, tzinfo=tz),
+            datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz))
+
+
+def series(user_id, metric, start, end, points, resolution='auto'):
+    """
+    Return ``(resolution, points)`` for ``metric`` between the ``start`` and
+    ``end`` dates (inclusive). 'auto' returns raw measurements when there are
+    at most ``points`` of them, otherwise the finest rollup resolution with at
+    most ``points`` periods in the range. When even that is too many (months
+    over a long range, or an explicit resolution), consecutive periods are
+    merged so no more than ``points`` come back, each starting at the first
+    period it covers.
+    """
+    if resolution in ('auto', 'raw'):
+        since, until = day_bounds(start, end)
+        rows = list(
+            Measurement.objects.filter(user_id=user_id, metric=metric, recorded_at__gte=since,
+                                       recorded_at__lt=until)
+            .order_by('recorded_at').values_list('recorded_at', 'value')[:points + 1]
+        )
+        # Explicit 'raw' returns the first `points` measurements of the range.
+        if resolution == 'raw' or len(rows) <= points:
+            return 'raw', [{'recorded_at': at, 'value': value} for at, value in rows[:points]]
+        resolution = next((r for r in RESOLUTIONS if period_count(r, start, end) <= points), RESOLUTIONS[-1])
+
+    rows = (
+        MeasurementRollup.objects.filter(user_id=user_id, metric=metric, resolution=resolution,
+                                         period_start__gte=period_start(resolution, start),
+                                         period_start__lte=end)
+        .order_by('period_start')
+        .values_list('period_start', 'count', 'total', 'minimum', 'maximum', 'last')
+    )
+    size = -(-period_count(resolution, start, end) // points)
+    if size > 1:
+        rows = merge_periods(resolution, start, rows, size)
+    return resolution, [
+        {'period_start': period, 'count': count, 'min': minimum, 'max': maximum,
+         'mean': round(total / count, 3), 'last': last}
+        for period, count, total, minimum, maximum, last in rows
+    ]
+
+
+def merge_periods(resolution, start, rows, size):
+    """Fold rollup ``rows`` (in period order) into one row per ``size`` periods from ``start``."""
+    first = period_start(resolution, start)
+    merged = {}
+    for period, count, total, minimum, maximum, last in rows:
+        bucket = (period_count(resolution, first, period) - 1) // size
+        if bucket not in merged:
+            merged[bucket] = [period, count, total, minimum, maximum, last]
+        else:
+            row = merged[bucket]
+            row[1:] = row[1] + count, row[2] + total, min(row[3], minimum), max(row[4], maximum), last
+    return merged.values()
@@ -0,0 +1,79 @@
+import time
+import timeit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from ai_fitness_backend.renderers import FastJSONRenderer, orjson
+from authapp.views import get_tokens_for_user
+from users.models import UserProfile
+from users.serializers import PROFILE_VALUES, UserProfileSerializer, profile_data
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark the profile and token response paths: UserProfileSerializer against the "
+        "values_list() fast path, and DRF's JSONRenderer against FastJSONRenderer. Every pair is "
+        "checked for identical output before it is timed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000, help="Calls per timing run.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timing runs; the fastest is reported.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stdout.write(f"JSON encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib (orjson not installed)'}")
+
+        stamp = time.time_ns()
+        user = User.objects.create_user(email=f'bench-serial-{stamp}@example.invalid',
+                                        username=f'bench-serial-{stamp}', password=None)
+        try:
+            UserProfile.objects.create(user=user, age=34, gender='F', height_cm=168.5, weight_kg=61.2,
+                                       goal='stay_fit')
+            self.run(user)
+        finally:
+            user.delete()
+
+    def run(self, user):
+        instance = UserProfile.objects.select_related('user').get(user=user)
+        row = UserProfile.objects.filter(user=user).values_list(*PROFILE_VALUES).get()
+        data = profile_data(row)
+        tokens = {'message': 'OTP verified', **get_tokens_for_user(user, otp_verified=True)}
+        stdlib, fast = JSONRenderer(), FastJSONRenderer()
+
+        self.stdout.write(f"{'':<28}{'current us':>12}{'fast us':>12}{'speed-up':>10}")
+        self.compare(
+            'profile serialize',
+            lambda: dict(UserProfileSerializer(instance).data),
+            lambda: profile_data(row),
+        )
+        self.compare(
+            'profile read + serialize',
+            lambda: dict(UserProfileSerializer(
+                UserProfile.objects.select_related('user').filter(user_id=user.pk).first()).data),
+            lambda: profile_data(UserProfile.objects.filter(user_id=user.pk).values_list(*PROFILE_VALUES).first()),
+        )
+        self.compare('profile render', lambda: stdlib.render(data), lambda: fast.render(data))
+        self.compare('token render', lambda: stdlib.render(tokens), lambda: fast.render(tokens))
+        self.compare(
+            'profile end to end',
+            lambda: stdlib.render(UserProfileSerializer(
+                UserProfile.objects.select_related('user').filter(user_id=user.pk).first()).data),
+            lambda: fast.render(profile_data(
+                UserProfile.objects.filter(user_id=user.pk).values_list(*PROFILE_VALUES).first())),
+        )
+
+    def compare(self, label, current, fast):
+        if current() != fast():
+            self.stderr.write(f"{label}: outputs differ\n  current: {current()!r}\n  fast:    {fast()!r}")
+            return
+        current_us, fast_us = self.time(current), self.time(fast)
+        self.stdout.write(f"{label:<28}{current_us:>12.2f}{fast_us:>12.2f}{current_us / fast_us:>9.1f}x")
+
+    def time(self, fn):
+        number = self.options['number']
+        return min(timeit.repeat(fn, number=number, repeat=self.options['repeat'])) / number * 1e6
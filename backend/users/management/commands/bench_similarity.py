@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.metrics import GENDERS, GOALS
+from users.similarity import Build, partition_keys, write_build
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the similar-user index on synthetic profiles: build time, size on disk and "
+        "top-k query latency against a brute-force NumPy scan of the same partition, whose "
+        "results every checked query must match. Nothing touches the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1000000, help="Synthetic profiles to index.")
+        parser.add_argument('--queries', type=int, default=1000, help="Queries timed.")
+        parser.add_argument('--k', type=int, default=10, help="Neighbours per query.")
+        parser.add_argument('--leaf-size', type=int, default=64, help="Points per KD-tree leaf.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        keys, vectors = self.synthetic(rng, options['profiles'])
+        ids = np.arange(1, len(keys) + 1, dtype=np.int64)
+
+        with tempfile.TemporaryDirectory() as root:
+            start = time.perf_counter()
+            name = write_build(root, keys, vectors, ids, timezone.now(), options['leaf_size'])
+            build_seconds = time.perf_counter() - start
+            size = sum(entry.stat().st_size for entry in os.scandir(os.path.join(root, name)))
+            start = time.perf_counter()
+            build = Build(root, name)
+            open_ms = (time.perf_counter() - start) * 1000
+            self.stdout.write(f"{len(ids):,} profiles: built in {build_seconds:.1f}s, "
+                              f"{size / 2 ** 20:.1f} MiB on disk, mapped in {open_ms:.2f} ms")
+            self.run_queries(build, rng.choice(len(ids), options['queries']), keys, vectors, options['k'])
+
+    def synthetic(self, rng, count):
+        gender = rng.choice(np.array(GENDERS, dtype=object), count, p=[0.48, 0.48, 0.04])
+        goal = rng.choice(np.array(GOALS, dtype=object), count)
+        age = rng.integers(16, 80, count).astype(float)
+        height = np.where(gender == 'M', rng.normal(177, 7, count), rng.normal(164, 7, count)).round(1)
+        weight = (rng.normal(25, 4, count).clip(15, 45) * (height / 100) ** 2).round(1)
+        return partition_keys(gender, goal), np.column_stack([age, height, weight])
+
+    def run_queries(self, build, samples, keys, vectors, k):
+        points = build.scaled(vectors)
+        tree_ms, scan_ms, mismatches = [], [], 0
+        for i in samples:
+            query, key = points[i], int(keys[i])
+            start = time.perf_counter()
+            distances, _ = build.search(key, query, k)
+            tree_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            part = build.partitions[key]
+            scan = ((build.points[part['start']:part['end']] - query) ** 2).sum(axis=1)
+            expected = np.partition(scan, k - 1)[:k] if len(scan) > k else scan
+            scan_ms.append((time.perf_counter() - start) * 1000)
+            mismatches += not np.allclose(np.sort(distances), np.sort(expected))
+
+        self.stdout.write(f"{'top-' + str(k):<14}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        for label, times in (('kd-tree', tree_ms), ('full scan', scan_ms)):
+            self.stdout.write(f"{label:<14}{np.percentile(times, 50):>10.3f}{np.percentile(times, 99):>10.3f}"
+                              f"{np.mean(times):>10.3f}")
+        if mismatches:
+            self.stderr.write(f"{mismatches} of {len(samples)} queries differ from the full scan.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {len(samples)} queries match the full scan."))
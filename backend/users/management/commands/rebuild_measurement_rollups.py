@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users import history
+from users.models import Measurement, MeasurementRollup, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute measurement rollups from the raw history, user by user, for use after history rows "
+        "were edited or deleted by hand. With --seed, first give every profile that has no history a "
+        "measurement of its current values, so charts start from what was stored before history existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help="Record current profile values for users without any measurements.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Users rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['batch_size'])
+
+        user_ids = list(Measurement.objects.order_by('user_id').values_list('user_id', flat=True).distinct())
+        size = options['batch_size']
+        rows = 0
+        for i in range(0, len(user_ids), size):
+            batch = user_ids[i:i + size]
+            deltas = {}
+            for user_id, metric, value, at in (
+                Measurement.objects.filter(user_id__in=batch)
+                .values_list('user_id', 'metric', 'value', 'recorded_at').iterator(chunk_size=5000)
+            ):
+                history.accumulate(deltas, user_id, metric, value, at)
+            with transaction.atomic():
+                MeasurementRollup.objects.filter(user_id__in=batch).delete()
+                MeasurementRollup.objects.bulk_create(history.rollup_rows(deltas, deltas), batch_size=1000)
+            rows += len(deltas)
+        # Users whose measurements are all gone keep no rollups either.
+        MeasurementRollup.objects.exclude(user_id__in=Measurement.objects.values('user_id')).delete()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup row(s) for {len(user_ids)} user(s)."))
+
+    def seed(self, batch_size):
+        profiles = (
+            UserProfile.objects.exclude(user_id__in=Measurement.objects.values('user_id'))
+            .values_list('user_id', 'updated_at', *history.TRACKED)
+        )
+        entries = [
+            (user_id, dict(zip(history.TRACKED, values)), updated_at)
+            for user_id, updated_at, *values in profiles.iterator(chunk_size=5000)
+        ]
+        for i in range(0, len(entries), batch_size):
+            with transaction.atomic():
+                history.record_many(entries[i:i + batch_size])
+        self.stdout.write(f"Seeded history for {len(entries)} profile(s).")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.similarity import SimilarityIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the similar-user index from the profile table and publish it to every worker on "
+        "this host. Workers also rebuild in the background once the index is old or many profiles "
+        "have changed, or when there is none yet (answering 503 meanwhile); run this on deploy and "
+        "from cron to avoid both."
+    )
+
+    def handle(self, *args, **options):
+        index = SimilarityIndex.from_settings()
+        start = time.perf_counter()
+        count = index.rebuild()
+        if count is None:
+            raise CommandError(f"Another process is rebuilding the index in {index.path}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} profile(s) into {index.path}/{index.current_name()} "
+            f"in {time.perf_counter() - start:.1f}s."))
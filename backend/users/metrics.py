@@ -0,0 +1,233 @@
+import math
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import UserProfile
+
+# Mifflin-St Jeor sex constant; 'O' uses the midpoint of the two.
+SEX_OFFSET = {'M': 5.0, 'F': -161.0, 'O': -78.0}
+# Daily kcal adjustment applied to maintenance (TDEE) for each goal.
+GOAL_ADJUSTMENT = {'lose_weight': -500.0, 'gain_muscle': 300.0, 'stay_fit': 0.0}
+# Lightly active; BMR x factor = maintenance calories.
+ACTIVITY_FACTOR = 1.375
+
+AGE_BANDS = ['<18', '18-29', '30-39', '40-49', '50-59', '60+']
+AGE_BAND_EDGES = np.array([18, 30, 40, 50, 60])
+
+GENDERS = [code for code, _ in UserProfile.GENDER_CHOICES]
+GOALS = [code for code, _ in UserProfile.GOAL_CHOICES]
+COLUMNS = ('user_id', 'age', 'gender', 'height_cm', 'weight_kg', 'goal')
+
+COHORT_CACHE_KEY = 'metrics:cohorts'
+# Seconds apply_profile_changes() waits for another writer's update of the cached sums.
+COHORT_LOCK_WAIT = 0.1
+
+
+def compute_metrics(age, gender, height_cm, weight_kg, goal):
+    """
+    Vectorized BMI, BMR (Mifflin-St Jeor) and goal-adjusted TDEE.
+
+    Takes equal-length arrays (gender/goal as code strings, missing values
+    as NaN/None) and returns a dict of float arrays; rows with missing
+    inputs come back as NaN.
+    """
+    age = np.asarray(age, dtype=float)
+    height_cm = np.asarray(height_cm, dtype=float)
+    weight_kg = np.asarray(weight_kg, dtype=float)
+    gender = np.asarray(gender, dtype=object)
+    goal = np.asarray(goal, dtype=object)
+
+    height_m = height_cm / 100.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = np.where(height_m > 0, weight_kg / (height_m * height_m), np.nan)
+
+    offset = np.full(age.shape, np.nan)
+    for code, value in SEX_OFFSET.items():
+        offset[gender == code] = value
+    bmr = 10.0 * weight_kg + 6.25 * height_cm - 5.0 * age + offset
+
+    adjustment = np.full(age.shape, np.nan)
+    for code, value in GOAL_ADJUSTMENT.items():
+        adjustment[goal == code] = value
+    tdee = bmr * ACTIVITY_FACTOR + adjustment
+
+    return {'bmi': bmi, 'bmr': bmr, 'tdee': tdee}
+
+
+def bmi_category(bmi):
+    if bmi is None or np.isnan(bmi):
+        return None
+    if bmi < 18.5:
+        return 'underweight'
+    if bmi < 25:
+        return 'normal'
+    if bmi < 30:
+        return 'overweight'
+    return 'obese'
+
+
+def profile_metrics(data):
+    """Metrics for one serialized profile (as returned by the profile endpoint)."""
+    columns = to_columns([tuple(data.get(name) for name in COLUMNS[1:])])
+    metrics = compute_metrics(**columns)
+    result = {name: (None if np.isnan(values[0]) else round(float(values[0]), 1)) for name, values in metrics.items()}
+    result['bmi_category'] = bmi_category(result['bmi'])
+    return result
+
+
+def iter_columns(queryset, chunk_size=5000):
+    """
+    Stream ``queryset`` as columnar NumPy chunks: yields a dict of arrays
+    keyed by COLUMNS, each at most ``chunk_size`` long.
+    """
+    rows = queryset.values_list(*COLUMNS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            return
+        columns = to_columns([row[1:] for row in chunk])
+        columns['user_id'] = np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk))
+        yield columns
+
+
+def float_column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def to_columns(rows):
+    """Turn (age, gender, height_cm, weight_kg, goal) tuples into NumPy columns."""
+    age, gender, height_cm, weight_kg, goal = zip(*rows)
+    return {
+        'age': float_column(age),
+        'gender': np.array(gender, dtype=object),
+        'height_cm': float_column(height_cm),
+        'weight_kg': float_column(weight_kg),
+        'goal': np.array(goal, dtype=object),
+    }
+
+
+def age_band(age):
+    """Index into AGE_BANDS for each age (array in, array out)."""
+    return np.searchsorted(AGE_BAND_EDGES, age, side='right')
+
+
+def cohort_keys(columns):
+    """
+    Encode (gender, goal, age band) as one integer per row, or -1 where any
+    dimension is missing, so cohorts can be summed with np.bincount.
+    """
+    gender_idx = np.full(len(columns['age']), -1)
+    for i, code in enumerate(GENDERS):
+        gender_idx[columns['gender'] == code] = i
+    goal_idx = np.full(len(columns['age']), -1)
+    for i, code in enumerate(GOALS):
+        goal_idx[columns['goal'] == code] = i
+    band_idx = age_band(np.nan_to_num(columns['age'], nan=-1))
+    keys = (gender_idx * len(GOALS) + goal_idx) * len(AGE_BANDS) + band_idx
+    return np.where((gender_idx < 0) | (goal_idx < 0) | np.isnan(columns['age']), -1, keys)
+
+
+def decode_cohort(key):
+    rest, band = divmod(key, len(AGE_BANDS))
+    gender, goal = divmod(rest, len(GOALS))
+    return GENDERS[gender], GOALS[goal], AGE_BANDS[band]
+
+
+def empty_sums():
+    size = len(GENDERS) * len(GOALS) * len(AGE_BANDS)
+    return {name: np.zeros(size) for name in ('count', 'bmi', 'bmr', 'tdee')}
+
+
+def accumulate(sums, columns, sign=1.0):
+    """Add (or with sign=-1, remove) the rows in ``columns`` to the cohort sums."""
+    metrics = compute_metrics(*(columns[name] for name in COLUMNS[1:]))
+    keys = cohort_keys(columns)
+    valid = (keys >= 0) & ~np.isnan(metrics['bmi']) & ~np.isnan(metrics['tdee'])
+    size = len(sums['count'])
+    sums['count'] += sign * np.bincount(keys[valid], minlength=size)
+    for name in ('bmi', 'bmr', 'tdee'):
+        sums[name] += sign * np.bincount(keys[valid], weights=metrics[name][valid], minlength=size)
+    return sums
+
+
+def build_cohort_sums(chunk_size=5000):
+    sums = empty_sums()
+    for columns in iter_columns(UserProfile.objects.all(), chunk_size=chunk_size):
+        accumulate(sums, columns)
+    return sums
+
+
+def get_cohort_sums():
+    entry = cache.get(COHORT_CACHE_KEY)
+    if entry is None or time.time() - entry['built_at'] >= settings.COHORT_METRICS_TIMEOUT:
+        entry = {'built_at': time.time(), 'sums': build_cohort_sums()}
+        cache.set(COHORT_CACHE_KEY, entry, timeout=settings.COHORT_METRICS_TIMEOUT)
+    return entry['sums']
+
+
+def cohort_aggregates():
+    sums = get_cohort_sums()
+    results = []
+    for key in np.flatnonzero(sums['count'] > 0.5):
+        gender, goal, band = decode_cohort(int(key))
+        count = sums['count'][key]
+        results.append({
+            'gender': gender,
+            'goal': goal,
+            'age_band': band,
+            'count': int(round(count)),
+            'mean_bmi': round(float(sums['bmi'][key] / count), 1),
+            'mean_bmr': round(float(sums['bmr'][key] / count), 1),
+            'mean_tdee': round(float(sums['tdee'][key] / count), 1),
+        })
+    return results
+
+
+def snapshot(profile):
+    """The fields a profile contributes to cohort aggregates, for apply_profile_changes()."""
+    return tuple(getattr(profile, name) for name in COLUMNS[1:])
+
+
+@contextmanager
+def cohort_lock():
+    # cache.add() is atomic in every backend; the timeout frees the lock of a crashed worker.
+    lock = f"{COHORT_CACHE_KEY}:lock"
+    deadline = time.monotonic() + COHORT_LOCK_WAIT
+    acquired = cache.add(lock, 1, timeout=1)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.001)
+        acquired = cache.add(lock, 1, timeout=1)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock)
+
+
+def apply_profile_changes(changes):
+    """
+    Fold ``[(before_snapshot, after_snapshot), ...]`` into the cached cohort
+    sums instead of recomputing them. Does nothing when nothing is cached;
+    the next read rebuilds from the table. Updates hold a lock so concurrent
+    writers cannot lose each other's deltas; when it cannot be had the sums
+    are dropped instead. They keep the expiry of the build they started
+    from, so drift from writes that bypass this hook lasts at most
+    COHORT_METRICS_TIMEOUT.
+    """
+    if not changes:
+        return
+    with cohort_lock() as locked:
+        entry = cache.get(COHORT_CACHE_KEY)
+        if entry is None:
+            return
+        remaining = entry['built_at'] + settings.COHORT_METRICS_TIMEOUT - time.time()
+        if not locked or remaining <= 0:
+            cache.delete(COHORT_CACHE_KEY)
+            return
+        accumulate(entry['sums'], to_columns([before for before, _ in changes]), sign=-1.0)
+        accumulate(entry['sums'], to_columns([after for _, after in changes]))
+        cache.set(COHORT_CACHE_KEY, entry, timeout=math.ceil(remaining))
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -23,6 +24,66 @@ class UserProfile(models.Model):
     weight_kg = models.FloatField(null=True, blank=True)
     goal = models.CharField(max_length=20, choices=GOAL_CHOICES, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on every write; guards conditional (If-Match) updates.
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # Changed-since scans (users.similarity refreshes).
+            models.Index(fields=['updated_at'], name='profile_updated_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s profile"
+
+
+class Measurement(models.Model):
+    """Append-only history of profile measurements, one row per changed value."""
+    METRIC_CHOICES = (
+        ('weight_kg', 'Weight (kg)'),
+        ('height_cm', 'Height (cm)'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='measurements')
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    value = models.FloatField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'metric', 'recorded_at'], name='measurement_user_metric_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric}={self.value} at {self.recorded_at:%Y-%m-%d %H:%M}"
+
+
+class MeasurementRollup(models.Model):
+    """
+    Per-period min/max/sum/count/last of one user's metric, kept up to date as
+    measurements are recorded (see users.history), so charts over long ranges
+    read one row per period instead of every measurement.
+    """
+    RESOLUTION_CHOICES = (
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='measurement_rollups')
+    metric = models.CharField(max_length=20, choices=Measurement.METRIC_CHOICES)
+    resolution = models.CharField(max_length=5, choices=RESOLUTION_CHOICES)
+    period_start = models.DateField()
+    count = models.PositiveIntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    last = models.FloatField()
+    last_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'metric', 'resolution', 'period_start'],
+                                    name='rollup_user_metric_period_uniq'),
+        ]
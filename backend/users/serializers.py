@@ -1,10 +1,14 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import UserProfile
+from .models import Measurement, UserProfile
 
 class UserProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True, help_text="User's username")
     email = serializers.EmailField(source='user.email', read_only=True, help_text="User's email address")
-    age = serializers.IntegerField(required=False, help_text="User's age")
+    age = serializers.IntegerField(required=False, min_value=0, help_text="User's age")
     gender = serializers.ChoiceField(
         choices=UserProfile.GENDER_CHOICES,
         required=False,
@@ -21,3 +25,81 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['username', 'email', 'age', 'gender', 'height_cm', 'weight_kg', 'goal']
+
+
+class BulkUserProfileSerializer(UserProfileSerializer):
+    user_id = serializers.IntegerField(read_only=True, help_text="Owning user's id")
+
+    class Meta(UserProfileSerializer.Meta):
+        fields = ['user_id'] + UserProfileSerializer.Meta.fields
+
+
+
+class MeasurementHistoryQuerySerializer(serializers.Serializer):
+    metric = serializers.ChoiceField(choices=Measurement.METRIC_CHOICES, default='weight_kg')
+    start = serializers.DateField(required=False, help_text="First day (default: 90 days before end)")
+    end = serializers.DateField(required=False, help_text="Last day, inclusive (default: today)")
+    points = serializers.IntegerField(min_value=1, default=100, help_text="Maximum number of points returned")
+    resolution = serializers.ChoiceField(
+        choices=['auto', 'raw', 'day', 'week', 'month'],
+        default='auto',
+        help_text="auto picks raw measurements or the finest rollup that fits in `points`"
+    )
+
+    def validate_points(self, points):
+        if points > settings.MEASUREMENT_HISTORY_MAX_POINTS:
+            raise serializers.ValidationError(f"At most {settings.MEASUREMENT_HISTORY_MAX_POINTS} points.")
+        return points
+
+    def validate(self, data):
+        data['end'] = data.get('end') or timezone.localdate()
+        data['start'] = data.get('start') or data['end'] - datetime.timedelta(days=90)
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'start': ["Must not be after end."]})
+        return data
+
+
+# Columns read by the profile fast path, in UserProfileSerializer.Meta.fields order.
+PROFILE_VALUES = ('user__username', 'user__email', 'age', 'gender', 'height_cm', 'weight_kg', 'goal')
+
+
+def profile_data(row):
+    """
+    ``UserProfileSerializer(profile).data`` built straight from a
+    ``values_list(*PROFILE_VALUES)`` row, skipping model instantiation and
+    per-field serializer dispatch. users.tests.ProfileFastPathTests keep the
+    two in step.
+    """
+    username, email, age, gender, height_cm, weight_kg, goal = row
+    return {
+        'username': str(username),
+        'email': str(email),
+        'age': None if age is None else int(age),
+        'gender': gender,
+        'height_cm': None if height_cm is None else float(height_cm),
+        'weight_kg': None if weight_kg is None else float(weight_kg),
+        'goal': goal,
+    }
+
+
+def empty_profile_row(user):
+    """The PROFILE_VALUES row of a user who has no profile yet."""
+    return (user.username, user.email, None, None, None, None, None)
+
+
+class UserExportQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False, help_text="Only users who joined at or after this time")
+    after_id = serializers.IntegerField(
+        required=False, min_value=0,
+        help_text="Only users with a higher id; pass the X-Export-Watermark of the previous export"
+    )
+    gzip = serializers.BooleanField(default=False, help_text="Send the file gzip-compressed")
+
+
+class SimilarUsersQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(min_value=1, default=10, help_text="Number of users returned")
+
+    def validate_k(self, k):
+        if k > settings.SIMILAR_USERS_MAX_RESULTS:
+            raise serializers.ValidationError(f"At most {settings.SIMILAR_USERS_MAX_RESULTS}.")
+        return k
@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_profile
+from .models import UserProfile
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
+
+
+# The cached payload also carries the username and email.
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_profile_for_user(sender, instance, **kwargs):
+    invalidate_profile(instance.pk)
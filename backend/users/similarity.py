@@ -0,0 +1,400 @@
+"""
+"People like you": nearest neighbours over profile vectors.
+
+Profiles with age, gender, height, weight and goal set are partitioned by
+(gender, goal). Within a partition each profile is a point (age, height_cm,
+weight_kg), z-scaled with the means and deviations taken at build time, and
+the partition is a KD-tree. The tree is implicit: points are ordered so that
+node i covers a fixed slice whose halves belong to nodes 2i+1 and 2i+2, which
+leaves one split dimension and value to store per inner node.
+
+A build is a directory of .npy files under SIMILARITY_INDEX['PATH'] opened
+with mmap, so all workers on a host share one copy through the page cache.
+Profiles changed since the build (by ``updated_at``) are read every
+REFRESH_INTERVAL seconds into a small per-process delta, scanned by brute
+force, which also hides their stale tree entries. Once the delta passes
+MAX_PENDING rows or the build is REBUILD_INTERVAL seconds old, one worker
+rebuilds in the background (``manage.py rebuild_similarity_index`` does it
+on demand, e.g. from cron or on deploy). Until a host has its first build,
+lookups raise IndexUnavailable (HTTP 503) while one is made in the background.
+"""
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .metrics import GENDERS, GOALS, float_column, iter_columns
+from .models import UserProfile
+
+DEFAULTS = {
+    'PATH': 'similarity_index',
+    'LEAF_SIZE': 64,
+    'REFRESH_INTERVAL': 5,
+    'REBUILD_INTERVAL': 3600,
+    'MAX_PENDING': 50000,
+}
+
+FEATURES = ('age', 'height_cm', 'weight_kg')
+PARTITIONS = len(GENDERS) * len(GOALS)
+ARRAYS = ('points', 'ids', 'dims', 'splits', 'sorted_ids', 'sorted_positions')
+# Seconds between a profile write stamping updated_at and committing.
+COMMIT_GRACE = 5
+# A rebuild lock older than this was left by a process that died.
+STALE_LOCK = 600
+
+
+def get_similarity_settings():
+    return {**DEFAULTS, **getattr(settings, 'SIMILARITY_INDEX', {})}
+
+
+class IndexUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Similar users are not available yet, please retry shortly.'
+    default_code = 'similarity_index_unavailable'
+    wait = 5
+
+
+def partition_keys(gender, goal):
+    """(gender, goal) partition per row, or -1 where either is unset."""
+    gender_idx = np.full(len(gender), -1)
+    for i, code in enumerate(GENDERS):
+        gender_idx[gender == code] = i
+    goal_idx = np.full(len(goal), -1)
+    for i, code in enumerate(GOALS):
+        goal_idx[goal == code] = i
+    return np.where((gender_idx < 0) | (goal_idx < 0), -1, gender_idx * len(GOALS) + goal_idx)
+
+
+def indexable(columns):
+    """``(keys, vectors, user_ids)`` for the rows of metrics-style ``columns`` that can be indexed."""
+    vectors = np.column_stack([columns[name] for name in FEATURES])
+    keys = partition_keys(columns['gender'], columns['goal'])
+    valid = (keys >= 0) & ~np.isnan(vectors).any(axis=1)
+    return keys[valid], vectors[valid], columns['user_id'][valid]
+
+
+def build_tree(points, ids, leaf_size):
+    """
+    Reorder ``points`` and ``ids`` in place into implicit KD-tree order and
+    return ``(depth, dims, splits)``. Each inner node splits its slice at the
+    middle along its widest dimension; leaves hold at most ``leaf_size`` points.
+    """
+    depth = 0
+    while len(points) > leaf_size << depth:
+        depth += 1
+    dims = np.zeros(2 ** depth - 1, dtype=np.int8)
+    splits = np.zeros(2 ** depth - 1, dtype=np.float32)
+    ranges = [(0, len(points))]
+    for level in range(depth):
+        children = []
+        for offset, (start, end) in enumerate(ranges):
+            node, mid = 2 ** level - 1 + offset, (start + end) // 2
+            if end - start >= 2:
+                segment = points[start:end]
+                dim = int(np.argmax(segment.max(axis=0) - segment.min(axis=0)))
+                order = np.argpartition(segment[:, dim], mid - start)
+                points[start:end] = segment[order]
+                ids[start:end] = ids[start:end][order]
+                dims[node], splits[node] = dim, points[mid, dim]
+            children += [(start, mid), (mid, end)]
+        ranges = children
+    return depth, dims, splits
+
+
+def write_build(root, keys, vectors, ids, built_at, leaf_size=DEFAULTS['LEAF_SIZE']):
+    """Write a build of the given rows under ``root`` and make it current; returns its name."""
+    mean = vectors.mean(axis=0) if len(vectors) else np.zeros(len(FEATURES))
+    scale = vectors.std(axis=0) if len(vectors) else np.ones(len(FEATURES))
+    scale[scale == 0] = 1.0
+    order = np.argsort(keys, kind='stable')
+    points = ((vectors[order] - mean) / scale).astype(np.float32)
+    ids = ids[order].astype(np.int64)
+    bounds = np.searchsorted(keys[order], np.arange(PARTITIONS + 1))
+
+    partitions, dims, splits = [], [], []
+    nodes = 0
+    for key in range(PARTITIONS):
+        start, end = int(bounds[key]), int(bounds[key + 1])
+        depth, part_dims, part_splits = build_tree(points[start:end], ids[start:end], leaf_size)
+        partitions.append({'start': start, 'end': end, 'nodes': nodes, 'depth': depth})
+        dims.append(part_dims)
+        splits.append(part_splits)
+        nodes += len(part_dims)
+    sorted_positions = np.argsort(ids).astype(np.int64)
+    arrays = {
+        'points': points, 'ids': ids, 'dims': np.concatenate(dims), 'splits': np.concatenate(splits),
+        'sorted_ids': ids[sorted_positions], 'sorted_positions': sorted_positions,
+    }
+
+    name = f'build-{time.time_ns()}'
+    directory = os.path.join(root, name)
+    os.makedirs(directory + '.tmp')
+    for array_name, array in arrays.items():
+        np.save(os.path.join(directory + '.tmp', array_name + '.npy'), array)
+    with open(os.path.join(directory + '.tmp', 'meta.json'), 'w') as f:
+        json.dump({'built_at': built_at.isoformat(), 'count': len(ids), 'mean': mean.tolist(),
+                   'scale': scale.tolist(), 'partitions': partitions}, f)
+    os.replace(directory + '.tmp', directory)
+    with open(os.path.join(root, 'CURRENT.tmp'), 'w') as f:
+        f.write(name)
+    os.replace(os.path.join(root, 'CURRENT.tmp'), os.path.join(root, 'CURRENT'))
+    prune(root, keep={name})
+    return name
+
+
+def prune(root, keep):
+    # Workers still on an older build keep their mapping after the files are
+    # unlinked (where the OS allows it); the newest previous build is kept anyway.
+    builds = sorted(entry for entry in os.listdir(root) if entry.startswith('build-'))
+    for entry in builds[:-2]:
+        if entry not in keep:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+class Build:
+    """One build of the index, mapped read-only."""
+
+    def __init__(self, root, name):
+        self.name = name
+        directory = os.path.join(root, name)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.built_at = datetime.datetime.fromisoformat(meta['built_at'])
+        self.count = meta['count']
+        self.mean = np.array(meta['mean'])
+        self.scale = np.array(meta['scale'])
+        self.partitions = meta['partitions']
+        for array_name in ARRAYS:
+            # asarray() drops the np.memmap subclass (and its per-operation overhead), not the mapping.
+            setattr(self, array_name, np.asarray(np.load(os.path.join(directory, array_name + '.npy'),
+                                                         mmap_mode='r')))
+
+    def positions(self, user_ids):
+        """Positions in ``points`` of those ``user_ids`` that are in this build."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(self.sorted_ids):
+            return np.empty(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.sorted_ids, user_ids), len(self.sorted_ids) - 1)
+        return self.sorted_positions[found[self.sorted_ids[found] == user_ids]]
+
+    def scaled(self, vector):
+        return ((np.asarray(vector, dtype=float) - self.mean) / self.scale).astype(np.float32)
+
+    def search(self, key, query, k, hidden=None):
+        """
+        ``(squared distances, positions)`` of the ``k`` points of partition
+        ``key`` nearest to the scaled ``query``, skipping positions set in
+        ``hidden``. Depth-first, nearer child first, pruning any node whose
+        splitting plane is further than the current k-th distance.
+        """
+        part = self.partitions[key]
+        first_leaf, nodes = 2 ** part['depth'] - 1, part['nodes']
+        best, best_positions = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        worst = np.inf
+        stack = [(0, part['start'], part['end'], 0.0)]
+        while stack:
+            node, start, end, bound = stack.pop()
+            if bound >= worst or start == end:
+                continue
+            if node >= first_leaf:
+                distances = ((self.points[start:end] - query) ** 2).sum(axis=1)
+                positions = np.arange(start, end)
+                if hidden is not None:
+                    keep = ~hidden[start:end]
+                    distances, positions = distances[keep], positions[keep]
+                best = np.concatenate([best, distances])
+                best_positions = np.concatenate([best_positions, positions])
+                if len(best) >= k:
+                    nearest = np.argpartition(best, k - 1)[:k]
+                    best, best_positions = best[nearest], best_positions[nearest]
+                    worst = float(best.max())
+                continue
+            mid = (start + end) // 2
+            diff = float(query[self.dims[nodes + node]] - self.splits[nodes + node])
+            near, far = (2 * node + 1, start, mid), (2 * node + 2, mid, end)
+            if diff >= 0:
+                near, far = far, near
+            stack.append((*far, max(bound, diff * diff)))
+            stack.append((*near, bound))
+        return best, best_positions
+
+
+class SimilarityIndex:
+    """The current build plus this process's view of the profiles changed since."""
+
+    def __init__(self, path, leaf_size=64, refresh_interval=5, rebuild_interval=3600, max_pending=50000):
+        self.path = path
+        self.leaf_size = leaf_size
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.max_pending = max_pending
+        # (build, hidden positions, {partition: (user_ids, points)}), replaced as a whole.
+        self._state = None
+        self._pending = {}
+        self._since = None
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_similarity_settings()
+        return cls(os.path.join(settings.BASE_DIR, conf['PATH']), leaf_size=conf['LEAF_SIZE'],
+                   refresh_interval=conf['REFRESH_INTERVAL'], rebuild_interval=conf['REBUILD_INTERVAL'],
+                   max_pending=conf['MAX_PENDING'])
+
+    def current_name(self):
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def rebuild(self):
+        """
+        Build from the profile table and publish it. Returns the number of
+        profiles indexed, or None if another process is already rebuilding.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        lock = os.path.join(self.path, 'rebuild.lock')
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.time() - os.path.getmtime(lock) < STALE_LOCK:
+                return None
+            os.remove(lock)
+            return self.rebuild()
+        os.close(fd)
+        try:
+            # Rows changed while they are read are newer than built_at, so workers pick them up as changes.
+            built_at = timezone.now()
+            chunks = [indexable(columns) for columns in iter_columns(UserProfile.objects.all())]
+            if chunks:
+                keys, vectors, ids = (np.concatenate(parts) for parts in zip(*chunks))
+            else:
+                keys, vectors, ids = np.empty(0, dtype=int), np.empty((0, len(FEATURES))), np.empty(0, dtype=np.int64)
+            write_build(self.path, keys, vectors, ids, built_at, self.leaf_size)
+            return len(ids)
+        finally:
+            os.remove(lock)
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._state is not None and now < self._next_refresh:
+            return self._state
+        with self._lock:
+            if self._state is None or now >= self._next_refresh:
+                name = self.current_name()
+                if name is None:
+                    # First use on this host. Requests never build or wait for a build.
+                    self._rebuild_in_background()
+                    raise IndexUnavailable()
+                if self._state is None or self._state[0].name != name:
+                    self._open(Build(self.path, name))
+                self._refresh()
+                self._next_refresh = now + self.refresh_interval
+                build = self._state[0]
+                if (len(self._pending) > self.max_pending
+                        or timezone.now() - build.built_at > datetime.timedelta(seconds=self.rebuild_interval)):
+                    self._rebuild_in_background()
+        return self._state
+
+    def _open(self, build):
+        self._state = (build, None, {})
+        self._pending = {}
+        self._since = build.built_at
+
+    def _refresh(self):
+        since, self._since = self._since, timezone.now()
+        rows = list(
+            UserProfile.objects.filter(updated_at__gte=since - datetime.timedelta(seconds=COMMIT_GRACE))
+            .values_list('user_id', 'gender', 'goal', *FEATURES)
+        )
+        if not rows:
+            return
+        build, hidden, _ = self._state
+        user_ids, gender, goal, *features = zip(*rows)
+        columns = {'user_id': np.array(user_ids, dtype=np.int64), 'gender': np.array(gender, dtype=object),
+                   'goal': np.array(goal, dtype=object)}
+        columns.update((name, float_column(values)) for name, values in zip(FEATURES, features))
+        # Every changed profile hides its tree entry; those still indexable come back through the delta.
+        for user_id in user_ids:
+            self._pending.pop(user_id, None)
+        keys, vectors, ids = indexable(columns)
+        for key, point, user_id in zip(keys, build.scaled(vectors), ids):
+            self._pending[int(user_id)] = (int(key), point)
+        positions = build.positions(user_ids)
+        if len(positions):
+            hidden = np.zeros(build.count, dtype=bool) if hidden is None else hidden.copy()
+            hidden[positions] = True
+        delta = {}
+        for user_id, (key, point) in self._pending.items():
+            delta.setdefault(key, ([], []))
+            delta[key][0].append(user_id)
+            delta[key][1].append(point)
+        self._state = (build, hidden, {
+            key: (np.array(ids, dtype=np.int64), np.array(points, dtype=np.float32).reshape(-1, len(FEATURES)))
+            for key, (ids, points) in delta.items()
+        })
+
+    def _rebuild_in_background(self):
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild()
+            finally:
+                # Connections are per thread; this thread's would never be reused.
+                connections.close_all()
+                self._rebuilding = False
+                self._next_refresh = 0.0
+
+        threading.Thread(target=run, name='similarity-rebuild', daemon=True).start()
+
+    def similar(self, profile, k, exclude=None):
+        """
+        Up to ``k`` ``(user_id, distance)`` pairs nearest to ``profile`` (a
+        dict with FEATURES, gender and goal) within its gender and goal, nearest
+        first, leaving out user ``exclude``. None if the profile is incomplete.
+        """
+        if any(profile.get(name) is None for name in (*FEATURES, 'gender', 'goal')):
+            return None
+        key = int(partition_keys(np.array([profile['gender']], dtype=object),
+                                 np.array([profile['goal']], dtype=object))[0])
+        if key < 0:
+            return None
+        build, hidden, delta = self._sync()
+        query = build.scaled([profile[name] for name in FEATURES])
+        distances, positions = build.search(key, query, k + 1, hidden)
+        delta_ids, delta_points = delta.get(key, (np.empty(0, dtype=np.int64), np.empty((0, len(FEATURES)))))
+        ids = np.concatenate([build.ids[positions], delta_ids])
+        distances = np.concatenate([distances, ((delta_points - query) ** 2).sum(axis=1)])
+        if exclude is not None:
+            keep = ids != exclude
+            ids, distances = ids[keep], distances[keep]
+        nearest = np.argsort(distances, kind='stable')[:k]
+        return [(int(ids[i]), float(np.sqrt(distances[i]))) for i in nearest]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex.from_settings()
+    return _index
@@ -1,3 +1,799 @@
-from django.test import TestCase
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import F
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+from ai_fitness_backend.loadtest import http_request, run_load, write_results
+from ai_fitness_backend.renderers import FastJSONRenderer
+from authapp.authentication import CachedJWTAuthentication
+from authapp.testing import PASSWORD, bearer, bench_settings, inline_hashing, make_user
+from authapp.user_cache import user_cache
+from . import export, history, metrics, similarity
+from .models import Measurement, MeasurementRollup, User, UserProfile
+from .serializers import PROFILE_VALUES, UserProfileSerializer, empty_profile_row, profile_data
+
+
+@bench_settings
+class ProfileQueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.client = APIClient()
+        self.user = make_user('profile')
+        UserProfile.objects.create(user=self.user, age=30, height_cm=180, weight_kg=80)
+        self.headers = bearer(self.user)
+
+    def test_get_cold(self):
+        # JWT user lookup + one joined profile SELECT.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/users/profile/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_warm(self):
+        self.client.get('/api/users/profile/', headers=self.headers)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/profile/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_not_modified(self):
+        etag = self.client.get('/api/users/profile/', headers=self.headers)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/profile/', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_patch(self):
+        with self.assertNumQueries(3):
+            response = self.client.patch('/api/users/profile/', {'age': 31}, format='json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_patch_unchanged(self):
+        with self.assertNumQueries(2):
+            response = self.client.patch('/api/users/profile/', {'age': 30}, format='json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_put(self):
+        # Profile UPDATE plus history: measurements INSERT, rollup SELECT and the new
+        # periods' rollup INSERT, with two savepoints.
+        with self.assertNumQueries(10):
+            response = self.client.put('/api/users/profile/', {
+                'age': 31, 'gender': 'M', 'height_cm': 181, 'weight_kg': 79, 'goal': 'stay_fit',
+            }, format='json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+
+
+class BulkProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.client = APIClient()
+        self.headers = bearer(make_user('bulk-staff', is_staff=True))
+        self.users = [make_user(f'bulk{i}') for i in range(3)]
+        for i, user in enumerate(self.users):
+            UserProfile.objects.create(user=user, age=30 + i, height_cm=170, weight_kg=70 + i)
+
+    def test_list_ids_or_emails(self):
+        first, second, _ = self.users
+        response = self.client.get('/api/users/profiles/', {
+            'ids': f'{first.pk},999999,abc', 'emails': f'{second.email},nobody@example.com',
+        }, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['user_id'] for row in response.data['results']], [first.pk, second.pk])
+        self.assertEqual(response.data['errors'], [
+            {'id': 'abc', 'error': 'Not a valid user id.'},
+            {'id': 999999, 'error': 'Profile not found.'},
+            {'email': 'nobody@example.com', 'error': 'Profile not found.'},
+        ])
+
+    def test_update(self):
+        first, second, third = self.users
+        response = self.client.post('/api/users/profiles/bulk-update/', [
+            {'user_id': first.pk, 'age': 41},
+            {'user_id': str(second.pk), 'weight_kg': 80},
+            {'user_id': third.pk, 'age': 32},
+            {'user_id': 'x', 'age': 1},
+            {'user_id': 999999, 'age': 1},
+            {'user_id': first.pk, 'age': -1},
+        ], format='json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['unchanged']), (2, 1))
+        self.assertEqual([error['index'] for error in response.data['errors']], [3, 4, 5])
+        rows = dict((row[0], row[1:]) for row in UserProfile.objects.values_list('user_id', 'age', 'weight_kg', 'version'))
+        self.assertEqual(rows[first.pk], (41, 70, 2))
+        self.assertEqual(rows[second.pk], (31, 80, 2))
+        self.assertEqual(rows[third.pk], (32, 72, 1))
+
+
+class BulkProfileConcurrencyTests(TransactionTestCase):
+    def test_concurrent_patch_is_kept(self):
+        staff, user = make_user('bulk-staff', is_staff=True), make_user('bulk-target')
+        UserProfile.objects.create(user=user, age=30, height_cm=170, weight_kg=70)
+        inside, snapshot = threading.Event(), metrics.snapshot
+
+        def slow_snapshot(profile):
+            # Runs between reading the profile and writing it back.
+            inside.set()
+            time.sleep(0.3)
+            return snapshot(profile)
+
+        def concurrent_patch():
+            inside.wait(5)
+            try:
+                UserProfile.objects.filter(user=user).update(age=50, version=F('version') + 1)
+            finally:
+                connections.close_all()
+
+        writer = threading.Thread(target=concurrent_patch)
+        writer.start()
+        with mock.patch('users.metrics.snapshot', slow_snapshot):
+            response = APIClient().post('/api/users/profiles/bulk-update/', [{'user_id': user.pk, 'weight_kg': 75}],
+                                        format='json', headers=bearer(staff))
+        writer.join()
+        self.assertEqual(response.data['updated'], 1)
+        # Both writes survive, and both bumped the version.
+        self.assertEqual(UserProfile.objects.values_list('age', 'weight_kg', 'version').get(user=user), (50, 75, 3))
+
+
+@bench_settings
+class MetricsTests(TestCase):
+    PROFILES = [
+        # age, gender, height_cm, weight_kg, goal
+        (30, 'M', 180, 80, 'stay_fit'),
+        (25, 'F', 165, 60, 'lose_weight'),
+        (45, 'O', 170, 90, 'gain_muscle'),
+        (34, 'M', 175, 70, 'stay_fit'),
+        (17, 'F', None, 50, 'stay_fit'),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.client = APIClient()
+        self.users = [make_user(f'metrics{i}') for i in range(len(self.PROFILES))]
+        for user, (age, gender, height_cm, weight_kg, goal) in zip(self.users, self.PROFILES):
+            UserProfile.objects.create(user=user, age=age, gender=gender, height_cm=height_cm,
+                                       weight_kg=weight_kg, goal=goal)
+
+    def test_formulas(self):
+        result = metrics.compute_metrics(*zip(*self.PROFILES))
+        # BMI = kg / m^2; BMR = 10 kg + 6.25 cm - 5 age + sex offset; TDEE = BMR x 1.375 + goal adjustment.
+        np.testing.assert_allclose(result['bmi'][:3], [80 / 1.8 ** 2, 60 / 1.65 ** 2, 90 / 1.7 ** 2])
+        np.testing.assert_allclose(result['bmr'][:3], [1780, 1345.25, 1659.5])
+        np.testing.assert_allclose(result['tdee'][:3], [2447.5, 1349.71875, 2581.8125])
+        self.assertTrue(all(np.isnan(result[name][4]) for name in ('bmi', 'bmr', 'tdee')))
+
+        result = metrics.compute_metrics([30], ['X'], [0], [80], [None])
+        self.assertTrue(all(np.isnan(result[name][0]) for name in ('bmi', 'bmr', 'tdee')))
+
+    def test_bmi_category(self):
+        for bmi, category in ((None, None), (np.nan, None), (18.4, 'underweight'), (18.5, 'normal'),
+                              (24.9, 'normal'), (25, 'overweight'), (30, 'obese')):
+            with self.subTest(bmi=bmi):
+                self.assertEqual(metrics.bmi_category(bmi), category)
+
+    def assertCachedSumsMatchRebuild(self):
+        cached = cache.get(metrics.COHORT_CACHE_KEY)['sums']
+        rebuilt = metrics.build_cohort_sums()
+        for name in ('count', 'bmi', 'bmr', 'tdee'):
+            np.testing.assert_allclose(cached[name], rebuilt[name], atol=1e-6, err_msg=name)
+
+    def test_incremental_update_matches_rebuild(self):
+        metrics.get_cohort_sums()
+        first, second, third, _, incomplete = UserProfile.objects.filter(user__in=self.users).order_by('user_id')
+        changes = []
+        for profile, fields in ((first, {'age': 41, 'goal': 'lose_weight'}), (second, {'gender': None}),
+                                (third, {'weight_kg': 95.5}), (incomplete, {'height_cm': 160})):
+            before = metrics.snapshot(profile)
+            for name, value in fields.items():
+                setattr(profile, name, value)
+            profile.save()
+            changes.append((before, metrics.snapshot(profile)))
+        metrics.apply_profile_changes(changes)
+        self.assertCachedSumsMatchRebuild()
+
+    def test_profile_writes_update_cohorts(self):
+        metrics.get_cohort_sums()
+        self.client.patch('/api/users/profile/', {'age': 52, 'weight_kg': 85}, format='json',
+                          headers=bearer(self.users[0]))
+        self.client.post('/api/users/profiles/bulk-update/', [
+            {'user_id': self.users[1].pk, 'goal': 'gain_muscle'},
+            {'user_id': self.users[4].pk, 'height_cm': 158},
+        ], format='json', headers=bearer(make_user('metrics-staff', is_staff=True)))
+        self.assertCachedSumsMatchRebuild()
+
+    def age_cached_sums(self, seconds):
+        entry = cache.get(metrics.COHORT_CACHE_KEY)
+        entry['built_at'] -= seconds
+        cache.set(metrics.COHORT_CACHE_KEY, entry)
+        return entry['built_at']
+
+    def change_age(self, profile, age):
+        before = metrics.snapshot(profile)
+        profile.age = age
+        profile.save()
+        return before, metrics.snapshot(profile)
+
+    def test_updates_keep_the_build_expiry(self):
+        metrics.get_cohort_sums()
+        built_at = self.age_cached_sums(settings.COHORT_METRICS_TIMEOUT - 60)
+        profile = UserProfile.objects.get(user=self.users[0])
+        metrics.apply_profile_changes([self.change_age(profile, 41)])
+        self.assertEqual(cache.get(metrics.COHORT_CACHE_KEY)['built_at'], built_at)
+        self.assertCachedSumsMatchRebuild()
+
+        # Past the timeout an update drops the sums, and a read rebuilds them.
+        self.age_cached_sums(60)
+        metrics.apply_profile_changes([self.change_age(profile, 42)])
+        self.assertIsNone(cache.get(metrics.COHORT_CACHE_KEY))
+        metrics.get_cohort_sums()
+        self.assertCachedSumsMatchRebuild()
+
+    def test_expired_sums_are_rebuilt_on_read(self):
+        metrics.get_cohort_sums()
+        UserProfile.objects.filter(user=self.users[0]).update(age=70)
+        self.age_cached_sums(settings.COHORT_METRICS_TIMEOUT)
+        metrics.get_cohort_sums()
+        self.assertCachedSumsMatchRebuild()
+
+    def test_concurrent_updates_are_not_lost(self):
+        metrics.get_cohort_sums()
+        profiles = list(UserProfile.objects.filter(user__in=self.users[:4]))
+        changes = [self.change_age(profile, 60 + i) for i, profile in enumerate(profiles)]
+        accumulate = metrics.accumulate
+
+        def slow_accumulate(*args, **kwargs):
+            # Widens the window between reading and writing back the sums.
+            time.sleep(0.005)
+            return accumulate(*args, **kwargs)
+
+        with mock.patch('users.metrics.accumulate', slow_accumulate):
+            threads = [threading.Thread(target=metrics.apply_profile_changes, args=([change],)) for change in changes]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertCachedSumsMatchRebuild()
+
+    def test_update_without_the_lock_drops_the_sums(self):
+        metrics.get_cohort_sums()
+        cache.add(f'{metrics.COHORT_CACHE_KEY}:lock', 1)
+        metrics.apply_profile_changes([self.change_age(UserProfile.objects.get(user=self.users[0]), 41)])
+        self.assertIsNone(cache.get(metrics.COHORT_CACHE_KEY))
+
+    def test_profile_metrics_endpoint(self):
+        response = self.client.get('/api/users/profile/metrics/', headers=bearer(self.users[0]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'bmi': 24.7, 'bmr': 1780.0, 'tdee': 2447.5, 'bmi_category': 'normal'})
+
+        response = self.client.get('/api/users/profile/metrics/', headers=bearer(self.users[4]))
+        self.assertEqual(response.data, {'bmi': None, 'bmr': None, 'tdee': None, 'bmi_category': None})
+        self.assertEqual(self.client.get('/api/users/profile/metrics/').status_code, 401)
+
+    def test_cohort_endpoint(self):
+        response = self.client.get('/api/users/metrics/cohorts/', headers=bearer(self.users[0]))
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get('/api/users/metrics/cohorts/', headers=bearer(make_user('staff', is_staff=True)))
+        self.assertEqual(response.status_code, 200)
+        cohorts = {(row['gender'], row['goal'], row['age_band']): row for row in response.data}
+        self.assertEqual(len(cohorts), 3)
+        self.assertEqual(cohorts['M', 'stay_fit', '30-39'], {
+            'gender': 'M', 'goal': 'stay_fit', 'age_band': '30-39', 'count': 2,
+            'mean_bmi': round((80 / 1.8 ** 2 + 70 / 1.75 ** 2) / 2, 1),
+            'mean_bmr': round((1780 + 1628.75) / 2, 1), 'mean_tdee': round((2447.5 + 1628.75 * 1.375) / 2, 1),
+        })
+        self.assertEqual(cohorts['F', 'lose_weight', '18-29']['mean_tdee'], 1349.7)
+
+
+class ProfileHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = make_user('history')
+        self.start = datetime.date(2025, 1, 1)
+
+    def at(self, days, hour=12):
+        return datetime.datetime.combine(self.start + datetime.timedelta(days=days), datetime.time(hour),
+                                         tzinfo=datetime.timezone.utc)
+
+    def record_year(self):
+        # Two weigh-ins a day for a year, written in a few batches and out of order within each.
+        entries = [(self.user.pk, {'weight_kg': 80 + (day % 17) / 10 - hour / 100}, self.at(day, hour))
+                   for day in range(365) for hour in (20, 7)]
+        for i in range(0, len(entries), 100):
+            history.record_many(entries[i:i + 100])
+
+    def test_rollups_match_history(self):
+        self.record_year()
+        history.record(self.user.pk, {'weight_kg': 70.5, 'height_cm': 181}, at=self.at(40, 23))
+        expected = {}
+        for measurement in Measurement.objects.filter(user=self.user).order_by('recorded_at', 'pk'):
+            history.accumulate(expected, self.user.pk, measurement.metric, measurement.value, measurement.recorded_at)
+        rollups = MeasurementRollup.objects.filter(user=self.user)
+        self.assertEqual(rollups.count(), len(expected))
+        for rollup in rollups:
+            count, total, minimum, maximum, last, last_at = expected[
+                (self.user.pk, rollup.metric, rollup.resolution, rollup.period_start)]
+            self.assertEqual((rollup.count, rollup.minimum, rollup.maximum, rollup.last, rollup.last_at),
+                             (count, minimum, maximum, last, last_at))
+            self.assertAlmostEqual(rollup.total, total)
+
+    def test_series_resolution(self):
+        self.record_year()
+        end = self.start + datetime.timedelta(days=364)
+        for points, resolution, count in ((800, 'raw', 730), (400, 'day', 365), (60, 'week', 53), (20, 'month', 12)):
+            with self.subTest(points=points):
+                chosen, series = history.series(self.user.pk, 'weight_kg', self.start, end, points)
+                self.assertEqual((chosen, len(series)), (resolution, count))
+
+    def test_series_never_exceeds_points(self):
+        self.record_year()
+        end = self.start + datetime.timedelta(days=364)
+        _, months = history.series(self.user.pk, 'weight_kg', self.start, end, 20, resolution='month')
+        for points, resolution, count in ((5, 'auto', 4), (1, 'month', 1), (100, 'day', 92)):
+            with self.subTest(points=points, resolution=resolution):
+                chosen, series = history.series(self.user.pk, 'weight_kg', self.start, end, points, resolution)
+                self.assertEqual((chosen, len(series)), (resolution.replace('auto', 'month'), count))
+        # Five points over twelve months: three months per point.
+        _, series = history.series(self.user.pk, 'weight_kg', self.start, end, 5)
+        self.assertEqual([point['period_start'] for point in series], [months[i]['period_start'] for i in (0, 3, 6, 9)])
+        quarter = months[3:6]
+        self.assertEqual(series[1]['count'], sum(month['count'] for month in quarter))
+        self.assertEqual((series[1]['min'], series[1]['max'], series[1]['last']),
+                         (min(month['min'] for month in quarter), max(month['max'] for month in quarter),
+                          quarter[-1]['last']))
+        self.assertAlmostEqual(series[1]['mean'], sum(month['mean'] * month['count'] for month in quarter)
+                               / series[1]['count'], places=2)
+
+    def test_profile_writes_record_history(self):
+        client = APIClient()
+        for weight in (82.5, 81.0, 81.75):
+            client.patch('/api/users/profile/', {'weight_kg': weight}, format='json', headers=bearer(self.user))
+        client.patch('/api/users/profile/', {'age': 40}, format='json', headers=bearer(self.user))
+        self.assertEqual(list(Measurement.objects.filter(user=self.user).values_list('value', flat=True)),
+                         [82.5, 81.0, 81.75])
+        day = MeasurementRollup.objects.get(user=self.user, metric='weight_kg', resolution='day')
+        self.assertEqual((day.count, day.minimum, day.maximum, day.last), (3, 81.0, 82.5, 81.75))
+
+    def test_endpoint_budget(self):
+        self.record_year()
+        client = APIClient()
+        # JWT user lookup, the raw-measurement probe and the rollup read.
+        with self.assertNumQueries(3):
+            response = client.get('/api/users/profile/history/', {
+                'start': '2025-01-01', 'end': '2025-12-31', 'points': 60,
+            }, headers=bearer(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resolution'], 'week')
+        self.assertEqual(len(response.data['points']), 53)
+        response = client.get('/api/users/profile/history/', {'start': '2025-02-01', 'end': '2025-01-01'},
+                              headers=bearer(self.user))
+        self.assertEqual(response.status_code, 400)
+
+
+class SimilarUsersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index = similarity.SimilarityIndex(tmp.name, leaf_size=4, refresh_interval=0)
+        patcher = mock.patch('users.similarity._index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        rng = np.random.default_rng(7)
+        users = User.objects.bulk_create([User(email=f'similar{i}@example.com', username=f'similar{i}')
+                                          for i in range(300)])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, age=int(rng.integers(18, 70)), gender=rng.choice(['M', 'F']),
+                        height_cm=round(float(rng.normal(170, 9)), 1), weight_kg=round(float(rng.normal(72, 12)), 1),
+                        goal=rng.choice(['lose_weight', 'stay_fit']))
+            for user in users
+        ])
+        self.user = make_user('similar-me')
+        self.profile = UserProfile.objects.create(user=self.user, age=35, gender='F', height_cm=165,
+                                                  weight_kg=60, goal='stay_fit')
+        self.index.rebuild()
+
+    def nearest(self, profile, k):
+        """Brute force over the table, scaled like the current build."""
+        build = self.index._sync()[0]
+        rows = UserProfile.objects.filter(gender=profile.gender, goal=profile.goal).exclude(user=profile.user_id)
+        ids, *features = zip(*rows.values_list('user_id', *similarity.FEATURES))
+        distances = ((build.scaled(np.column_stack(features))
+                      - build.scaled([getattr(profile, name) for name in similarity.FEATURES])) ** 2).sum(axis=1)
+        return [ids[i] for i in np.argsort(distances, kind='stable')[:k]]
+
+    def similar_ids(self, k=5):
+        response = self.client.get('/api/users/profile/similar/', {'k': k}, headers=bearer(self.user))
+        self.assertEqual(response.status_code, 200)
+        return [result['user_id'] for result in response.data['results']]
+
+    def test_matches_brute_force(self):
+        for profile in UserProfile.objects.order_by('user_id')[:40]:
+            with self.subTest(user_id=profile.user_id):
+                found = self.index.similar({name: getattr(profile, name) for name in (*similarity.FEATURES,
+                                            'gender', 'goal')}, 8, exclude=profile.user_id)
+                self.assertEqual([user_id for user_id, _ in found], self.nearest(profile, 8))
+
+    def test_changes_before_rebuild(self):
+        twin = UserProfile.objects.filter(gender='M', goal='lose_weight').first()
+        before = self.similar_ids()
+        UserProfile.objects.filter(pk=twin.pk).update(gender='F', goal='stay_fit', age=35, height_cm=165,
+                                                      weight_kg=60, updated_at=timezone.now())
+        UserProfile.objects.filter(user_id=before[0]).update(goal='gain_muscle', updated_at=timezone.now())
+        newcomer = User.objects.create(email='newcomer@example.com', username='newcomer')
+        UserProfile.objects.create(user=newcomer, age=35, gender='F', height_cm=165.2, weight_kg=60, goal='stay_fit')
+        User.objects.filter(pk=before[1]).update(is_active=False)
+
+        found = self.similar_ids()
+        self.assertEqual(found[:2], [twin.user_id, newcomer.pk])
+        self.assertNotIn(before[0], found)
+        self.assertNotIn(before[1], found)
+        self.assertEqual(found[2:], before[2:5])
+
+    def test_incomplete_profile(self):
+        UserProfile.objects.filter(user=self.user).update(goal=None)
+        response = self.client.get('/api/users/profile/similar/', headers=bearer(self.user))
+        self.assertEqual(response.status_code, 400)
+
+    def test_no_build_yet(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        index = similarity.SimilarityIndex(tmp.name, leaf_size=4, refresh_interval=0)
+        with mock.patch('users.similarity._index', index), \
+                mock.patch.object(index, '_rebuild_in_background') as rebuild_in_background, \
+                mock.patch.object(index, 'rebuild', side_effect=AssertionError("built in the request")):
+            response = self.client.get('/api/users/profile/similar/', headers=bearer(self.user))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '5')
+            rebuild_in_background.assert_called_once_with()
+        # Once the background build (or the command) has published one, lookups work.
+        index.rebuild()
+        with mock.patch('users.similarity._index', index):
+            self.assertEqual(len(self.similar_ids()), 5)
+
+    def test_budget(self):
+        self.index.refresh_interval = 3600
+        self.similar_ids()
+        # Cached JWT user and profile; one query to drop inactive or deleted results.
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.similar_ids(10)), 10)
+
+
+class UserExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.client = APIClient()
+        self.staff = make_user('export-staff', is_staff=True)
+        self.users = [make_user(f'export{i}') for i in range(5)]
+        for i, user in enumerate(self.users[:3]):
+            UserProfile.objects.create(user=user, age=20 + i, weight_kg=70.5 + i, goal='stay_fit')
+
+    def get(self, fmt, **params):
+        response = self.client.get(f'/api/users/export.{fmt}', params, headers=bearer(self.staff))
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_staff_only(self):
+        response = self.client.get('/api/users/export.csv', headers=bearer(self.users[0]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_csv(self):
+        # JWT user lookup, the watermark and one joined SELECT for every row.
+        with self.assertNumQueries(3):
+            response, body = self.get('csv')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([int(row['id']) for row in rows], [self.staff.pk] + [u.pk for u in self.users])
+        self.assertEqual(response['X-Export-Watermark'], str(self.users[-1].pk))
+        self.assertEqual((rows[1]['email'], rows[1]['age'], rows[1]['weight_kg'], rows[1]['is_active']),
+                         ('export0@example.com', '20', '70.5', 'true'))
+        self.assertEqual((rows[-1]['age'], rows[-1]['goal']), ('', ''))
+
+    def test_ndjson_incremental(self):
+        response, _ = self.get('ndjson')
+        later = make_user('export-later')
+        _, body = self.get('ndjson', after_id=response['X-Export-Watermark'])
+        self.assertEqual([json.loads(line)['email'] for line in body.splitlines()], [later.email])
+        User.objects.filter(pk=self.users[0].pk).update(date_joined=later.date_joined)
+        _, body = self.get('ndjson', since=later.date_joined.isoformat())
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], [self.users[0].pk, later.pk])
+
+    def test_gzip_matches_plain(self):
+        _, plain = self.get('ndjson')
+        response, body = self.get('ndjson', gzip='true')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(body), plain)
+
+    def test_streams_in_chunks(self):
+        rows = export.export_rows()
+        pieces = list(export.stream(rows, 'ndjson', chunk_size=2))
+        self.assertEqual([piece.count(b'\n') for piece in pieces], [2, 2, 2])
+        self.assertEqual(len(list(export.stream(rows, 'csv', chunk_size=2))), 4)
+
+    def test_command_watermark_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, marks = os.path.join(tmp, 'users.csv.gz'), os.path.join(tmp, 'watermark')
+            call_command('export_users', path, watermark_file=marks, stderr=io.StringIO())
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 6)
+            later = make_user('export-later')
+            call_command('export_users', path, watermark_file=marks, stderr=io.StringIO())
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual([row['email'] for row in csv.DictReader(f)], [later.email])
+            with open(marks) as f:
+                self.assertEqual(f.read(), str(later.pk))
+
+    def test_command_failure_leaves_no_partial_file(self):
+        def failing_stream(*args, **kwargs):
+            yield b'{"id": 1}\n'
+            raise OSError("disk full")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path, marks = os.path.join(tmp, 'users.ndjson'), os.path.join(tmp, 'watermark')
+            with open(path, 'wb') as f:
+                f.write(b'previous export\n')
+            with mock.patch('users.export.stream', failing_stream), self.assertRaisesMessage(OSError, 'disk full'):
+                call_command('export_users', path, watermark_file=marks, stderr=io.StringIO())
+            self.assertEqual(sorted(os.listdir(tmp)), ['users.ndjson'])
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'previous export\n')
+
+
+@bench_settings
+class BatchRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.client = APIClient()
+        self.user = make_user('batch')
+        UserProfile.objects.create(user=self.user, age=30, gender='F', height_cm=170, weight_kg=65, goal='stay_fit')
+
+    def batch(self, requests, headers=None, **options):
+        response = self.client.post('/api/batch/', {'requests': requests, **options}, format='json', headers=headers)
+        return response, json.loads(response.content) if response.status_code == 200 else response.data
+
+    def test_read_write_read(self):
+        with mock.patch.object(CachedJWTAuthentication, 'get_validated_token',
+                               wraps=CachedJWTAuthentication().get_validated_token) as validate:
+            response, data = self.batch([
+                {'path': '/api/users/profile/'},
+                {'method': 'PATCH', 'path': '/api/users/profile/', 'body': {'age': 31}},
+                {'path': '/api/users/profile/metrics/'},
+                {'path': '/api/users/profile/'},
+            ], headers=bearer(self.user))
+        self.assertEqual(response.status_code, 200)
+        # One token check for the whole batch.
+        self.assertEqual(validate.call_count, 1)
+        first, patched, metrics_, last = data['responses']
+        self.assertEqual([r['status'] for r in data['responses']], [200, 200, 200, 200])
+        self.assertEqual((first['body']['age'], patched['body']['age'], last['body']['age']), (30, 31, 31))
+        self.assertNotEqual(first['headers']['ETag'], last['headers']['ETag'])
+        self.assertIn('bmi', metrics_['body'])
+
+        _, data = self.batch([
+            {'method': 'PATCH', 'path': '/api/users/profile/', 'body': {'age': 40},
+             'headers': {'If-Match': first['headers']['ETag']}},
+        ], headers=bearer(self.user))
+        self.assertEqual(data['responses'][0]['status'], 412)
+
+    def test_anonymous_batch(self):
+        _, data = self.batch([
+            {'method': 'POST', 'path': '/api/users/login/', 'body': {'email': self.user.email, 'password': PASSWORD}},
+            {'path': '/api/users/profile/'},
+        ])
+        login, profile = data['responses']
+        self.assertEqual(login['status'], 200)
+        self.assertIn('access', login['body'])
+        self.assertEqual(profile['status'], 401)
+
+    def test_unbatchable_and_invalid(self):
+        _, data = self.batch([
+            {'path': '/api/batch/'}, {'path': '/api/async/users/profile/'}, {'path': '/admin/'},
+            {'path': '/api/nowhere/'}, {'path': '/api/users/export.csv'},
+        ], headers=bearer(self.user))
+        self.assertEqual([r['status'] for r in data['responses']], [404, 404, 404, 404, 403])
+        response, _ = self.batch([{'path': '/api/users/profile/', 'headers': {'Authorization': 'x'}}])
+        self.assertEqual(response.status_code, 400)
+        with override_settings(BATCH_REQUESTS={'MAX_REQUESTS': 2}):
+            response, data = self.batch([{'path': '/api/users/profile/'}] * 3, headers=bearer(self.user))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('requests', data)
+        response, _ = self.batch([], headers=bearer(self.user))
+        self.assertEqual(response.status_code, 400)
+
+
+@bench_settings
+class BatchParallelTests(TransactionTestCase):
+    def test_parallel_matches_sequential(self):
+        user = make_user('batch-parallel')
+        UserProfile.objects.create(user=user, age=30, gender='M', height_cm=180, weight_kg=80, goal='stay_fit')
+        requests = [
+            {'path': '/api/users/profile/'},
+            {'path': '/api/users/profile/metrics/'},
+            {'path': '/api/users/profile/history/?metric=height_cm'},
+            {'method': 'PATCH', 'path': '/api/users/profile/', 'body': {'weight_kg': 78}},
+            {'path': '/api/users/profile/'},
+            {'path': '/api/users/profile/metrics/'},
+        ]
+        client = APIClient()
+        results = {}
+        for parallel in (False, True):
+            UserProfile.objects.filter(user=user).update(weight_kg=80)
+            cache.clear()
+            response = client.post('/api/batch/', {'requests': requests, 'parallel': parallel}, format='json',
+                                   headers=bearer(user))
+            results[parallel] = [(r['status'], r['body']) for r in json.loads(response.content)['responses']]
+        self.assertEqual(results[True], results[False])
+        self.assertEqual(results[True][4][1]['weight_kg'], 78.0)
+
+
+class ProfileFastPathTests(TestCase):
+    """profile_data() must produce exactly what UserProfileSerializer does, key order included."""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+
+    def assert_equivalent(self, user):
+        profile = UserProfile.objects.select_related('user').filter(user=user).first() or UserProfile(user=user)
+        row = UserProfile.objects.filter(user=user).values_list(*PROFILE_VALUES).first() or empty_profile_row(user)
+        expected = UserProfileSerializer(profile).data
+        actual = profile_data(row)
+        self.assertEqual(list(actual.items()), list(expected.items()))
+        self.assertEqual([type(v) for v in actual.values()], [type(v) for v in expected.values()])
+        self.assertEqual(FastJSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_full_profile(self):
+        user = make_user('fast-full')
+        UserProfile.objects.create(user=user, age=41, gender='O', height_cm=172.25, weight_kg=70, goal='gain_muscle')
+        self.assert_equivalent(user)
+
+    def test_partial_profile(self):
+        user = make_user('fast-partial')
+        UserProfile.objects.create(user=user, height_cm=180)
+        self.assert_equivalent(user)
+
+    def test_no_profile(self):
+        self.assert_equivalent(make_user('fast-none'))
+
+    def test_unicode_username(self):
+        user = make_user('fast-unicode')
+        user.username = 'Zoë \u2028 "ö" \\ 🏋'
+        user.save()
+        UserProfile.objects.create(user=user, age=0, gender='F', goal='lose_weight')
+        self.assert_equivalent(user)
+
+    def test_endpoint_body(self):
+        user = make_user('fast-endpoint')
+        UserProfile.objects.create(user=user, age=30, gender='M', height_cm=180, weight_kg=80.5, goal='stay_fit')
+        expected = JSONRenderer().render(UserProfileSerializer(UserProfile.objects.get(user=user)).data)
+        for path in ('/api/users/profile/', '/api/async/users/profile/'):
+            cache.clear()
+            # Cold (database) and warm (cached) reads.
+            for _ in range(2):
+                response = self.client.get(path, headers=bearer(user))
+                self.assertEqual(response.content, expected, path)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """FastJSONRenderer output must be byte-identical to DRF's JSONRenderer."""
+
+    SAMPLES = [
+        {},
+        [],
+        {'a': None, 'b': True, 'c': False, 'd': [1, -2, 0], 'e': (3, 4), 'f': {'g': {'h': []}}},
+        [0.1, -0.0, 180.0, 1.5e-3, 123456789.123, 2 ** 63 - 1, -2 ** 63],
+        ['', 'plain', 'é ö 🏋', '\x00\x1f\x7f', '"quoted" \\ back/slash', '\u2028 and \u2029', '<script>&'],
+        {'aware': datetime.datetime(2025, 3, 4, 5, 6, 7, 890123, tzinfo=datetime.timezone.utc),
+         'offset': datetime.datetime(2025, 3, 4, 5, 6, 7, tzinfo=datetime.timezone(datetime.timedelta(hours=5, minutes=30))),
+         'naive': datetime.datetime(2025, 3, 4, 5, 6, 7),
+         'date': datetime.date(2025, 3, 4), 'time': datetime.time(5, 6, 7, 8000),
+         'delta': datetime.timedelta(days=1, seconds=2.5)},
+        {'decimal': decimal.Decimal('1.10'), 'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+         'lazy': gettext_lazy('Profile unchanged'), 'safe': mark_safe('<b>x</b>'), 'bytes': b'raw'},
+        {'numpy': np.array([1.5, 2.0]), 'scalar': np.float64(2.25), 'int': np.int64(7), 'set': {1}},
+        ReturnDict([('z', 1), ('a', 2)], serializer=None),
+        OrderedDict([('z', 1), ('a', 2)]),
+        {'refresh': 'eyJhbGciOiJIUzI1NiJ9.eyJ0b2tlbl90eXBlIjoicmVmcmVzaCJ9.sig', 'access': 'eyJ.eyJ.sig'},
+    ]
+
+    def test_matches_json_renderer(self):
+        for data in self.SAMPLES:
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indented_output_falls_back(self):
+        data = {'a': [1, 2]}
+        for media_type, context in (('application/json; indent=4', None), (None, {'indent': 2})):
+            self.assertEqual(FastJSONRenderer().render(data, media_type, context),
+                             JSONRenderer().render(data, media_type, context))
+
+    def test_unsupported_values_fall_back(self):
+        for data in ({1: 'int key'}, [2 ** 70]):
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        aware_time = datetime.time(5, 6, tzinfo=datetime.timezone.utc)
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render({'time': aware_time})
+
+    def test_exponent_floats(self):
+        for data in ([1e16, 1e-7, 1.7976931348623157e308], {'a': -2.5e-10}, 1e22, [np.float64(1e-5)], [-2.5e-5],
+                     {'note': 'ratio:1e5,', 'value': 0.5}):
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats_raise(self):
+        for data in ([float('nan')], {'a': {'b': [1, float('inf')]}, 'c': None}, {'x': np.array([1.0, np.nan])},
+                     {'x': np.float64('-inf')}):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+        # null from None stays on the fast path.
+        self.assertEqual(FastJSONRenderer().render({'a': None, 'b': [1.5, None]}), b'{"a":null,"b":[1.5,null]}')
+
+    def test_none_renders_empty(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+@tag('load')
+@bench_settings
+class ProfileLoadTests(LiveServerTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.requests = settings.LOAD_TEST['REQUESTS']
+        cls.concurrency = settings.LOAD_TEST['CONCURRENCY']
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        write_results('users', cls.results)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        patcher = inline_hashing()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.headers = [bearer(make_user(f'load{i}')) for i in range(self.concurrency * 4)]
+
+    def load(self, name, method, payload=lambda i: None):
+        stats = run_load(
+            lambda i: http_request(self.live_server_url, method, '/api/users/profile/', payload(i),
+                                   self.headers[i % len(self.headers)]),
+            self.requests, self.concurrency,
+        )
+        self.results[name] = stats
+        self.assertEqual(stats['statuses'], {'200': self.requests})
+
+    def test_get(self):
+        self.load('profile_get', 'GET')
+
+    def test_patch(self):
+        self.load('profile_patch', 'PATCH', payload=lambda i: {'age': 20 + i % 50, 'weight_kg': 60 + i % 30})
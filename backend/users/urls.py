@@ -1,6 +1,16 @@
 from django.urls import path
-from .views import UserProfileDetailView 
+from .views import (
+    BulkUserProfileListView, BulkUserProfileUpdateView, CohortMetricsView, ProfileHistoryView, ProfileMetricsView,
+    SimilarUsersView, UserExportView, UserProfileDetailView,
+)
 
 urlpatterns = [
     path('profile/', UserProfileDetailView.as_view(), name='user-profile'),
+    path('profile/metrics/', ProfileMetricsView.as_view(), name='user-profile-metrics'),
+    path('profile/history/', ProfileHistoryView.as_view(), name='user-profile-history'),
+    path('profile/similar/', SimilarUsersView.as_view(), name='user-profile-similar'),
+    path('metrics/cohorts/', CohortMetricsView.as_view(), name='cohort-metrics'),
+    path('profiles/', BulkUserProfileListView.as_view(), name='user-profile-bulk'),
+    path('profiles/bulk-update/', BulkUserProfileUpdateView.as_view(), name='user-profile-bulk-update'),
+    path('export.<str:fmt>', UserExportView.as_view(), name='user-export'),
 ]
@@ -1,7 +1,33 @@
-from rest_framework import generics, permissions
-from drf_yasg.utils import swagger_auto_schema
-from .models import UserProfile
-from .serializers import UserProfileSerializer
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from ai_fitness_backend.apidocs import openapi, swagger_auto_schema
+from ai_fitness_backend.startup import lazy_import
+from ai_fitness_backend.transactions import immediate_atomic
+from . import export, history
+from .cache import cache_profile_payload, compute_etag, etag_matches, get_profile_payload, invalidate_profile
+from .models import User, UserProfile
+from .serializers import (
+    BulkUserProfileSerializer, MeasurementHistoryQuerySerializer, SimilarUsersQuerySerializer, UserExportQuerySerializer,
+    UserProfileSerializer,
+)
+
+# NumPy is only needed once a metrics endpoint or profile write runs.
+metrics = lazy_import('users.metrics')
+similarity = lazy_import('users.similarity')
+
+IF_MATCH_PARAMETER = openapi.Parameter(
+    'If-Match', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+    description="ETag of the profile being edited; the update fails with 412 if it changed since"
+)
+
 
 class UserProfileDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
@@ -9,20 +35,373 @@ class UserProfileDetailView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         # Ensure the user has a profile, or create one
-        profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
+        profile, _ = UserProfile.objects.select_related('user').get_or_create(user=self.request.user)
         return profile
 
     @swagger_auto_schema(
         operation_summary="Retrieve your user profile",
-        responses={200: UserProfileSerializer()}
+        manual_parameters=[
+            openapi.Parameter('If-None-Match', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                              description="ETag from a previous response; returns 304 if unchanged"),
+        ],
+        responses={200: UserProfileSerializer(), 304: openapi.Response("Profile unchanged")}
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        payload = get_profile_payload(request.user)
+        headers = {'ETag': payload['etag'], 'Cache-Control': 'private, no-cache'}
+        if etag_matches(payload['etag'], request.headers.get('If-None-Match')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(payload['data'], headers=headers)
 
     @swagger_auto_schema(
         operation_summary="Update your user profile",
         request_body=UserProfileSerializer,
-        responses={200: UserProfileSerializer()}
+        manual_parameters=[IF_MATCH_PARAMETER],
+        responses={200: UserProfileSerializer(), 412: openapi.Response("Profile changed since If-Match ETag")}
     )
     def put(self, request, *args, **kwargs):
         return super().put(request, *args, **kwargs)
+
+    @swagger_auto_schema(
+        operation_summary="Partially update your user profile",
+        request_body=UserProfileSerializer,
+        manual_parameters=[IF_MATCH_PARAMETER],
+        responses={200: UserProfileSerializer(), 412: openapi.Response("Profile changed since If-Match ETag")}
+    )
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        profile = self.get_object()
+        serializer = self.get_serializer(profile, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+
+        if_match = request.headers.get('If-Match')
+        if if_match and not etag_matches(compute_etag(dict(self.get_serializer(profile).data)), if_match):
+            return self.precondition_failed()
+
+        # Only columns whose value actually changes are written; a no-op update writes nothing.
+        changes = {
+            field: value for field, value in serializer.validated_data.items()
+            if getattr(profile, field) != value
+        }
+        if changes:
+            rows = UserProfile.objects.filter(pk=profile.pk)
+            if if_match:
+                rows = rows.filter(version=profile.version)
+            # QuerySet.update() skips post_save, so the cache is refreshed below.
+            if not history.update_profile(rows, request.user.pk, changes):
+                return self.precondition_failed()
+            before = metrics.snapshot(profile)
+            for field, value in changes.items():
+                setattr(profile, field, value)
+            profile.version += 1
+            metrics.apply_profile_changes([(before, metrics.snapshot(profile))])
+
+        payload = cache_profile_payload(request.user.pk, self.get_serializer(profile).data)
+        return Response(payload['data'], headers={'ETag': payload['etag']})
+
+    def precondition_failed(self):
+        return Response(
+            {'detail': 'Profile was modified by another request. Reload and try again.'},
+            status=status.HTTP_412_PRECONDITION_FAILED,
+        )
+
+
+class ProfileCursorPagination(CursorPagination):
+    ordering = 'user_id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class BulkUserProfileListView(generics.ListAPIView):
+    serializer_class = BulkUserProfileSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = ProfileCursorPagination
+
+    def get_lookup(self):
+        """Split ?ids=1,2,3 / ?emails=a@x.com,b@x.com into valid values and per-item errors."""
+        ids, emails, errors = [], [], []
+        for raw in filter(None, self.request.query_params.get('ids', '').split(',')):
+            try:
+                ids.append(int(raw))
+            except ValueError:
+                errors.append({'id': raw, 'error': 'Not a valid user id.'})
+        emails = [e.strip() for e in self.request.query_params.get('emails', '').split(',') if e.strip()]
+        return ids, emails, errors
+
+    def get_queryset(self):
+        ids, emails, _ = self.get_lookup()
+        queryset = UserProfile.objects.select_related('user')
+        if ids or emails:
+            queryset = queryset.filter(Q(user_id__in=ids) | Q(user__email__in=emails))
+        return queryset
+
+    @swagger_auto_schema(
+        operation_summary="Fetch many user profiles (staff only)",
+        manual_parameters=[
+            openapi.Parameter('ids', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Comma-separated user ids"),
+            openapi.Parameter('emails', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Comma-separated emails"),
+        ],
+        tags=["Profiles (bulk)"]
+    )
+    def get(self, request, *args, **kwargs):
+        ids, emails, errors = self.get_lookup()
+        limit = settings.BULK_PROFILE_MAX_ITEMS
+        if len(ids) + len(emails) > limit:
+            return Response({'detail': f'At most {limit} ids/emails per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(self.get_queryset())
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        # Only the first page reports identifiers that matched no profile.
+        if (ids or emails) and not request.query_params.get(self.paginator.cursor_query_param):
+            found = list(self.get_queryset().values_list('user_id', 'user__email'))
+            found_ids = {user_id for user_id, _ in found}
+            found_emails = {email for _, email in found}
+            errors += [{'id': i, 'error': 'Profile not found.'} for i in ids if i not in found_ids]
+            errors += [{'email': e, 'error': 'Profile not found.'} for e in emails if e not in found_emails]
+        response.data['errors'] = errors
+        return response
+
+
+class BulkUserProfileUpdateView(generics.GenericAPIView):
+    serializer_class = UserProfileSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_summary="Apply partial updates to many profiles in one transaction (staff only)",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'weight_kg': openapi.Schema(type=openapi.TYPE_NUMBER),
+            }, required=['user_id']),
+        ),
+        responses={200: openapi.Response("Summary", examples={"application/json": {
+            "updated": 2, "unchanged": 1, "errors": [{"index": 3, "user_id": 9, "errors": {"user_id": ["Profile not found."]}}]
+        }})},
+        tags=["Profiles (bulk)"]
+    )
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of profile changes.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_PROFILE_MAX_ITEMS:
+            return Response({'detail': f'At most {settings.BULK_PROFILE_MAX_ITEMS} items per request.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        errors, lookups = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append({'index': index, 'user_id': None, 'errors': {'non_field_errors': ['Expected an object.']}})
+                continue
+            user_id = self.parse_user_id(item.get('user_id'))
+            if user_id is None:
+                errors.append({'index': index, 'user_id': item.get('user_id'),
+                               'errors': {'user_id': ['A valid integer is required.']}})
+                continue
+            lookups.append((index, item, user_id))
+
+        changed, before, fields = {}, {}, {}
+        unchanged = 0
+        now = timezone.now()
+        with immediate_atomic():
+            # Rows stay locked until commit, so a concurrent PATCH cannot land between
+            # reading a profile and writing it back (and lose its version bump).
+            profiles = {
+                profile.user_id: profile
+                for profile in UserProfile.objects.select_related('user').select_for_update(of=('self',))
+                .filter(user_id__in={user_id for _, _, user_id in lookups}).order_by('pk')
+            }
+            for index, item, user_id in lookups:
+                profile = profiles.get(user_id)
+                if profile is None:
+                    errors.append({'index': index, 'user_id': user_id, 'errors': {'user_id': ['Profile not found.']}})
+                    continue
+                serializer = self.get_serializer(profile, data=item, partial=True)
+                if not serializer.is_valid():
+                    errors.append({'index': index, 'user_id': user_id, 'errors': serializer.errors})
+                    continue
+                changes = {
+                    field: value for field, value in serializer.validated_data.items()
+                    if getattr(profile, field) != value
+                }
+                if not changes:
+                    unchanged += 1
+                    continue
+                if user_id not in changed:
+                    before[user_id] = metrics.snapshot(profile)
+                    profile.version += 1
+                for field, value in changes.items():
+                    setattr(profile, field, value)
+                profile.updated_at = now
+                changed[user_id] = profile
+                fields.setdefault(user_id, set()).update(changes)
+
+            # One bulk_update per set of changed fields, so no row has columns rewritten that it did not change.
+            groups = defaultdict(list)
+            for user_id, profile in changed.items():
+                groups[tuple(sorted(fields[user_id]))].append(profile)
+            for names, group in groups.items():
+                UserProfile.objects.bulk_update(group, [*names, 'version', 'updated_at'], batch_size=500)
+            history.record_many([
+                (user_id, {field: getattr(profile, field) for field in fields[user_id]}, now)
+                for user_id, profile in changed.items()
+            ])
+
+        if changed:
+            # bulk_update() sends no signals, so cached profiles are dropped here.
+            for user_id in changed:
+                invalidate_profile(user_id)
+            metrics.apply_profile_changes(
+                [(before[user_id], metrics.snapshot(profile)) for user_id, profile in changed.items()])
+
+        return Response({'updated': len(changed), 'unchanged': unchanged, 'errors': errors})
+
+    @staticmethod
+    def parse_user_id(value):
+        """``value`` as a user id (an integer or a string of digits), or None."""
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+        return value if isinstance(value, int) else None
+
+
+class ProfileMetricsView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Body metrics (BMI, BMR, TDEE) computed from your profile",
+        responses={200: openapi.Response("Metrics", examples={"application/json": {
+            "bmi": 22.9, "bmr": 1673.8, "tdee": 1801.5, "bmi_category": "normal"
+        }})},
+        tags=["Metrics"]
+    )
+    def get(self, request):
+        # Reuses the cached profile payload, so a warm request runs no queries.
+        return Response(metrics.profile_metrics(get_profile_payload(request.user)['data']))
+
+
+class CohortMetricsView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_summary="Mean BMI/BMR/TDEE per gender, goal and age band (staff only)",
+        responses={200: openapi.Response("Cohorts", examples={"application/json": [{
+            "gender": "F", "goal": "stay_fit", "age_band": "30-39", "count": 120,
+            "mean_bmi": 23.4, "mean_bmr": 1391.2, "mean_tdee": 1912.9
+        }]})},
+        tags=["Metrics"]
+    )
+    def get(self, request):
+        return Response(metrics.cohort_aggregates())
+
+
+class ProfileHistoryView(generics.GenericAPIView):
+    serializer_class = MeasurementHistoryQuerySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Your weight or height over a date range",
+        operation_description=(
+            "Returns raw measurements when the range holds at most `points` of them, otherwise "
+            "day, week or month rollups (min/max/mean/last), whichever is the finest that fits. "
+            "Consecutive periods are merged when even months do not fit."
+        ),
+        query_serializer=MeasurementHistoryQuerySerializer,
+        responses={200: openapi.Response("Series", examples={"application/json": {
+            "metric": "weight_kg", "resolution": "week", "start": "2025-01-01", "end": "2025-12-31",
+            "points": [{"period_start": "2024-12-30", "count": 3, "min": 81.2, "max": 82.0, "mean": 81.6, "last": 81.2}]
+        }})},
+        tags=["Metrics"]
+    )
+    def get(self, request):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        resolution, points = history.series(request.user.pk, **params)
+        return Response({
+            'metric': params['metric'], 'resolution': resolution,
+            'start': params['start'], 'end': params['end'], 'points': points,
+        })
+
+
+class SimilarUsersView(generics.GenericAPIView):
+    serializer_class = SimilarUsersQuerySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Users with a profile like yours, to share routines with",
+        operation_description=(
+            "Nearest neighbours by age, height and weight among users with your gender and goal. "
+            "`distance` is in standard deviations. Needs a complete profile."
+        ),
+        query_serializer=SimilarUsersQuerySerializer,
+        responses={
+            200: openapi.Response("Similar users", examples={"application/json": {
+                "results": [{"user_id": 42, "username": "sam", "distance": 0.118}]
+            }}),
+            503: openapi.Response("Index not built yet on this host, see Retry-After"),
+        },
+        tags=["Metrics"]
+    )
+    def get(self, request):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        k = query.validated_data['k']
+        profile = get_profile_payload(request.user)['data']
+        # Twice as many as asked, so users deactivated or deleted since the index saw them can be dropped.
+        neighbours = similarity.get_similarity_index().similar(profile, 2 * k, exclude=request.user.pk)
+        if neighbours is None:
+            return Response({'detail': 'Set your age, gender, height, weight and goal first.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        usernames = dict(User.objects.filter(
+            pk__in=[user_id for user_id, _ in neighbours], is_active=True, profile__isnull=False,
+        ).values_list('pk', 'username'))
+        return Response({'results': [
+            {'user_id': user_id, 'username': usernames[user_id], 'distance': round(distance, 3)}
+            for user_id, distance in neighbours if user_id in usernames
+        ][:k]})
+
+
+class UserExportView(generics.GenericAPIView):
+    serializer_class = UserExportQuerySerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_summary="Stream every user with their profile as CSV or NDJSON (staff only)",
+        operation_description=(
+            "`fmt` is `csv` or `ndjson`. Rows are in id order and stop at the id returned in the "
+            "`X-Export-Watermark` header; pass it as `after_id` to export only users added since."
+        ),
+        query_serializer=UserExportQuerySerializer,
+        responses={200: openapi.Response("Export file", headers={
+            'X-Export-Watermark': {'type': openapi.TYPE_INTEGER, 'description': "Highest user id this export covers"},
+        })},
+        tags=["Profiles (bulk)"]
+    )
+    def get(self, request, fmt):
+        if fmt not in export.CONTENT_TYPES:
+            raise Http404
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        # Rows are read after this method returns, once request routing state is
+        # gone; pin the stream to the database the watermark came from.
+        using = router.db_for_read(User)
+        until_id = export.watermark(using)
+        rows = export.export_rows(using, since=params.get('since'), after_id=params.get('after_id'),
+                                  until_id=until_id)
+        filename = f"users-{timezone.now():%Y%m%dT%H%M%SZ}.{fmt}"
+        content_type = export.CONTENT_TYPES[fmt]
+        if params['gzip']:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(export.stream(rows, fmt, compress=params['gzip']), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Export-Watermark'] = str(until_id)
+        return response
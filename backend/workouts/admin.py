@@ -0,0 +1,13 @@
+from django.contrib import admin
+from .models import Workout, WorkoutSet
+
+class WorkoutSetInline(admin.TabularInline):
+    model = WorkoutSet
+    extra = 0
+
+@admin.register(Workout)
+class WorkoutAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'started_at', 'ended_at', 'calories')
+    list_filter = ('kind',)
+    list_select_related = ('user',)
+    inlines = [WorkoutSetInline]
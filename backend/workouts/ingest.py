@@ -0,0 +1,148 @@
+import json
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .models import HeartRateSample, StepSample
+
+DEFAULTS = {
+    'CHUNK_SIZE': 1000,
+    'MAX_LINES': 100000,
+    'MAX_LINE_BYTES': 1024,
+    'MAX_ERRORS': 50,
+}
+
+
+def get_ingest_settings():
+    return {**DEFAULTS, **getattr(settings, 'WORKOUT_INGEST', {})}
+
+
+class SampleError(ValueError):
+    pass
+
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    raise SampleError("'t' must be epoch seconds or an ISO 8601 datetime.")
+
+
+def int_field(obj, name, low, high):
+    value = obj.get(name)
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise SampleError(f"'{name}' must be an integer between {low} and {high}.")
+    return value
+
+
+# type -> (model, value field, bounds)
+SAMPLE_TYPES = {
+    'heart_rate': (HeartRateSample, 'bpm', (20, 250)),
+    'steps': (StepSample, 'steps', (0, 100000)),
+}
+
+
+class SampleIngestor:
+    """
+    Validates NDJSON sample lines one at a time and writes them with
+    bulk_create in fixed-size chunks, so memory use is bounded by
+    CHUNK_SIZE rather than by the request body.
+
+    Each line looks like ``{"type": "heart_rate", "t": 1718000000, "bpm": 72}``
+    or ``{"type": "steps", "t": "2025-06-10T06:00:00Z", "steps": 120}``.
+    Samples already stored for the same user and timestamp, or repeated
+    within the upload, are skipped and counted as duplicates; ``accepted``
+    counts the rows actually inserted. (A concurrent upload of the same
+    samples can still win the insert, which ignore_conflicts absorbs.)
+    """
+
+    def __init__(self, user, chunk_size=None, max_errors=None):
+        conf = get_ingest_settings()
+        self.user_id = user.pk
+        self.chunk_size = chunk_size or conf['CHUNK_SIZE']
+        self.max_errors = conf['MAX_ERRORS'] if max_errors is None else max_errors
+        self.buffers = {model: [] for model, _, _ in SAMPLE_TYPES.values()}
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+
+    def feed(self, line_number, line):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise SampleError("Each line must be a JSON object.")
+            try:
+                model, field, (low, high) = SAMPLE_TYPES[obj.get('type')]
+            except (KeyError, TypeError):
+                raise SampleError(f"'type' must be one of: {', '.join(SAMPLE_TYPES)}.")
+            sample = model(user_id=self.user_id, recorded_at=parse_timestamp(obj.get('t')),
+                           **{field: int_field(obj, field, low, high)})
+        except (ValueError, OverflowError, OSError) as exc:
+            # json.JSONDecodeError is a ValueError; huge epochs raise OverflowError/OSError.
+            self.reject(line_number, exc)
+            return
+        buffer = self.buffers[model]
+        buffer.append(sample)
+        if len(buffer) >= self.chunk_size:
+            self.flush(model)
+
+    def reject(self, line_number, exc):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            message = str(exc) if isinstance(exc, SampleError) else f"Invalid line: {exc}"
+            self.errors.append({'line': line_number, 'error': message})
+
+    def flush(self, model=None):
+        for target in ([model] if model else list(self.buffers)):
+            buffer = self.buffers[target]
+            if not buffer:
+                continue
+            samples = {}
+            for sample in buffer:
+                samples.setdefault(sample.recorded_at, sample)
+            stored = set(target.objects.filter(user_id=self.user_id, recorded_at__in=list(samples))
+                         .values_list('recorded_at', flat=True))
+            new = [sample for recorded_at, sample in samples.items() if recorded_at not in stored]
+            target.objects.bulk_create(new, batch_size=self.chunk_size, ignore_conflicts=True)
+            self.accepted += len(new)
+            self.duplicates += len(buffer) - len(new)
+            buffer.clear()
+
+    def ingest(self, stream, max_lines=None, max_line_bytes=None):
+        """Consume ``stream`` (anything with readline()) and return a summary dict."""
+        conf = get_ingest_settings()
+        max_lines = max_lines or conf['MAX_LINES']
+        max_line_bytes = max_line_bytes or conf['MAX_LINE_BYTES']
+        truncated = False
+        line_number = 0
+        while True:
+            line = stream.readline(max_line_bytes + 1)
+            if not line:
+                break
+            line_number += 1
+            if line_number > max_lines:
+                truncated = True
+                break
+            if len(line) > max_line_bytes and not line.endswith(b'\n'):
+                # Skip the rest of an oversized line without buffering it.
+                while line and not line.endswith(b'\n'):
+                    line = stream.readline(max_line_bytes)
+                self.reject(line_number, SampleError(f"Line longer than {max_line_bytes} bytes."))
+                continue
+            self.feed(line_number, line)
+        self.flush()
+        return {
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'truncated': truncated,
+            'errors': self.errors,
+        }
@@ -0,0 +1,65 @@
+import io
+import json
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from workouts.ingest import SampleIngestor
+
+User = get_user_model()
+
+
+class ParseOnlyIngestor(SampleIngestor):
+    def flush(self, model=None):
+        for target in ([model] if model else list(self.buffers)):
+            self.accepted += len(self.buffers[target])
+            self.buffers[target].clear()
+
+
+class Command(BaseCommand):
+    help = "Measure NDJSON sample ingestion throughput (samples/sec), with and without the database writes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100000)
+        parser.add_argument('--chunk-sizes', default='500,1000,5000',
+                            help="Comma-separated bulk_create chunk sizes to compare.")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark user and its samples.")
+
+    def handle(self, *args, **options):
+        body = self.build_body(options['samples'])
+        self.stdout.write(f"{options['samples']} samples, {len(body) / 1e6:.1f} MB of NDJSON")
+
+        elapsed, summary = self.run(ParseOnlyIngestor, None, body, 1000)
+        self.report('parse + validate only', summary, elapsed)
+
+        for chunk_size in [int(c) for c in options['chunk_sizes'].split(',')]:
+            user = User.objects.create(email=f'bench-ingest-{time.time_ns()}@example.invalid',
+                                       username=f'bench-ingest-{time.time_ns()}')
+            try:
+                elapsed, summary = self.run(SampleIngestor, user, body, chunk_size)
+                self.report(f'bulk_create chunk={chunk_size}', summary, elapsed)
+            finally:
+                if not options['keep']:
+                    user.delete()
+
+    def build_body(self, count):
+        start = 1_700_000_000
+        lines = []
+        for i in range(count):
+            if i % 2:
+                lines.append(json.dumps({'type': 'heart_rate', 't': start + i, 'bpm': random.randint(50, 180)}))
+            else:
+                lines.append(json.dumps({'type': 'steps', 't': start + i, 'steps': random.randint(0, 200)}))
+        return ('\n'.join(lines) + '\n').encode()
+
+    def run(self, ingestor_class, user, body, chunk_size):
+        ingestor = ingestor_class(user or User(pk=0), chunk_size=chunk_size)
+        start = time.perf_counter()
+        summary = ingestor.ingest(io.BytesIO(body), max_lines=10 ** 9)
+        return time.perf_counter() - start, summary
+
+    def report(self, label, summary, elapsed):
+        rate = summary['accepted'] / elapsed if elapsed else float('inf')
+        self.stdout.write(f"{label:<28}{elapsed:>8.2f} s{rate:>12,.0f} samples/s  (rejected {summary['rejected']})")
@@ -0,0 +1,58 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class Workout(models.Model):
+    KIND_CHOICES = (
+        ('strength', 'Strength'),
+        ('cardio', 'Cardio'),
+        ('mobility', 'Mobility'),
+        ('other', 'Other'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workouts')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='other')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+    calories = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'started_at'], name='workout_user_started_idx')]
+
+    def __str__(self):
+        return f"{self.user.username} {self.kind} @ {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class WorkoutSet(models.Model):
+    workout = models.ForeignKey(Workout, on_delete=models.CASCADE, related_name='sets')
+    exercise = models.CharField(max_length=50)
+    reps = models.PositiveSmallIntegerField()
+    weight_kg = models.FloatField(null=True, blank=True)
+    performed_at = models.DateTimeField()
+
+
+# Device samples: one narrow row per reading. The (user, recorded_at) unique
+# constraint doubles as the time-range index and makes re-synced batches idempotent.
+
+class HeartRateSample(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='heart_rate_samples')
+    recorded_at = models.DateTimeField()
+    bpm = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recorded_at'], name='hr_sample_user_time_uniq'),
+        ]
+
+
+class StepSample(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='step_samples')
+    recorded_at = models.DateTimeField()
+    steps = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recorded_at'], name='step_sample_user_time_uniq'),
+        ]
@@ -0,0 +1,28 @@
+from django.db import transaction
+from rest_framework import serializers
+from .models import Workout, WorkoutSet
+
+class WorkoutSetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WorkoutSet
+        fields = ['exercise', 'reps', 'weight_kg', 'performed_at']
+
+
+class WorkoutSerializer(serializers.ModelSerializer):
+    sets = WorkoutSetSerializer(many=True, required=False)
+
+    class Meta:
+        model = Workout
+        fields = ['id', 'kind', 'started_at', 'ended_at', 'calories', 'sets']
+
+    def validate(self, data):
+        if data.get('ended_at') and data['ended_at'] < data['started_at']:
+            raise serializers.ValidationError("ended_at must not be before started_at.")
+        return data
+
+    @transaction.atomic
+    def create(self, validated_data):
+        sets = validated_data.pop('sets', [])
+        workout = Workout.objects.create(**validated_data)
+        WorkoutSet.objects.bulk_create(WorkoutSet(workout=workout, **item) for item in sets)
+        return workout
@@ -0,0 +1,124 @@
+import io
+import json
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .ingest import SampleIngestor
+from .models import HeartRateSample, StepSample
+
+User = get_user_model()
+
+START = 1_700_000_000
+
+
+def ndjson(*lines):
+    return ''.join((line if isinstance(line, str) else json.dumps(line)) + '\n' for line in lines).encode()
+
+
+def heart_rate(offset, bpm=70):
+    return {'type': 'heart_rate', 't': START + offset, 'bpm': bpm}
+
+
+def steps(offset, count=100):
+    return {'type': 'steps', 't': START + offset, 'steps': count}
+
+
+class SampleIngestorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='ingest@example.com', username='ingest')
+
+    def ingest(self, body, **options):
+        return SampleIngestor(self.user, chunk_size=options.pop('chunk_size', None)).ingest(io.BytesIO(body),
+                                                                                            **options)
+
+    def test_chunked_writes(self):
+        body = ndjson(*(heart_rate(i) if i % 2 else steps(i) for i in range(25)))
+        # Per type and chunk of 5: one duplicate lookup and one INSERT (3 + 3 chunks, each with a tail).
+        with self.assertNumQueries(12):
+            summary = self.ingest(body, chunk_size=5)
+        self.assertEqual(summary, {'accepted': 25, 'duplicates': 0, 'rejected': 0, 'truncated': False,
+                                   'errors': []})
+        self.assertEqual(HeartRateSample.objects.filter(user=self.user).count(), 12)
+        self.assertEqual(StepSample.objects.filter(user=self.user).count(), 13)
+        self.assertTrue(HeartRateSample.objects.filter(
+            user=self.user, recorded_at=datetime.fromtimestamp(START + 1, tz=timezone.utc)).exists())
+
+    def test_iso_timestamps(self):
+        summary = self.ingest(ndjson({'type': 'steps', 't': '2025-06-10T06:00:00+02:00', 'steps': 5},
+                                     {'type': 'steps', 't': '2025-06-10T04:00:00', 'steps': 6}))
+        # Naive times are UTC, so the second line is the same instant as the first.
+        self.assertEqual((summary['accepted'], summary['duplicates']), (1, 1))
+        self.assertEqual(StepSample.objects.get().recorded_at, datetime(2025, 6, 10, 4, tzinfo=timezone.utc))
+
+    def test_malformed_lines(self):
+        summary = self.ingest(ndjson(
+            heart_rate(0),
+            'not json',
+            '[1, 2]',
+            {'type': 'sleep', 't': START},
+            {'type': 'heart_rate', 't': 'yesterday', 'bpm': 70},
+            {'type': 'heart_rate', 't': START + 1, 'bpm': 400},
+            {'type': 'steps', 't': START + 2, 'steps': True},
+            {'type': 'steps', 't': 10 ** 20, 'steps': 1},
+            '',
+            steps(3),
+        ))
+        self.assertEqual((summary['accepted'], summary['rejected']), (2, 7))
+        self.assertEqual([error['line'] for error in summary['errors']], [2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(summary['errors'][1]['error'], "Each line must be a JSON object.")
+        self.assertEqual(summary['errors'][4]['error'], "'bpm' must be an integer between 20 and 250.")
+        self.assertTrue(summary['errors'][0]['error'].startswith("Invalid line:"))
+
+    def test_error_list_is_capped(self):
+        summary = SampleIngestor(self.user, max_errors=2).ingest(io.BytesIO(ndjson(*['{'] * 5)))
+        self.assertEqual((summary['rejected'], len(summary['errors'])), (5, 2))
+
+    def test_line_length_limit(self):
+        long_line = json.dumps({**heart_rate(1), 'note': 'x' * 300})
+        summary = self.ingest(ndjson(heart_rate(0), long_line, heart_rate(2)), max_line_bytes=100)
+        self.assertEqual((summary['accepted'], summary['rejected']), (2, 1))
+        self.assertEqual(summary['errors'], [{'line': 2, 'error': "Line longer than 100 bytes."}])
+
+    def test_line_limit(self):
+        summary = self.ingest(ndjson(*(steps(i) for i in range(5))), max_lines=3)
+        self.assertEqual((summary['accepted'], summary['truncated']), (3, True))
+        self.assertEqual(StepSample.objects.count(), 3)
+
+    def test_duplicates(self):
+        self.ingest(ndjson(heart_rate(0, bpm=60), heart_rate(1)))
+        summary = self.ingest(ndjson(heart_rate(0, bpm=90), heart_rate(1), heart_rate(2), heart_rate(2, bpm=99),
+                                     steps(0)), chunk_size=2)
+        self.assertEqual((summary['accepted'], summary['duplicates']), (2, 3))
+        self.assertEqual(sorted(HeartRateSample.objects.values_list('bpm', flat=True)), [60, 70, 70])
+
+    def test_other_users_samples_are_not_duplicates(self):
+        other = User.objects.create(email='other@example.com', username='other')
+        SampleIngestor(other).ingest(io.BytesIO(ndjson(steps(0))))
+        self.assertEqual(self.ingest(ndjson(steps(0)))['accepted'], 1)
+
+
+@override_settings(WORKOUT_INGEST={'MAX_LINE_BYTES': 200})
+class SampleIngestViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='view@example.com', username='view')
+        self.client = APIClient()
+
+    def post(self, body, **headers):
+        return self.client.generic('POST', '/api/workouts/samples/ingest/', body,
+                                   content_type='application/x-ndjson', headers=headers)
+
+    def test_ingest(self):
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        response = self.post(ndjson(heart_rate(0), steps(0), 'x' * 500, heart_rate(0)), **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'accepted': 2, 'duplicates': 1, 'rejected': 1, 'truncated': False,
+            'errors': [{'line': 3, 'error': "Line longer than 200 bytes."}],
+        })
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.post(ndjson(steps(0))).status_code, 401)
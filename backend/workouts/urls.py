@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import SampleIngestView, WorkoutListCreateView
+
+urlpatterns = [
+    path('', WorkoutListCreateView.as_view(), name='workout-list'),
+    path('samples/ingest/', SampleIngestView.as_view(), name='workout-sample-ingest'),
+]
@@ -0,0 +1,72 @@
+from rest_framework import generics, permissions, status
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import BaseParser
+from rest_framework.response import Response
+from ai_fitness_backend.apidocs import openapi, swagger_auto_schema
+from .ingest import SampleIngestor
+from .models import Workout
+from .serializers import WorkoutSerializer
+
+
+class NDJSONParser(BaseParser):
+    """
+    Declares the NDJSON media type for content negotiation and the API docs.
+    The ingestion view reads ``request.stream`` itself, line by line.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+class WorkoutPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 500
+
+
+class WorkoutListCreateView(generics.ListCreateAPIView):
+    serializer_class = WorkoutSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = WorkoutPagination
+
+    def get_queryset(self):
+        return Workout.objects.filter(user=self.request.user).prefetch_related('sets').order_by('-started_at')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @swagger_auto_schema(operation_summary="List your workouts", tags=["Workouts"])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    @swagger_auto_schema(operation_summary="Record a workout with its sets", tags=["Workouts"])
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+class SampleIngestView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [NDJSONParser]
+
+    @swagger_auto_schema(
+        operation_summary="Stream heart-rate and step samples as NDJSON",
+        operation_description=(
+            "One JSON object per line, e.g.\n\n"
+            '`{"type": "heart_rate", "t": 1718000000, "bpm": 72}`\n\n'
+            '`{"type": "steps", "t": "2025-06-10T06:00:00Z", "steps": 120}`\n\n'
+            "Lines are validated and stored as they arrive; samples already stored for "
+            "the same timestamp are skipped and counted under `duplicates`."
+        ),
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format='binary'),
+        responses={200: openapi.Response("Ingestion summary", examples={"application/json": {
+            "accepted": 4990, "duplicates": 10, "rejected": 1, "truncated": False,
+            "errors": [{"line": 17, "error": "'bpm' must be an integer between 20 and 250."}]
+        }})},
+        tags=["Workouts"]
+    )
+    def post(self, request):
+        stream = request.stream
+        if stream is None:
+            return Response({'detail': 'Empty request body.'}, status=status.HTTP_400_BAD_REQUEST)
+        summary = SampleIngestor(request.user).ingest(stream)
+        return Response(summary)